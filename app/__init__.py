@@ -1,20 +1,31 @@
 """Initialization of flask plugins and logging """
 
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from app.config import Config
+from app.utils import log_handlers
+from app.utils.database import TunedSQLAlchemy
+import atexit
 import logging
+import queue
 
-db = SQLAlchemy()
+db = TunedSQLAlchemy()
 
 migrate = Migrate()
 
 jwt = JWTManager()
 
 FORMAT = '%(asctime)s %(message)s'
-fh = logging.FileHandler('app.log')
+fh = log_handlers.BatchFileHandler('app.log')
 fh.setFormatter(logging.Formatter(FORMAT))
+# Request threads only put records to bounded queue, file is written by listener thread
+log_queue = queue.Queue(Config.LOG_QUEUE_SIZE)
+queue_handler = log_handlers.BoundedQueueHandler(log_queue, block=Config.LOG_OVERFLOW == 'block',
+                                                 timeout=Config.LOG_BLOCK_TIMEOUT)
+log_listener = log_handlers.BatchQueueListener(log_queue, fh, batch_size=Config.LOG_BATCH_SIZE)
+log_listener.start()
+atexit.register(log_listener.stop)
 # logging.basicConfig(format=FORMAT)
 logger = logging.getLogger(__name__)
-logger.addHandler(fh)
+logger.addHandler(queue_handler)
 logger.setLevel(logging.INFO)
@@ -0,0 +1,430 @@
+"""Async serving mode: ASGI application with the same routes, json schemas and responses as
+flask blueprint in app/routes/routes.py, built on async daos from app/dao/dao_async.py.
+Waiting clients are coroutines instead of threads, so one process holds thousands of idle connections.
+Flask application is used only for config and JWT tokens. Parsing of query params and bulk bodies,
+pagination links and conditional requests are shared with flask routes (pagination, filters, bulk,
+versions, statements.parse_search_args), handlers here only read request and await daos.
+Features of flask application that async mode does not have are listed in [server] of config.ini."""
+
+import asyncio
+import json
+import re
+import sqlite3
+from functools import partial
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlencode
+from flask_jwt_extended import create_access_token, decode_token
+from jwt import ExpiredSignatureError, InvalidTokenError
+from sqlalchemy.engine.url import make_url
+from app.dao import dao_async, statements
+from app.main import create_app
+from app.config import Config
+from app.utils import schemas, log, versions, json_provider, filters, compression, validation, jwt_cache, changes, \
+    bulk
+from app.utils.hashing import HashingUnavailable
+from app.utils.pagination import parse_page_args, next_page_args
+
+JSON_TYPE = 'application/json'
+JSON_ENCODER = json_provider.encoder(Config.JSON_ENCODER)
+validators = {name: validation.compiled(schema, Config.JSON_VALIDATOR) for name, schema in (
+    ('animal', schemas.animal_schema), ('animal_update', schemas.animal_update_schema),
+    ('species', schemas.species_schema), ('register', schemas.register_schema))}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body, headers=None):
+        super().__init__(body)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class Request:
+    """Request of ASGI http scope, body is read on demand."""
+
+    def __init__(self, scope, receive):
+        query_string = scope['query_string'].decode('latin-1')
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {key: values[0] for key, values in parse_qs(query_string, keep_blank_values=True).items()}
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        self.url = '{}://{}{}{}'.format(scope.get('scheme', 'http'), self.headers.get('host', 'localhost'),
+                                        self.path, '?' + query_string if query_string else '')
+        self._receive = receive
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self._receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def json(self, schema=None):
+        """
+        Function that decodes json body and validates it by schema.
+        :raise HTTPError: 400 if body is not json or is not valid.
+        """
+        try:
+            data = json.loads(await self.body())
+        except ValueError:
+            raise HTTPError(400, {'message': 'Failed to decode JSON object'})
+        if schema:
+            error = validators[schema].first_error(data)
+            if error:
+                raise HTTPError(400, {'message': error.message})
+        return data
+
+    async def disconnected(self):
+        """Function that waits until client closes connection."""
+        while (await self._receive())['type'] != 'http.disconnect':
+            pass
+
+
+class Response:
+    """Response with json (or text) body or with async iterator of chunks."""
+
+    def __init__(self, body=None, status=200, headers=None, content_type=JSON_TYPE, chunks=None):
+        if isinstance(body, str):
+            self.body = body.encode()
+        else:
+            self.body = b'' if body is None else \
+                (json.dumps(body, separators=(',', ':'), sort_keys=True, cls=JSON_ENCODER) + '\n').encode()
+        self.status = status
+        self.headers = dict(headers or {})
+        self.headers['Content-Type'] = content_type
+        self.chunks = chunks
+
+    def compress(self, request):
+        """Function that compresses body like compression.init_app does for flask responses."""
+        if self.chunks is not None or not 200 <= self.status < 300 or self.status == 204 \
+                or not compression.compressible(self.headers['Content-Type']):
+            return
+        self.headers['Vary'] = 'Accept-Encoding'
+        encoding, self.body = compression.compressor.compress(
+            self.body, request.headers.get('accept-encoding'), cache='ETag' in self.headers)
+        if encoding is not None:
+            self.headers['Content-Encoding'] = encoding
+
+    async def send(self, send):
+        if self.chunks is None:
+            self.headers['Content-Length'] = str(len(self.body))
+        await send({'type': 'http.response.start', 'status': self.status,
+                    'headers': [(key.lower().encode('latin-1'), str(value).encode('latin-1'))
+                                for key, value in self.headers.items()]})
+        if self.chunks is None:
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        async for chunk in self.chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def stream_json_array(records):
+    """Async version of pagination.stream_json_array, yields one encoded record per chunk."""
+    separator = '['
+    async for record in records:
+        yield separator + json.dumps(record, separators=(',', ':'), sort_keys=True, cls=JSON_ENCODER)
+        separator = ','
+    yield '[]\n' if separator == '[' else ']\n'
+
+
+class AsyncApp:
+    """
+    ASGI application. Database connections are opened on lifespan startup or on first request.
+    :param flask_app: Application from create_app(), its config sets database, pagination and JWT.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.database = dao_async.AsyncDatabase()
+        self.dao = SimpleNamespace(**dao_async.create_daos(self.database, self.config))
+        self._opened = None
+        self.routes = []
+        for pattern, methods, handler in (
+                (r'/', ['GET'], self.index),
+                (r'/login', ['GET'], self.login),
+                (r'/animals', ['GET', 'POST'], self.animals),
+                (r'/animals/bulk', ['POST'], self.animals_bulk),
+                (r'/animals/(?P<animal_id>\d+)', ['GET', 'PUT', 'DELETE'], self.animal_inform),
+                (r'/search', ['GET'], self.search),
+                (r'/changes', ['GET'], self.change_feed),
+                (r'/centers', ['GET'], self.centers_list),
+                (r'/centers/(?P<center_id>\d+)', ['GET'], self.center_inform),
+                (r'/species', ['GET', 'POST'], self.species),
+                (r'/species/(?P<species_id>\d+)', ['GET'], self.specie_inform),
+                (r'/register', ['POST'], self.registration)):
+            self.routes.append((re.compile(pattern + '$'), methods, handler))
+
+    async def open(self):
+        # requests that come while connections are being opened wait for the same future
+        if self._opened is None:
+            self._opened = asyncio.ensure_future(self.database.open(
+                make_url(self.config['SQLALCHEMY_DATABASE_URI']).database, self.config['SQLITE_PRAGMAS'],
+                self.config['ASYNC_READ_POOL_SIZE']))
+        await self._opened
+
+    async def close(self):
+        if self._opened is not None:
+            self._opened = None
+            await self.database.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await self.open()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        await self.open()
+        request = Request(scope, receive)
+        try:
+            response = await self.dispatch(request)
+        except HTTPError as error:
+            response = Response(error.body, error.status, error.headers)
+        except HashingUnavailable as error:
+            response = Response({'message': str(error)}, 503, {'Retry-After': '1'})
+        response.headers['DAO_TYPE'] = 'ASYNC'
+        if self.config['COMPRESSION_ENABLED']:
+            response.compress(request)
+        await response.send(send)
+
+    async def dispatch(self, request):
+        for pattern, methods, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                if request.method not in methods:
+                    return Response({'message': 'Method Not Allowed'}, 405, {'Allow': ', '.join(methods)})
+                return await handler(request, **{key: int(value) for key, value in match.groupdict().items()})
+        return Response({'message': 'Not Found'}, 404)
+
+    def identity(self, request):
+        """
+        Function that verifies JWT token from Authorization header, like jwt_required_for_change,
+        with the same cache of verified tokens.
+        :return: Identity of token.
+        :raise HTTPError: 401 if there is no token or it expired, 422 if it is invalid.
+        """
+        header = request.headers.get('authorization', '')
+        if not header.startswith('Bearer '):
+            raise HTTPError(401, {'msg': 'Missing Authorization Header'})
+        signer = self.config['JWT_SECRET_KEY'], self.config['JWT_ALGORITHM']
+        cached = jwt_cache.cache.get(header, signer) if jwt_cache.cache.max_entries else None
+        if cached is not None:
+            return cached[0][self.config['JWT_IDENTITY_CLAIM']]
+        try:
+            with self.flask_app.app_context():
+                decoded = decode_token(header[len('Bearer '):])
+        except ExpiredSignatureError:
+            raise HTTPError(401, {'msg': 'Token has expired'})
+        except InvalidTokenError as error:
+            raise HTTPError(422, {'msg': str(error)})
+        jwt_cache.cache.set(header, signer, decoded)
+        return decoded[self.config['JWT_IDENTITY_CLAIM']]
+
+    def access_token(self, identity):
+        with self.flask_app.app_context():
+            return create_access_token(identity=identity)
+
+    async def not_modified(self, request, keys):
+        """
+        Function that makes GET request conditional like etag_for_get decorator.
+        :return: Tuple (response 304 or None, headers with ETag and Last-Modified for response 200).
+        """
+        etag, modified = versions.from_rows(
+            keys, await self.database.fetchall(versions.CURRENT, {'names': versions.names(keys)}))
+        headers = versions.headers(etag, modified)
+        matched = versions.not_modified(etag, modified, request.headers.get('if-none-match'),
+                                        request.headers.get('if-modified-since'))
+        return (Response(None, 304, headers) if matched else None), headers
+
+    async def paginate(self, request, fetch, cursor=None):
+        try:
+            limit, after = parse_page_args(request.args, self.config['MAX_PAGE_LIMIT'])
+        except ValueError as error:
+            return Response({'message': str(error)}, 400)
+        records = await fetch(limit=limit, after=after)
+        response = Response(records)
+        args = next_page_args(request.args, records, limit, cursor)
+        if args is not None:
+            response.headers['Link'] = '<{}?{}>; rel="next"'.format(request.path, urlencode(args))
+        return response
+
+    async def listing(self, request, keys, fetch, iterate):
+        response, headers = await self.not_modified(request, keys)
+        if response:
+            return response
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            response = Response(chunks=stream_json_array(iterate()))
+        else:
+            response = await self.paginate(request, fetch)
+        if response.status == 200:
+            response.headers.update(headers)
+        return response
+
+    async def entity(self, request, keys, fetch):
+        response, headers = await self.not_modified(request, keys)
+        if response:
+            return response
+        result = await fetch()
+        if not result:
+            return Response({'message': 'Not found'}, 404)
+        return Response(result, headers=headers)
+
+    async def index(self, request):
+        return Response('Hello', content_type='text/html; charset=utf-8')
+
+    async def login(self, request):
+        user_login, user_password = request.args.get('login'), request.args.get('password')
+        if not user_login or not user_password:
+            return Response({'message': 'Login and password are required'}, 400)
+        user = await self.dao.AnimalCenterDAO.get_center_by_login(user_login)
+        if not user:
+            return Response({'message': 'No user with such login'}, 400)
+        if not await self.dao.AnimalCenterDAO.check_password(user_password, user['id']):
+            return Response({'message': 'Incorrect password'}, 400)
+        await self.dao.AccessRequestDAO.create_access_request(user['id'])
+        return Response({'access_token': self.access_token(user['id'])})
+
+    async def animals(self, request):
+        if request.method == 'GET':
+            try:
+                animal_filters, sort = filters.parse_animal_filters(request.args)
+            except ValueError as error:
+                return Response({'message': str(error)}, 400)
+            return await self.listing(request, ['animal'],
+                                      partial(self.dao.AnimalDAO.get_animals, filters=animal_filters, sort=sort),
+                                      partial(self.dao.AnimalDAO.iter_animals, animal_filters, sort))
+        user_id = self.identity(request)
+        data = await request.json('animal')
+        if not await self.dao.SpeciesDAO.get_species_inform(data['species_id']):
+            return Response({'message': 'No such species'}, 400)
+        animal = await self.dao.AnimalDAO.add_animal(data, user_id)
+        log.log_request(request.method, request.url, user_id, 'animal', animal['id'])
+        return Response(animal, 201)
+
+    async def animals_bulk(self, request):
+        user_id = self.identity(request)
+        try:
+            items = bulk.parse_items((await request.body()).decode(),
+                                     request.headers.get('content-type', '').split(';')[0].strip(),
+                                     self.config['BULK_MAX_ITEMS'])
+        except ValueError as error:
+            return Response({'message': str(error)}, 400)
+        results, valid = bulk.validate(items, validators['animal'])
+        created = await self.dao.AnimalDAO.add_animals([items[index] for index in valid], user_id) if valid else []
+        body, status, ids = bulk.report(results, valid, created)
+        if ids:
+            log.log_request(request.method, request.url, user_id, 'animal', '{}..{}'.format(ids[0], ids[-1]))
+        return Response(body, status)
+
+    async def animal_inform(self, request, animal_id):
+        if request.method == 'GET':
+            return await self.entity(request, [('animal', animal_id)],
+                                     lambda: self.dao.AnimalDAO.get_animal(animal_id))
+        user_id = self.identity(request)
+        data = await request.json('animal_update') if request.method == 'PUT' else None
+        animal = await self.dao.AnimalDAO.get_animal(animal_id)
+        if not animal:
+            return Response({'message': 'Not found'}, 404)
+        if request.method == 'DELETE':
+            await self.dao.AnimalDAO.delete_animal(animal_id)
+            log.log_request(request.method, request.url, user_id, 'animal', animal_id)
+            return Response({'id': animal_id})
+        animal = dict(animal, **data)
+        await self.dao.AnimalDAO.update_animal(animal)
+        log.log_request(request.method, request.url, user_id, 'animal', animal_id)
+        return Response(animal)
+
+    async def search(self, request):
+        try:
+            query, after_kind = statements.parse_search_args(request.args)
+        except ValueError as error:
+            return Response({'message': str(error)}, 400)
+        response, headers = await self.not_modified(request, ['animal', 'species'])
+        if response:
+            return response
+        response = await self.paginate(
+            request, partial(self.dao.SearchDAO.search, query, after_kind=after_kind),
+            cursor=lambda record: {'after': record['id'], 'after_kind': record['kind']})
+        if response.status == 200:
+            response.headers.update(headers)
+        return response
+
+    async def change_feed(self, request):
+        if not changes.feed.subscribe(self.config['CHANGES_ASYNC_MAX_SUBSCRIBERS']):
+            return Response({'message': 'Too many subscribers'}, 503, {'Retry-After': '1'})
+        sequence, chunks = changes.resume(request.headers.get('last-event-id'))
+        return Response(chunks=self.stream_changes(request, sequence, chunks), content_type='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    async def stream_changes(self, request, sequence, chunks):
+        """Async version of changes.stream, it ends when client disconnects."""
+        disconnected = asyncio.ensure_future(request.disconnected())
+        try:
+            yield ''.join(chunks)
+            while True:
+                waiting = asyncio.ensure_future(changes.feed.wait_async(sequence, self.config['CHANGES_HEARTBEAT']))
+                await asyncio.wait((waiting, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return
+                sequence, chunk = changes.next_chunk(sequence, waiting.result())
+                yield chunk
+        finally:
+            disconnected.cancel()
+            changes.feed.unsubscribe()
+
+    async def centers_list(self, request):
+        return await self.listing(request, ['animal_center'], self.dao.AnimalCenterDAO.get_centers,
+                                  self.dao.AnimalCenterDAO.iter_centers)
+
+    async def center_inform(self, request, center_id):
+        return await self.entity(request, [('animal_center', center_id)],
+                                 lambda: self.dao.AnimalCenterDAO.get_center_inform(center_id))
+
+    async def species(self, request):
+        if request.method == 'GET':
+            response, headers = await self.not_modified(request, ['species', 'animal'])
+            return response or Response(await self.dao.SpeciesDAO.get_species(), headers=headers)
+        user_id = self.identity(request)
+        data = await request.json('species')
+        if await self.dao.SpeciesDAO.get_species_by_name(data['name']):
+            return Response({'message': 'This species is already taken'}, 400)
+        try:
+            species = await self.dao.SpeciesDAO.add_species(data)
+        except sqlite3.IntegrityError:
+            return Response({'message': 'This species is already taken'}, 400)
+        log.log_request(request.method, request.url, user_id, 'species', species['id'])
+        return Response(species, 201)
+
+    async def specie_inform(self, request, species_id):
+        return await self.entity(request, [('species', species_id)],
+                                 lambda: self.dao.SpeciesDAO.get_species_inform(species_id))
+
+    async def registration(self, request):
+        data = await request.json('register')
+        if await self.dao.AnimalCenterDAO.get_center_by_login(data['login']):
+            return Response({'message': 'This user name is already taken'}, 400)
+        try:
+            center_id = await self.dao.AnimalCenterDAO.add_center(data)
+        except sqlite3.IntegrityError:
+            return Response({'message': 'This user name is already taken'}, 400)
+        await self.dao.AccessRequestDAO.create_access_request(center_id)
+        log.log_request(request.method, request.url, center_id, 'animal_center', center_id)
+        return Response({'message': 'Successfully registered', 'access_token': self.access_token(center_id)}, 201)
+
+
+def create_asgi_app(flask_app=None):
+    """
+    Factory method for building ASGI application.
+    :param flask_app: Application whose config is used, create_app() by default.
+    """
+    return AsyncApp(flask_app or create_app())
@@ -0,0 +1,15 @@
+"""Commands that are registered in flask cli"""
+
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.dao import species_stats
+
+
+@click.command('rebuild-species-stats')
+@with_appcontext
+def rebuild_species_stats():
+    """Count stats of animals of every species from scratch."""
+    with db.engine.begin() as connection:
+        species_stats.rebuild(connection)
+    click.echo('Species stats are rebuilt')
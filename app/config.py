@@ -1,10 +1,15 @@
 """Application config as object"""
 import configparser
-from os import path
+from os import path, environ
+
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout', 'temp_store')
 
 basepath = path.dirname(path.dirname(path.abspath(__file__)))
 parser = configparser.ConfigParser()
 parser.read(path.join(basepath, 'config.ini'))
+# values from ini file in APP_CONFIG environment variable override config.ini
+if environ.get('APP_CONFIG'):
+    parser.read(environ['APP_CONFIG'])
 
 
 class Config:
@@ -14,4 +19,63 @@ class Config:
         parser['database']['db_file'])
     SQLALCHEMY_TRACK_MODIFICATIONS = parser['database']['track_modifications']
     JWT_SECRET_KEY = parser['security']['jwt_secret']
-    DAO_SQL = parser.getboolean('database', 'dao_sql', fallback=False)
+    JWT_CACHE_SIZE = parser.getint('security', 'jwt_cache_size', fallback=0)
+    SQLITE_PRAGMAS = {name: parser['database'][name] for name in SQLITE_PRAGMAS if name in parser['database']}
+    SQLITE_POOL_SIZE = parser.getint('database', 'pool_size', fallback=0)
+    SQLITE_MAX_OVERFLOW = parser.getint('database', 'max_overflow', fallback=10)
+    SQLITE_READ_ONLY_POOL = parser.getboolean('database', 'read_only_pool', fallback=False)
+    SQLITE_READ_POOL_SIZE = parser.getint('database', 'read_pool_size', fallback=5)
+    SQLITE_READ_MAX_OVERFLOW = parser.getint('database', 'read_max_overflow', fallback=10)
+    # older config.ini has dao_sql = True/False instead of dao
+    DAO_BACKEND = parser.get('database', 'dao', fallback='sql' if parser.getboolean(
+        'database', 'dao_sql', fallback=False) else 'orm')
+    MAX_PAGE_LIMIT = parser.getint('pagination', 'max_limit', fallback=1000)
+    STREAM_BATCH = parser.getint('pagination', 'stream_batch', fallback=1000)
+    CACHE_ENABLED = parser.getboolean('cache', 'enabled', fallback=False)
+    CACHE_MAX_ENTRIES = parser.getint('cache', 'max_entries', fallback=1024)
+    CACHE_TTL = parser.getfloat('cache', 'ttl', fallback=30)
+    CACHE_MAX_ITEMS = parser.getint('cache', 'max_items', fallback=10000)
+    BULK_BATCH_SIZE = parser.getint('bulk', 'batch_size', fallback=500)
+    BULK_MAX_ITEMS = parser.getint('bulk', 'max_items', fallback=10000)
+    LOG_QUEUE_SIZE = parser.getint('log', 'queue_size', fallback=10000)
+    LOG_OVERFLOW = parser.get('log', 'overflow', fallback='block')
+    LOG_BLOCK_TIMEOUT = parser.getfloat('log', 'block_timeout', fallback=1.0)
+    LOG_BATCH_SIZE = parser.getint('log', 'batch_size', fallback=100)
+    ACCESS_REQUEST_WRITE_BEHIND = parser.getboolean('access_request', 'write_behind', fallback=False)
+    ACCESS_REQUEST_FLUSH_RECORDS = parser.getint('access_request', 'flush_records', fallback=100)
+    ACCESS_REQUEST_FLUSH_INTERVAL_MS = parser.getint('access_request', 'flush_interval_ms', fallback=500)
+    ACCESS_REQUEST_MAX_BUFFER = parser.getint('access_request', 'max_buffer', fallback=10000)
+    HASHING_MODE = parser.get('hashing', 'mode', fallback='inline')
+    HASHING_WORKERS = parser.getint('hashing', 'workers', fallback=0)
+    HASHING_MAX_PENDING = parser.getint('hashing', 'max_pending', fallback=64)
+    HASHING_TIMEOUT = parser.getfloat('hashing', 'timeout', fallback=5)
+    METRICS_ENABLED = parser.getboolean('metrics', 'enabled', fallback=False)
+    METRICS_SERVER_TIMING = parser.getboolean('metrics', 'server_timing', fallback=False)
+    SEARCH_SNIPPET_TOKENS = parser.getint('search', 'snippet_tokens', fallback=10)
+    SEARCH_HIGHLIGHT = (parser.get('search', 'highlight_start', fallback='<mark>'),
+                        parser.get('search', 'highlight_end', fallback='</mark>'))
+    COMPRESSION_ENABLED = parser.getboolean('compression', 'enabled', fallback=False)
+    COMPRESSION_MIN_SIZE = parser.getint('compression', 'min_size', fallback=1024)
+    COMPRESSION_GZIP_LEVEL = parser.getint('compression', 'gzip_level', fallback=6)
+    COMPRESSION_BROTLI_QUALITY = parser.getint('compression', 'brotli_quality', fallback=4)
+    COMPRESSION_CPU_BUDGET = parser.getfloat('compression', 'cpu_budget', fallback=0)
+    COMPRESSION_CACHE_MAX_ENTRIES = parser.getint('compression', 'cache_max_entries', fallback=256)
+    COMPRESSION_CACHE_MAX_BYTES = parser.getint('compression', 'cache_max_bytes', fallback=33554432)
+    JSON_ENCODER = parser.get('json', 'encoder', fallback='stdlib')
+    JSON_VALIDATOR = parser.get('json', 'validator', fallback='jsonschema')
+    ADMISSION_ENABLED = parser.getboolean('admission', 'enabled', fallback=False)
+    ADMISSION_READ_LIMIT = parser.getint('admission', 'read_limit', fallback=0)
+    ADMISSION_WRITE_LIMIT = parser.getint('admission', 'write_limit', fallback=0)
+    ADMISSION_AUTH_LIMIT = parser.getint('admission', 'auth_limit', fallback=0)
+    ADMISSION_QUEUE_TIMEOUT = parser.getfloat('admission', 'queue_timeout', fallback=0.5)
+    ADMISSION_MAX_QUEUE = parser.getint('admission', 'max_queue', fallback=0)
+    ADMISSION_RETRY_AFTER = parser.getint('admission', 'retry_after', fallback=1)
+    ADMISSION_RATE = parser.getfloat('admission', 'rate', fallback=0)
+    ADMISSION_BURST = parser.getint('admission', 'burst', fallback=10)
+    ADMISSION_MAX_CLIENTS = parser.getint('admission', 'max_clients', fallback=10000)
+    CHANGES_BACKLOG = parser.getint('changes', 'backlog', fallback=1000)
+    CHANGES_MAX_SUBSCRIBERS = parser.getint('changes', 'max_subscribers', fallback=8)
+    CHANGES_ASYNC_MAX_SUBSCRIBERS = parser.getint('changes', 'async_max_subscribers', fallback=100)
+    CHANGES_HEARTBEAT = parser.getfloat('changes', 'heartbeat', fallback=15)
+    SERVER_MODE = parser.get('server', 'mode', fallback='wsgi')
+    ASYNC_READ_POOL_SIZE = parser.getint('server', 'async_read_pool_size', fallback=10)
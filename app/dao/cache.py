@@ -0,0 +1,239 @@
+"""Read-through cache that wraps dao objects and is invalidated by their write methods.
+Writes of other processes are not seen by invalidation, so results read by conditional GET are kept
+with version of table_version that ETag of request was built from (etag_for_get puts it to g.version)
+and are loaded again when database has newer version, so body always matches its ETag."""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from flask import g, has_app_context
+from app.utils.filters import DEFAULT_SORT
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded cache that forgets least recently used entries and entries older than ttl.
+    Keys are tuples, first element of key is namespace, so all pages of one listing
+    can be dropped at once.
+    :param max_entries: How many results can be stored at once.
+    :param ttl: How many seconds result stays valid.
+    :param max_items: Lists longer than this are not stored, so one huge listing can't take all memory.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30, max_items=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._namespaces = {}
+        self._lock = Lock()
+        # changes with every invalidation, so result loaded before concurrent write is not stored after it
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version=None):
+        """
+        Function that returns stored value.
+        :param version: Version of database that value must have been loaded at, None accepts any value.
+        :return: Value or _MISSING if there is no fresh value for key.
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, stored_version, value = entry
+                if expires > monotonic() and (version is None or version == stored_version):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key, value, generation=None, version=None):
+        """
+        Function that stores value.
+        :param generation: Value of generation before value was loaded, value is not stored when
+                           something was invalidated since then.
+        :param version: Version of database that value was loaded at, see get.
+        """
+        if _count_items(value) > self.max_items:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (monotonic() + self.ttl, version, value)
+            self._namespaces.setdefault(key[0], set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+
+    def invalidate_namespace(self, *namespaces):
+        with self._lock:
+            self.generation += 1
+            for namespace in namespaces:
+                for key in list(self._namespaces.get(namespace, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._namespaces.clear()
+
+    def stats(self):
+        """
+        Function that reports how well cache works.
+        :return: Dictionary with count of hits, misses, evictions, current size and hit rate.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._data),
+                    'hit_rate': self.hits / requests if requests else 0.0}
+
+    def _remove(self, key):
+        del self._data[key]
+        keys = self._namespaces.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+
+
+def _count_items(value):
+    """Count records in dao result: list of records or tuple with record and list of records."""
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_count_items(item) for item in value)
+    return 1
+
+
+def current_version():
+    """:return: ETag version of conditional GET request that is being served, or None."""
+    return g.get('version') if has_app_context() else None
+
+
+class CachedDao:
+    """
+    Base class for dao wrappers. Methods that are not cached are passed to wrapped dao,
+    that is why wrappers do not inherit dao interfaces.
+    Cached values are shared between requests, so they must not be modified by caller.
+    """
+
+    def __init__(self, dao, cache):
+        self._dao = dao
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._dao, name)
+
+    def _cached(self, key, load, *args, keep_none=True, **kwargs):
+        """
+        Function that returns cached result or loads and stores it.
+        :param keep_none: False for lookups whose None answer can become stale by write of other process,
+                          e.g. free login, such answers are always loaded.
+        """
+        version = current_version()
+        value = self._cache.get(key, version)
+        if value is _MISSING:
+            generation = self._cache.generation
+            value = load(*args, **kwargs)
+            if value is not None or keep_none:
+                self._cache.set(key, value, generation, version)
+        return value
+
+    def _invalidate_animal(self, *animals):
+        """Drop everything that shows animals: listings, centers and species of given animals."""
+        self._cache.invalidate_namespace('animals', 'species_list')
+        keys = []
+        for animal in animals:
+            if animal:
+                keys.extend([('animal', animal['id']),
+                             ('center', animal['center_id']),
+                             ('species', animal['species_id'])])
+        self._cache.invalidate(*keys)
+
+
+class CachedAnimalDAO(CachedDao):
+
+    def get_animals(self, limit=None, after=None, filters=None, sort=DEFAULT_SORT):
+        return self._cached(('animals', limit, after, tuple(sorted((filters or {}).items())), sort),
+                            self._dao.get_animals, limit=limit, after=after, filters=filters, sort=sort)
+
+    def get_animal(self, animal_id):
+        return self._cached(('animal', animal_id), self._dao.get_animal, animal_id)
+
+    def add_animal(self, data, userid):
+        animal = self._dao.add_animal(data, userid)
+        self._invalidate_animal(dict(animal, center_id=userid, species_id=data['species_id']))
+        return animal
+
+    def add_animals(self, animals, userid):
+        animals = list(animals)
+        created = self._dao.add_animals(animals, userid)
+        self._invalidate_animal(*[dict(animal, center_id=userid, species_id=data['species_id'])
+                                  for data, animal in zip(animals, created) if animal])
+        return created
+
+    def delete_animal(self, animal_id):
+        old = self._dao.get_animal(animal_id)
+        self._dao.delete_animal(animal_id)
+        self._invalidate_animal(old)
+
+    def update_animal(self, animal):
+        old = self._dao.get_animal(animal['id'])
+        self._dao.update_animal(animal)
+        self._invalidate_animal(old, dict(old or {}, **animal))
+
+
+class CachedAnimalCenterDAO(CachedDao):
+
+    def get_centers(self, limit=None, after=None):
+        return self._cached(('centers', limit, after), self._dao.get_centers, limit=limit, after=after)
+
+    def get_center_inform(self, id):
+        return self._cached(('center', id), self._dao.get_center_inform, id)
+
+    def get_center_by_login(self, user_login):
+        return self._cached(('center_login', user_login), self._dao.get_center_by_login, user_login,
+                            keep_none=False)
+
+    def add_center(self, data):
+        login = data['login']
+        center_id = self._dao.add_center(data)
+        self._cache.invalidate_namespace('centers')
+        self._cache.invalidate(('center_login', login), ('center', center_id))
+        return center_id
+
+
+class CachedSpeciesDAO(CachedDao):
+
+    def get_species(self):
+        return self._cached(('species_list',), self._dao.get_species)
+
+    def get_species_inform(self, id):
+        return self._cached(('species', id), self._dao.get_species_inform, id)
+
+    def get_species_by_name(self, name):
+        return self._cached(('species_name', name), self._dao.get_species_by_name, name,
+                            keep_none=False)
+
+    def add_species(self, data):
+        species = self._dao.add_species(data)
+        self._cache.invalidate_namespace('species_list')
+        self._cache.invalidate(('species_name', data['name']), ('species', species['id']))
+        return species
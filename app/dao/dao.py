@@ -1,14 +1,98 @@
-from app.config import Config
-from . import dao_sql
-from . import dao_orm_models
-
-if Config.DAO_SQL:
-    SpeciesDAO = dao_sql.SpeciesDaoSql()
-    AnimalCenterDAO = dao_sql.AnimalCentersDaoSql()
-    AccessRequestDAO = dao_sql.AccessRequestDaoSql()
-    AnimalDAO = dao_sql.AnimalsDaoSql()
-else:
-    SpeciesDAO = dao_orm_models.SpeciesORM()
-    AnimalCenterDAO = dao_orm_models.AnimalCenterORM()
-    AccessRequestDAO = dao_orm_models.AccessRequestORM()
-    AnimalDAO = dao_orm_models.AnimalORM()
+"""Registry of dao backends. Backend is registered by name with path of function that builds its daos,
+module of backend is imported on first use, so process imports only backend it works with.
+create_app() builds daos of backend from DAO_BACKEND of its config, every application has its own daos
+(services of app.utils are shared by process), routes reach daos of current application through module
+attributes SpeciesDAO, AnimalCenterDAO, AccessRequestDAO, AnimalDAO and SearchDAO."""
+
+from importlib import import_module
+from types import SimpleNamespace
+from flask import current_app, has_app_context
+from . import cache as dao_cache
+from . import write_behind
+from . import interfaces
+
+DAO_NAMES = ('SpeciesDAO', 'AnimalCenterDAO', 'AccessRequestDAO', 'AnimalDAO', 'SearchDAO')
+
+_backends = {}
+
+
+def register(name, factory):
+    """
+    Function that adds dao backend, backend with the same name is replaced.
+    :param factory: Function without arguments that returns dictionary with dao for every name from DAO_NAMES,
+                    or its path 'module:function', then module is imported when backend is used first time.
+    """
+    _backends[name] = factory
+
+
+def backends():
+    """:return: Sorted names of registered backends."""
+    return sorted(_backends)
+
+
+def load(name):
+    """
+    Function that finds function that builds daos of backend and imports its module if needed.
+    :raise ValueError: If there is no backend with such name.
+    """
+    if name not in _backends:
+        raise ValueError('Unknown dao backend {!r}, choose one of: {}'.format(name, ', '.join(backends())))
+    factory = _backends[name]
+    if isinstance(factory, str):
+        module, _, function = factory.partition(':')
+        factory = _backends[name] = getattr(import_module(module), function)
+    return factory
+
+
+def init_app(app):
+    """
+    Function that builds daos of application: daos of backend DAO_BACKEND, access requests are
+    written behind when ACCESS_REQUEST_WRITE_BEHIND is set and reads are cached when CACHE_ENABLED is set.
+    :return: Namespace with daos and cache (None when cache is off), it is also app.extensions['dao'].
+    """
+    config = app.config
+    daos = load(config['DAO_BACKEND'])()
+    if config['ACCESS_REQUEST_WRITE_BEHIND']:
+        daos['AccessRequestDAO'] = write_behind.WriteBehindAccessRequestDAO(
+            daos['AccessRequestDAO'], config['ACCESS_REQUEST_FLUSH_RECORDS'],
+            config['ACCESS_REQUEST_FLUSH_INTERVAL_MS'] / 1000, config['ACCESS_REQUEST_MAX_BUFFER'])
+        daos['AccessRequestDAO'].init_app(app)
+    cache = None
+    if config['CACHE_ENABLED']:
+        cache = dao_cache.LRUCache(config['CACHE_MAX_ENTRIES'], config['CACHE_TTL'], config['CACHE_MAX_ITEMS'])
+        daos['SpeciesDAO'] = dao_cache.CachedSpeciesDAO(daos['SpeciesDAO'], cache)
+        daos['AnimalCenterDAO'] = dao_cache.CachedAnimalCenterDAO(daos['AnimalCenterDAO'], cache)
+        daos['AnimalDAO'] = dao_cache.CachedAnimalDAO(daos['AnimalDAO'], cache)
+    app.extensions['dao'] = SimpleNamespace(cache=cache, **daos)
+    return app.extensions['dao']
+
+
+class DaoProxy:
+    """
+    Dao of current application. Outside of application context proxy shows methods of dao interface,
+    so it can be inspected and patched. Attributes set on proxy itself (e.g. mocks in tests) hide
+    attributes of dao of application.
+    :param interface: Interface that daos of this name implement.
+    """
+
+    def __init__(self, name, interface):
+        self._name = name
+        self._interface = interface
+
+    def __getattr__(self, attribute):
+        if not has_app_context():
+            return getattr(self._interface, attribute)
+        return getattr(getattr(current_app.extensions['dao'], self._name), attribute)
+
+    def __repr__(self):
+        return '<DaoProxy {}>'.format(self._name)
+
+
+SpeciesDAO = DaoProxy('SpeciesDAO', interfaces.IDaoSpecies)
+AnimalCenterDAO = DaoProxy('AnimalCenterDAO', interfaces.IDaoAnimalCenter)
+AccessRequestDAO = DaoProxy('AccessRequestDAO', interfaces.IDaoAccessRequest)
+AnimalDAO = DaoProxy('AnimalDAO', interfaces.IDaoAnimal)
+SearchDAO = DaoProxy('SearchDAO', interfaces.IDaoSearch)
+
+register('sql', 'app.dao.dao_sql:create_daos')
+register('orm', 'app.dao.dao_orm_models:create_daos')
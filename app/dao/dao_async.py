@@ -0,0 +1,357 @@
+"""Classes to retrieve data from database via SQL with asyncio driver aiosqlite (optional dependency).
+They implement the same interfaces as sql and orm daos, but every method is coroutine and
+iter_* methods are async generators, so they are used by async serving mode (app/asgi.py).
+Every async application has its own AsyncDatabase and daos built by create_daos from its config."""
+
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from app.dao import dao_sql, statements, species_stats
+from app.dao.interfaces import IDaoAnimalCenter, IDaoAccessRequest, IDaoSpecies, IDaoAnimal, IDaoSearch
+from app.utils import changes
+from app.utils.filters import DEFAULT_SORT, sort_segments
+from app.utils.hashing import hasher
+
+try:
+    import aiosqlite
+except ImportError:  # pragma: no cover - async mode is optional
+    aiosqlite = None
+
+FETCH_BATCH = 1000
+
+
+class AsyncDatabase:
+    """
+    Connections of async daos. Writes go through one connection and wait for each other on lock,
+    so they never fail with "database is locked" inside process. Reads take one of read_pool_size
+    read-only connections. Every connection runs in its own thread of aiosqlite, so count of threads
+    does not depend on count of clients.
+    """
+
+    def __init__(self):
+        self._writer = None
+        self._readers = None
+        self._write_lock = None
+
+    async def open(self, database, pragmas, read_pool_size=5):
+        """
+        Function that opens connections.
+        :param database: Absolute path of database file.
+        :param pragmas: Dictionary of pragmas that are set on every connection.
+        """
+        if aiosqlite is None:
+            raise RuntimeError('Async mode requires aiosqlite, install it with "pip install aiosqlite"')
+        self._write_lock = asyncio.Lock()
+        self._writer = await self._connect(database, pragmas)
+        self._readers = asyncio.Queue()
+        for _ in range(read_pool_size):
+            self._readers.put_nowait(await self._connect(database, pragmas, read_only=True))
+
+    async def close(self):
+        if self._writer is None:
+            return
+        await self._writer.close()
+        while not self._readers.empty():
+            await self._readers.get_nowait().close()
+        self._writer = self._readers = None
+
+    @staticmethod
+    async def _connect(database, pragmas, read_only=False):
+        if read_only:
+            connection = await aiosqlite.connect('file:{}?mode=ro'.format(database), uri=True, isolation_level=None)
+        else:
+            connection = await aiosqlite.connect(database, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        for name, value in pragmas.items():
+            if not (read_only and name == 'journal_mode'):
+                await connection.execute('PRAGMA {} = {}'.format(name, value))
+        return connection
+
+    @asynccontextmanager
+    async def reader(self):
+        connection = await self._readers.get()
+        try:
+            yield connection
+        finally:
+            self._readers.put_nowait(connection)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Context manager that gives writing connection inside BEGIN IMMEDIATE ... COMMIT."""
+        async with self._write_lock:
+            await self._writer.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.execute('ROLLBACK')
+                raise
+            await self._writer.execute('COMMIT')
+
+    async def fetchall(self, statement, parameters=None):
+        async with self.reader() as connection:
+            return await connection.execute_fetchall(str(statement), parameters or {})
+
+    async def fetchone(self, statement, parameters=None):
+        async with self.reader() as connection:
+            async with connection.execute(str(statement), parameters or {}) as cursor:
+                return await cursor.fetchone()
+
+    async def iterate(self, statement, parameters=None):
+        """Async generator that reads rows by FETCH_BATCH, read connection is held until it is closed."""
+        async with self.reader() as connection:
+            async with connection.execute(str(statement), parameters or {}) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(FETCH_BATCH)
+                    if not rows:
+                        return
+                    for row in rows:
+                        yield row
+
+
+async def animals_added(connection, animals):
+    """Async version of species_stats.animals_added for writing connection."""
+    stats = species_stats.aggregate(animals)
+    if stats:
+        await connection.executemany(str(statements.STATS_CREATE),
+                                     [{'species_id': entry['species_id']} for entry in stats])
+        await connection.executemany(str(statements.STATS_ADD), stats)
+
+
+async def animal_removed(connection, animal):
+    """Async version of species_stats.animal_removed for writing connection."""
+    await connection.execute(str(statements.STATS_REMOVE),
+                             {'species_id': animal['species_id'], 'price': animal['price']})
+
+
+class AsyncDao:
+    """
+    Base of async daos.
+    :param database: Opened AsyncDatabase that dao reads and writes.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+
+class AnimalsDaoAsync(AsyncDao, IDaoAnimal):
+    """:param batch_size: How many animals are sent to database in one executemany by add_animals."""
+
+    def __init__(self, database, batch_size=500):
+        super().__init__(database)
+        self.batch_size = batch_size
+
+    def deserialize(self, record=None, long=False):
+        return dao_sql.AnimalsDaoSql().deserialize(record, long)
+
+    async def get_animals(self, limit=None, after=None, filters=None, sort=DEFAULT_SORT):
+        filters = filters or {}
+        after_value = None
+        if after is not None and sort[0] != 'id':
+            record = await self.database.fetchone(statements.animal_sort_value(sort[0]), {'id': after})
+            after_value = record[0] if record else None
+        animals = []
+        for segment, bounded in sort_segments(sort, after, after_value, filters):
+            records = await self.database.fetchall(
+                statements.animals_select(tuple(sorted(filters)), sort[0], sort[1], segment, bounded),
+                dict(filters, after=after, after_value=after_value,
+                     limit=-1 if limit is None else limit - len(animals)))
+            animals.extend(self.deserialize(record) for record in records)
+            if limit is not None and len(animals) >= limit:
+                break
+        return animals
+
+    async def iter_animals(self, filters=None, sort=DEFAULT_SORT):
+        for segment, _ in sort_segments(sort, filters=filters or ()):
+            async for record in self.database.iterate(
+                    statements.animals_select(tuple(sorted(filters or {})), sort[0], sort[1], segment),
+                    dict(filters or {}, limit=-1)):
+                yield self.deserialize(record)
+
+    async def get_animal(self, animal_id):
+        record = await self.database.fetchone(statements.ANIMAL_BY_ID, {'id': animal_id})
+        return self.deserialize(record, long=True) if record else None
+
+    async def _locked_animal(self, connection, animal_id):
+        """:return: Animal read in writing transaction, or None if there is no such animal."""
+        async with connection.execute(str(statements.ANIMAL_BY_ID), {'id': animal_id}) as cursor:
+            record = await cursor.fetchone()
+        return self.deserialize(record, long=True) if record else None
+
+    async def delete_animal(self, animal_id):
+        async with self.database.transaction() as connection:
+            old = await self._locked_animal(connection, animal_id)
+            if old is None:
+                return
+            cursor = await connection.execute(str(statements.ANIMAL_DELETE), {'id': animal_id})
+            if cursor.rowcount != 1:
+                return
+            await animal_removed(connection, old)
+        changes.animals_changed('delete', old)
+
+    async def update_animal(self, animal):
+        values = {key: value for key, value in animal.items() if key != 'id'}
+        statement = statements.animal_update(tuple(sorted(values)))
+        async with self.database.transaction() as connection:
+            old = await self._locked_animal(connection, animal['id'])
+            if old is None:
+                return
+            cursor = await connection.execute(str(statement), dict(values, id=animal['id']))
+            if cursor.rowcount != 1:
+                return
+            new = dict(old, **values)
+            if old['species_id'] != new['species_id'] or old['price'] != new['price']:
+                await animal_removed(connection, old)
+                await animals_added(connection, [new])
+        changes.animals_changed('update', new)
+
+    async def add_animal(self, data, userid):
+        values = {'name': data['name'], 'center_id': userid,
+                  'description': data['description'], 'price': data['price'],
+                  'species_id': data['species_id'], 'age': data['age']}
+        async with self.database.transaction() as connection:
+            cursor = await connection.execute(str(statements.ANIMAL_INSERT), values)
+            animal_id = cursor.lastrowid
+            await animals_added(connection, [values])
+        changes.animals_changed('create', dict(values, id=animal_id))
+        return {'id': animal_id, 'name': values['name']}
+
+    async def add_animals(self, animals, userid):
+        animals = list(animals)
+        results = [None] * len(animals)
+        requested = list({animal['species_id'] for animal in animals})
+        async with self.database.transaction() as connection:
+            species_ids = {row['id'] for row in await connection.execute_fetchall(
+                'SELECT id FROM species WHERE id IN ({});'.format(', '.join('?' * len(requested))), requested)}
+            rows = [(index, {'name': data['name'], 'center_id': userid,
+                             'description': data['description'], 'price': data['price'],
+                             'species_id': data['species_id'], 'age': data['age']})
+                    for index, data in enumerate(animals) if data['species_id'] in species_ids]
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                await connection.executemany(str(statements.ANIMAL_INSERT), [values for _, values in batch])
+                # sqlite gives consecutive ids to rows inserted while transaction holds write lock
+                async with connection.execute(str(statements.ANIMAL_MAX_ID)) as cursor:
+                    first_id = (await cursor.fetchone())[0] - len(batch) + 1
+                for offset, (index, values) in enumerate(batch):
+                    results[index] = dict(values, id=first_id + offset)
+            await animals_added(connection, [values for _, values in rows])
+        changes.animals_changed('create', *results, batch=True)
+        return [{'id': animal['id'], 'name': animal['name']} if animal else None for animal in results]
+
+
+class AnimalCentersDaoAsync(AsyncDao, IDaoAnimalCenter):
+    def deserialize(self, record=None, long=False):
+        return dao_sql.AnimalCentersDaoSql().deserialize(record, long)
+
+    async def get_centers(self, limit=None, after=None):
+        records = await self.database.fetchall(
+            statements.CENTERS_PAGE, {'after': after or 0, 'limit': -1 if limit is None else limit})
+        return [self.deserialize(record) for record in records]
+
+    async def iter_centers(self):
+        async for record in self.database.iterate(statements.CENTERS_ALL):
+            yield self.deserialize(record)
+
+    async def get_center_inform(self, id):
+        record = await self.database.fetchone(statements.CENTER_BY_ID, {'id': id})
+        if record:
+            animals = await self.database.fetchall(statements.ANIMALS_OF_CENTER, {'id': id})
+            return (self.deserialize(record, long=True),
+                    [dao_sql.AnimalsDaoSql().deserialize(animal) for animal in animals])
+        return None
+
+    async def get_center_by_login(self, user_login):
+        record = await self.database.fetchone(statements.CENTER_BY_LOGIN, {'login': user_login})
+        return self.deserialize(record, long=True) if record else None
+
+    async def check_password(self, password, user_id=None):
+        record = await self.database.fetchone(statements.CENTER_PASSWORD, {'id': user_id})
+        return await hasher.check_password_hash_async(record['password_hash'], password)
+
+    async def add_center(self, data):
+        values = {'login': data['login'], 'address': data['address'],
+                  'password_hash': await hasher.generate_password_hash_async(data['password'])}
+        async with self.database.transaction() as connection:
+            cursor = await connection.execute(str(statements.CENTER_INSERT), values)
+            center_id = cursor.lastrowid
+        changes.feed.publish('center', 'create', {'id': center_id})
+        return center_id
+
+
+class AccessRequestDaoAsync(AsyncDao, IDaoAccessRequest):
+    async def create_access_request(self, user_id):
+        await self.create_access_requests([(user_id, self.timestamp_factory())])
+
+    async def create_access_requests(self, records):
+        async with self.database.transaction() as connection:
+            await connection.executemany(str(statements.ACCESS_REQUEST_INSERT),
+                                         [{'id': user_id, 'timestamp': str(timestamp)}
+                                          for user_id, timestamp in records])
+
+
+class SpeciesDaoAsync(AsyncDao, IDaoSpecies):
+    def deserialize(self, record=None, long=False):
+        return dao_sql.SpeciesDaoSql().deserialize(record, long)
+
+    async def get_species(self):
+        return [self.deserialize(record) for record in await self.database.fetchall(statements.SPECIES_COUNTS)]
+
+    async def get_species_inform(self, id):
+        record = await self.database.fetchone(statements.SPECIES_BY_ID, {'id': id})
+        if record:
+            animals = await self.database.fetchall(statements.ANIMALS_OF_SPECIES, {'id': id})
+            return (self.deserialize(record, long=True),
+                    [dao_sql.AnimalsDaoSql().deserialize(animal) for animal in animals])
+        return None
+
+    async def add_species(self, data):
+        values = {'name': data['name'], 'description': data['description'], 'price': data['price']}
+        async with self.database.transaction() as connection:
+            cursor = await connection.execute(str(statements.SPECIES_INSERT), values)
+            species_id = cursor.lastrowid
+            await connection.execute(str(statements.STATS_CREATE), {'species_id': species_id})
+        changes.feed.publish('species', 'create', {'id': species_id})
+        return self.deserialize(dict(values, id=species_id), long=True)
+
+    async def get_species_by_name(self, name):
+        record = await self.database.fetchone(statements.SPECIES_BY_NAME, {'name': name})
+        return self.deserialize(record, long=True) if record else None
+
+
+class SearchDaoAsync(AsyncDao, IDaoSearch):
+    """:param highlight: Tuple (start, end) of marks of found words in snippets, snippet_tokens - size of snippet."""
+
+    def __init__(self, database, highlight=('<mark>', '</mark>'), snippet_tokens=10):
+        super().__init__(database)
+        self.highlight = highlight
+        self.snippet_tokens = snippet_tokens
+
+    def deserialize(self, record=None, long=False):
+        return dao_sql.SearchDaoSql().deserialize(record, long)
+
+    async def search(self, query, limit=None, after=None, after_kind=None):
+        parameters = dao_sql.search_parameters(query, limit, self.highlight, self.snippet_tokens)
+        if not parameters['query']:
+            return []
+        statement = statements.SEARCH_FIRST_PAGE
+        if after is not None:
+            statement = statements.SEARCH_NEXT_PAGE
+            record = await self.database.fetchone(statements.SEARCH_RANK[after_kind],
+                                                  {'query': parameters['query'], 'id': after})
+            if record is None:
+                return []
+            parameters.update(after=after, after_kind=after_kind, after_rank=record[0])
+        return [self.deserialize(record) for record in await self.database.fetchall(statement, parameters)]
+
+
+def create_daos(database, config):
+    """
+    Function that builds async daos of application.
+    :param database: AsyncDatabase of application.
+    :param config: Config of flask application, it sets bulk batch size and search snippets.
+    :return: Dictionary with dao for every name from dao.DAO_NAMES.
+    """
+    return {'SpeciesDAO': SpeciesDaoAsync(database), 'AnimalCenterDAO': AnimalCentersDaoAsync(database),
+            'AccessRequestDAO': AccessRequestDaoAsync(database),
+            'AnimalDAO': AnimalsDaoAsync(database, config['BULK_BATCH_SIZE']),
+            'SearchDAO': SearchDaoAsync(database, config['SEARCH_HIGHLIGHT'], config['SEARCH_SNIPPET_TOKENS'])}
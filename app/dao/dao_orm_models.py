@@ -1,11 +1,27 @@
 """Classes to retrieve data from database via ORM"""
 
 from copy import copy
-from app.models.models import AnimalCenter, Animal, AccessRequest, Species
-from app.dao.interfaces import IDaoAccessRequest, IDaoAnimalCenter, IDaoAnimal, IDaoSpecies, IDaoDeserializer
+from datetime import datetime
+from app.models.models import AnimalCenter, Animal, AccessRequest, Species, SpeciesStats
+from app.dao.interfaces import IDaoAccessRequest, IDaoAnimalCenter, IDaoAnimal, IDaoSpecies, IDaoDeserializer, \
+    IDaoSearch
 from app import db
-from . import dao
-from werkzeug.security import check_password_hash
+from flask import current_app
+from sqlalchemy import tuple_, func, literal, literal_column, select, union_all
+from sqlalchemy.sql import table, column
+from sqlalchemy.orm import load_only, selectinload
+from app.utils import changes
+from app.utils.database import begin_immediate
+from app.utils.filters import DEFAULT_SORT, sort_segments
+from app.dao import species_stats, statements
+from app.utils.hashing import check_password_hash
+
+# conditions of filters of animal listing, see filters.ANIMAL_FILTERS
+ANIMAL_CONDITIONS = {'species_id': lambda value: Animal.species_id == value,
+                     'center_id': lambda value: Animal.center_id == value,
+                     'min_age': lambda value: Animal.age >= value, 'max_age': lambda value: Animal.age <= value,
+                     'min_price': lambda value: Animal.price >= value,
+                     'max_price': lambda value: Animal.price <= value}
 
 
 class AnimalCenterORM(IDaoAnimalCenter, IDaoDeserializer):
@@ -24,22 +40,41 @@ class AnimalCenterORM(IDaoAnimalCenter, IDaoDeserializer):
             data.update({'address': record.address})
         return data
 
+    def columns(self, long=False):
+        """Columns that deserialize needs, so only they are selected."""
+        if long:
+            return AnimalCenter.id, AnimalCenter.login, AnimalCenter.address
+        return AnimalCenter.id, AnimalCenter.login
+
     def check_password(self, password, user_id):
-        record = AnimalCenter.query.get(user_id)
-        return check_password_hash(record.password_hash, password)
+        password_hash = db.read_session.query(AnimalCenter.password_hash).filter_by(id=user_id).scalar()
+        return check_password_hash(password_hash, password)
 
-    def get_centers(self):
-        return [self.deserialize(record, long=False) for record in AnimalCenter.query.all()]
+    def get_centers(self, limit=None, after=None):
+        query = db.read_session.query(*self.columns()) \
+            .filter(AnimalCenter.id > (after or 0)).order_by(AnimalCenter.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [self.deserialize(record, long=False) for record in query]
+
+    def iter_centers(self):
+        query = db.read_session.query(*self.columns()).order_by(AnimalCenter.id) \
+            .yield_per(current_app.config['STREAM_BATCH'])
+        for record in query:
+            yield self.deserialize(record, long=False)
 
     def get_center_inform(self, id):
-        record = AnimalCenter.query.get(id)
+        record = db.read_session.query(AnimalCenter).options(
+            load_only(*[column.key for column in self.columns(long=True)]),
+            selectinload(AnimalCenter.animals).load_only(*[column.key for column in AnimalORM().columns()])
+        ).populate_existing().get(id)
         if record:
             return (self.deserialize(record, long=True),
-                    [dao.AnimalDAO.deserialize(animal) for animal in record.animals])
+                    [AnimalORM().deserialize(animal) for animal in record.animals])
         return None
 
     def get_center_by_login(self, user_login):
-        center = AnimalCenter.query.filter_by(login=user_login).first()
+        center = db.read_session.query(*self.columns()).filter_by(login=user_login).first()
         if center:
             return self.deserialize(center)
         else:
@@ -49,17 +84,29 @@ class AnimalCenterORM(IDaoAnimalCenter, IDaoDeserializer):
         center = AnimalCenter(login=data['login'], address=data['address'])
         center.set_password(data['password'])
         db.session.add(center)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        changes.feed.publish('center', 'create', {'id': center.id})
         return center.id
 
 
 class AccessRequestORM(IDaoAccessRequest):
+    # the same as default of AccessRequest.timestamp
+    timestamp_factory = staticmethod(datetime.utcnow)
 
     def create_access_request(self, user_id):
         access_request = AccessRequest(center_id=user_id)
         db.session.add(access_request)
         db.session.commit()
 
+    def create_access_requests(self, records):
+        db.session.bulk_insert_mappings(
+            AccessRequest, [{'center_id': user_id, 'timestamp': timestamp} for user_id, timestamp in records])
+        db.session.commit()
+
 
 class AnimalORM(IDaoAnimal, IDaoDeserializer):
 
@@ -83,34 +130,135 @@ class AnimalORM(IDaoAnimal, IDaoDeserializer):
             })
         return data
 
-    def get_animals(self):
-        animals = [self.deserialize(animal) for animal in Animal.query.all()]
+    def columns(self, long=False):
+        """Columns that deserialize needs, so only they are selected."""
+        if long:
+            return (Animal.id, Animal.name, Animal.center_id, Animal.description, Animal.age,
+                    Animal.species_id, Animal.price)
+        return Animal.id, Animal.name
+
+    def get_animals(self, limit=None, after=None, filters=None, sort=DEFAULT_SORT):
+        after_value = self._sort_value(sort, after)
+        animals = []
+        for segment, bounded in sort_segments(sort, after, after_value, filters or ()):
+            query = self._query(filters, sort, segment, after if bounded else None, after_value)
+            if limit is not None:
+                query = query.limit(limit - len(animals))
+            animals.extend(self.deserialize(animal) for animal in query)
+            if limit is not None and len(animals) >= limit:
+                break
         return animals
 
+    def _sort_value(self, sort, after):
+        if after is None or sort[0] == 'id':
+            return None
+        return db.read_session.query(getattr(Animal, sort[0])).filter(Animal.id == after).scalar()
+
+    def _query(self, filters, sort, segment, after=None, after_value=None):
+        """
+        Function that builds query of one segment of sorted listing, see filters.sort_segments.
+        :param after: Id of last animal of previous page if segment starts after it.
+        """
+        query = db.read_session.query(*self.columns())
+        for name, value in (filters or {}).items():
+            query = query.filter(ANIMAL_CONDITIONS[name](value))
+        column, descending = getattr(Animal, sort[0]), sort[1]
+        order = [Animal.id]
+        if segment == 'null':
+            query = query.filter(column.is_(None))
+        elif segment == 'value':
+            query = query.filter(column.isnot(None))
+            order.insert(0, column)
+        if after is not None:
+            if segment == 'value':
+                bound = tuple_(column, Animal.id) < tuple_(after_value, after) if descending \
+                    else tuple_(column, Animal.id) > tuple_(after_value, after)
+            else:
+                bound = Animal.id < after if descending else Animal.id > after
+            query = query.filter(bound)
+        return query.order_by(*[item.desc() if descending else item for item in order])
+
+    def iter_animals(self, filters=None, sort=DEFAULT_SORT):
+        for segment, _ in sort_segments(sort, filters=filters or ()):
+            query = self._query(filters, sort, segment).yield_per(current_app.config['STREAM_BATCH'])
+            for animal in query:
+                yield self.deserialize(animal)
+
     def add_animal(self, data, userid):
         animal = Animal(name=data['name'], center_id=userid,
                         description=data['description'], price=data['price'],
                         species_id=data['species_id'], age=data['age'])
         db.session.add(animal)
+        db.session.flush()
+        species_stats.animals_added(db.session, [self.deserialize(animal, long=True)])
         db.session.commit()
+        changes.animals_changed('create', self.deserialize(animal, long=True))
         return self.deserialize(animal)
 
+    def add_animals(self, animals, userid):
+        animals = list(animals)
+        results = [None] * len(animals)
+        species_ids = {species_id for species_id, in db.session.query(Species.id).filter(
+            Species.id.in_({animal['species_id'] for animal in animals}))}
+        rows = [(index, {'name': data['name'], 'center_id': userid,
+                         'description': data['description'], 'price': data['price'],
+                         'species_id': data['species_id'], 'age': data['age']})
+                for index, data in enumerate(animals) if data['species_id'] in species_ids]
+        try:
+            batch_size = current_app.config['BULK_BATCH_SIZE']
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                db.session.bulk_insert_mappings(Animal, [values for _, values in batch])
+                # sqlite gives consecutive ids to rows inserted while transaction holds write lock
+                first_id = db.session.query(db.func.max(Animal.id)).scalar() - len(batch) + 1
+                for offset, (index, values) in enumerate(batch):
+                    results[index] = dict(values, id=first_id + offset)
+            species_stats.animals_added(db.session, [values for _, values in rows])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        changes.animals_changed('create', *results, batch=True)
+        return [{'id': animal['id'], 'name': animal['name']} if animal else None for animal in results]
+
     def get_animal(self, animal_id):
-        animal = Animal.query.get(animal_id)
+        animal = db.read_session.query(*self.columns(long=True)).filter_by(id=animal_id).first()
+        return self.deserialize(animal, long=True) if animal else None
+
+    def _locked_animal(self, animal_id):
+        """:return: Animal read in writing transaction that holds write lock, or None if there is no such animal."""
+        begin_immediate(db.session.connection())
+        animal = Animal.query.populate_existing().get(animal_id)
         return self.deserialize(animal, long=True) if animal else None
 
     def delete_animal(self, animal_id):
-        animal = Animal.query.get(animal_id)
-        db.session.delete(animal)
-        db.session.commit()
+        try:
+            old = self._locked_animal(animal_id)
+            if old is None or Animal.query.filter_by(id=animal_id).delete() != 1:
+                db.session.rollback()
+                return
+            species_stats.animal_removed(db.session, old)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        changes.animals_changed('delete', old)
 
     def update_animal(self, animal):
         animal = copy(animal)
         animal_id = animal.pop('id')
-        animal_obj = Animal.query.get(animal_id)
-        for key, value in animal.items():
-            setattr(animal_obj, key, value)
-        db.session.commit()
+        try:
+            old = self._locked_animal(animal_id)
+            if old is None or Animal.query.filter_by(id=animal_id).update(animal) != 1:
+                db.session.rollback()
+                return
+            new = dict(old, **animal)
+            species_stats.animal_changed(db.session, old, new)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        changes.animals_changed('update', new)
 
 
 class SpeciesORM(IDaoSpecies, IDaoDeserializer):
@@ -126,33 +274,108 @@ class SpeciesORM(IDaoSpecies, IDaoDeserializer):
                 'price': record.price}
         return data
 
+    def columns(self, long=False):
+        """Columns that deserialize needs, so only they are selected."""
+        return Species.id, Species.name, Species.description, Species.price
+
     def get_species(self):
-        result = db.session.query(
-            Species.name, db.func.count(Animal.name)) \
-            .join(Animal, Species.id == Animal.species_id, isouter=True) \
-            .group_by(Species.id).all()
-        return [{'species_name': name, 'count_of_animals': count} for name, count in result]
+        result = db.read_session.query(
+            Species.name, db.func.coalesce(SpeciesStats.count_of_animals, 0),
+            SpeciesStats.min_price, SpeciesStats.max_price,
+            SpeciesStats.sum_price / db.func.nullif(SpeciesStats.count_of_priced, 0)) \
+            .join(SpeciesStats, Species.id == SpeciesStats.species_id, isouter=True) \
+            .order_by(Species.id).all()
+        return [{'species_name': name, 'count_of_animals': count, 'min_price': min_price,
+                 'max_price': max_price, 'avg_price': avg_price}
+                for name, count, min_price, max_price, avg_price in result]
 
     def get_species_inform(self, id):
-        species = Species().query.get(id)
-        animals = Animal.query.filter_by(species_id=id).all()
+        species = db.read_session.query(*self.columns(long=True)).filter_by(id=id).first()
 
         if species:
+            animals = db.read_session.query(*AnimalORM().columns()).filter_by(species_id=id)
             return (self.deserialize(species, long=True),
-                    [dao.AnimalDAO.deserialize(animal) for animal in animals])
+                    [AnimalORM().deserialize(animal) for animal in animals])
         else:
             return None
 
     def add_species(self, data):
         specie = Species(name=data['name'], description=data['description'],
                          price=data['price'])
-        db.session.add(specie)
-        db.session.commit()
+        try:
+            db.session.add(specie)
+            db.session.flush()
+            species_stats.species_added(db.session, specie.id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        changes.feed.publish('species', 'create', {'id': specie.id})
         return self.deserialize(specie, long=True)
 
     def get_species_by_name(self, name):
-        species = Species.query.filter_by(name=name).first()
+        species = db.read_session.query(*self.columns()).filter_by(name=name).first()
         if species:
             return self.deserialize(species)
         else:
             return None
+
+
+class SearchORM(IDaoSearch):
+
+    def deserialize(self, record=None, long=False):
+        return {'kind': record.kind,
+                'id': record.id,
+                'name': record.name,
+                'snippet': record.snippet}
+
+    @staticmethod
+    def _table(kind):
+        """:return: Tuple (table, hidden column named as table, which fts5 functions and MATCH take)."""
+        search = table(kind + '_search', column('rowid'), column('name'))
+        return search, literal_column(search.name)
+
+    @staticmethod
+    def _matches(kind, query, limit=None, after=None, after_kind=None, after_rank=None):
+        """
+        Select of the best matches of one kind, full-text tables are not models, so it is built from sql constructs.
+        Every table is cut to page before union, so snippets are made only for rows that can get to the page.
+        """
+        search, hidden = SearchORM._table(kind)
+        start, end = current_app.config['SEARCH_HIGHLIGHT']
+        rank = func.bm25(hidden)
+        select_kind = select([literal(kind).label('kind'), search.c.rowid.label('id'), search.c.name,
+                              func.snippet(hidden, -1, start, end, '...',
+                                           current_app.config['SEARCH_SNIPPET_TOKENS']).label('snippet'),
+                              rank.label('rank')]).select_from(search).where(hidden.match(query))
+        if after is not None:
+            select_kind = select_kind.where(
+                tuple_(rank, literal(kind), search.c.rowid) > tuple_(after_rank, after_kind, after))
+        return select_kind.order_by(rank, search.c.rowid).limit(-1 if limit is None else limit)
+
+    def search(self, query, limit=None, after=None, after_kind=None):
+        query = statements.match_query(query)
+        if not query:
+            return []
+        after_rank = None
+        if after is not None:
+            search, hidden = self._table(after_kind)
+            after_rank = db.read_session.execute(select([func.bm25(hidden)]).select_from(search).where(
+                hidden.match(query)).where(search.c.rowid == after)).scalar()
+            if after_rank is None:
+                # last result of previous page does not match any more, so place of next page is not known
+                return []
+        matches = union_all(*[
+            select([self._matches(kind, query, limit, after, after_kind, after_rank).alias()])
+            for kind in statements.SEARCH_KINDS]).alias('matches')
+        select_page = select([matches.c.kind, matches.c.id, matches.c.name, matches.c.snippet]) \
+            .order_by(matches.c.rank, matches.c.kind, matches.c.id)
+        if limit is not None:
+            select_page = select_page.limit(limit)
+        return [self.deserialize(record) for record in db.read_session.execute(select_page)]
+
+
+def create_daos():
+    """Function that builds daos of orm backend, see dao.register."""
+    return {'SpeciesDAO': SpeciesORM(), 'AnimalCenterDAO': AnimalCenterORM(),
+            'AccessRequestDAO': AccessRequestORM(), 'AnimalDAO': AnimalORM(), 'SearchDAO': SearchORM()}
@@ -1,137 +1,228 @@
 """Classes to retrieve data from database via SQL"""
 
 from app import db
-from copy import copy
-from werkzeug.security import check_password_hash, generate_password_hash
-from app.dao.interfaces import IDaoAnimalCenter, IDaoAccessRequest, IDaoSpecies, IDaoAnimal
-from datetime import datetime
+from flask import current_app
+from app.utils.hashing import check_password_hash, generate_password_hash
+from app.dao.interfaces import IDaoAnimalCenter, IDaoAccessRequest, IDaoSpecies, IDaoAnimal, IDaoSearch
+from app.dao import statements, species_stats
+from app.utils import changes, json_provider
+from app.utils.database import begin_immediate
+from app.utils.filters import DEFAULT_SORT, sort_segments
+
+ANIMAL_JSON = json_provider.RowEncoder(('id', 'name'))
+CENTER_JSON = json_provider.RowEncoder(('id', 'login'))
+
+
+def iter_json(statement, encoder, parameters=None):
+    """
+    Function that encodes every row of statement to json.
+    Plain tuples are read from sqlite cursor, so neither RowProxy nor dictionary is made for a row.
+    :param encoder: RowEncoder with keys in order of columns of statement.
+    """
+    records = db.get_read_engine().execute(statement, parameters or {})
+    try:
+        for rows in iter(lambda: records.cursor.fetchmany(current_app.config['STREAM_BATCH']), []):
+            yield from map(encoder.encode, rows)
+    finally:
+        records.close()
 
 
 class AnimalsDaoSql(IDaoAnimal):
     def deserialize(self, record=None, long=False):
         data = {
-            'id': record[0],
-            'name': record[2]
+            'id': record['id'],
+            'name': record['name']
         }
         if long:
             data.update({
-                'center_id': record[1],
-                'description': record[3],
-                'age': record[4],
-                'species_id': record[5],
-                'price': record[6]
+                'center_id': record['center_id'],
+                'description': record['description'],
+                'age': record['age'],
+                'species_id': record['species_id'],
+                'price': record['price']
             })
         return data
 
-    def get_animals(self):
-        records = db.engine.execute("SELECT * FROM animal;")
-        return [AnimalsDaoSql().deserialize(record) for record in records]
+    def get_animals(self, limit=None, after=None, filters=None, sort=DEFAULT_SORT):
+        filters = filters or {}
+        after_value = self._sort_value(sort, after)
+        animals = []
+        for segment, bounded in sort_segments(sort, after, after_value, filters):
+            records = db.get_read_engine().execute(
+                statements.animals_select(tuple(sorted(filters)), sort[0], sort[1], segment, bounded),
+                dict(filters, after=after, after_value=after_value,
+                     limit=-1 if limit is None else limit - len(animals)))
+            animals.extend(self.deserialize(record) for record in records)
+            if limit is not None and len(animals) >= limit:
+                break
+        return animals
+
+    def _sort_value(self, sort, after):
+        """:return: Value of sort column of animal with id after, which is needed to read the next page."""
+        if after is None or sort[0] == 'id':
+            return None
+        return db.get_read_engine().execute(statements.animal_sort_value(sort[0]), {'id': after}).scalar()
+
+    def iter_animals(self, filters=None, sort=DEFAULT_SORT):
+        for segment, _ in sort_segments(sort, filters=filters or ()):
+            records = db.get_read_engine().execute(
+                statements.animals_select(tuple(sorted(filters or {})), sort[0], sort[1], segment),
+                dict(filters or {}, limit=-1))
+            try:
+                for record in records:
+                    yield self.deserialize(record)
+            finally:
+                records.close()
+
+    def iter_animals_json(self, filters=None, sort=DEFAULT_SORT):
+        for segment, _ in sort_segments(sort, filters=filters or ()):
+            yield from iter_json(statements.animals_select(tuple(sorted(filters or {})), sort[0], sort[1], segment),
+                                 ANIMAL_JSON, dict(filters or {}, limit=-1))
 
     def get_animal(self, animal_id):
-        record = db.engine.execute(
-            "SELECT * FROM animal WHERE id=:id", {"id": animal_id}).first()
+        record = db.get_read_engine().execute(statements.ANIMAL_BY_ID, {"id": animal_id}).first()
         return AnimalsDaoSql().deserialize(record, long=True) if record else None
 
+    def _locked_animal(self, connection, animal_id):
+        """:return: Animal read in writing transaction that holds write lock, or None if there is no such animal."""
+        begin_immediate(connection)
+        record = connection.execute(statements.ANIMAL_BY_ID, {'id': animal_id}).first()
+        return self.deserialize(record, long=True) if record else None
+
     def delete_animal(self, animal_id):
-        db.engine.execute("DELETE FROM animal WHERE id=:id", {'id': animal_id})
+        with db.engine.begin() as connection:
+            old = self._locked_animal(connection, animal_id)
+            if old is None or connection.execute(statements.ANIMAL_DELETE, {'id': animal_id}).rowcount != 1:
+                return
+            species_stats.animal_removed(connection, old)
+        changes.animals_changed('delete', old)
 
     def update_animal(self, animal):
-        animal = copy(animal)
-        animal_id = animal.pop('id')
-
-        update_string = ','.join(
-            ["{key}=:{key}".format(key=key) for key in animal.keys()])
-
-        animal['id'] = animal_id
-
-        db.engine.execute(
-            "UPDATE animal SET {} WHERE id=:id".format(update_string), animal)
+        values = {key: value for key, value in animal.items() if key != 'id'}
+        statement = statements.animal_update(tuple(sorted(values)))
+        with db.engine.begin() as connection:
+            old = self._locked_animal(connection, animal['id'])
+            if old is None or connection.execute(statement, dict(values, id=animal['id'])).rowcount != 1:
+                return
+            new = dict(old, **values)
+            species_stats.animal_changed(connection, old, new)
+        changes.animals_changed('update', new)
 
     def add_animal(self, data, userid):
         values = {'name': data['name'], 'center_id': userid,
                   'description': data['description'], 'price': data['price'],
                   'species_id': data['species_id'], 'age': data['age']}
 
-        db.engine.execute("INSERT INTO animal (name, center_id, description, price, species_id, age) "
-                          "VALUES (:name, :center_id, :description, :price, :species_id, :age);",
-                          values)
-        animal = db.engine.execute("SELECT * FROM animal WHERE id = (SELECT MAX(id) FROM animal);").first()
-        return AnimalsDaoSql().deserialize(animal)
+        with db.engine.begin() as connection:
+            animal_id = connection.execute(statements.ANIMAL_INSERT, values).lastrowid
+            species_stats.animals_added(connection, [values])
+        changes.animals_changed('create', dict(values, id=animal_id))
+        return {'id': animal_id, 'name': values['name']}
+
+    def add_animals(self, animals, userid):
+        animals = list(animals)
+        results = [None] * len(animals)
+        with db.engine.begin() as connection:
+            species_ids = connection.execute(
+                statements.SPECIES_IDS, {'ids': list({animal['species_id'] for animal in animals})})
+            species_ids = {record['id'] for record in species_ids}
+            rows = [(index, {'name': data['name'], 'center_id': userid,
+                             'description': data['description'], 'price': data['price'],
+                             'species_id': data['species_id'], 'age': data['age']})
+                    for index, data in enumerate(animals) if data['species_id'] in species_ids]
+            batch_size = current_app.config['BULK_BATCH_SIZE']
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                connection.execute(statements.ANIMAL_INSERT, [values for _, values in batch])
+                # sqlite gives consecutive ids to rows inserted while transaction holds write lock
+                first_id = connection.execute(statements.ANIMAL_MAX_ID).scalar() - len(batch) + 1
+                for offset, (index, values) in enumerate(batch):
+                    results[index] = dict(values, id=first_id + offset)
+            species_stats.animals_added(connection, [values for _, values in rows])
+        changes.animals_changed('create', *results, batch=True)
+        return [{'id': animal['id'], 'name': animal['name']} if animal else None for animal in results]
 
 
 class AnimalCentersDaoSql(IDaoAnimalCenter):
     def deserialize(self, record=None, long=False):
-        data = {'id': record.id,
-                'login': record.login}
+        data = {'id': record['id'],
+                'login': record['login']}
         if long:
-            data.update({'address': record.address})
+            data.update({'address': record['address']})
         return data
 
-    def get_centers(self):
-        records = db.engine.execute("SELECT * FROM animal_center;")
+    def get_centers(self, limit=None, after=None):
+        records = db.get_read_engine().execute(
+            statements.CENTERS_PAGE, {'after': after or 0, 'limit': -1 if limit is None else limit})
         return [AnimalCentersDaoSql().deserialize(record, long=False) for record in records]
 
+    def iter_centers(self):
+        records = db.get_read_engine().execute(statements.CENTERS_ALL)
+        try:
+            for record in records:
+                yield self.deserialize(record, long=False)
+        finally:
+            records.close()
+
+    def iter_centers_json(self):
+        return iter_json(statements.CENTERS_ALL, CENTER_JSON)
+
     def get_center_inform(self, id):
-        record = db.engine.execute(
-            "SELECT * FROM animal_center WHERE id=:id;", {'id': id}).first()
-        animals = db.engine.execute(
-            "SELECT * FROM animal WHERE center_id=:id;", {'id': id}
-        )
+        record = db.get_read_engine().execute(statements.CENTER_BY_ID, {'id': id}).first()
         if record:
+            animals = db.get_read_engine().execute(statements.ANIMALS_OF_CENTER, {'id': id})
             return (AnimalCentersDaoSql().deserialize(record, long=True),
-                    [AnimalsDaoSql().deserialize(animal) for animal in animals] if record else None)
+                    [AnimalsDaoSql().deserialize(animal) for animal in animals])
         else:
             return None
 
     def get_center_by_login(self, user_login):
-        record = db.engine.execute(
-            "SELECT * FROM animal_center WHERE login=:login;",
-            {'login': user_login}).first()
+        record = db.get_read_engine().execute(statements.CENTER_BY_LOGIN, {'login': user_login}).first()
         return AnimalCentersDaoSql().deserialize(record, long=True) if record else None
 
     def check_password(self, password, user_id=None):
-        record = db.engine.execute(
-            "SELECT password_hash FROM animal_center "
-            "WHERE id =:id;", {'id': user_id}).first()
-        return check_password_hash(record.password_hash, password)
+        record = db.get_read_engine().execute(statements.CENTER_PASSWORD, {'id': user_id}).first()
+        return check_password_hash(record['password_hash'], password)
 
     def add_center(self, data):
-        password = data.pop('password')
-        data['password_hash'] = generate_password_hash(password)
-        db.engine.execute(
-            "INSERT INTO animal_center (login, password_hash, address) "
-            "VALUES (:login, :password_hash, :address);", data)
-        return db.engine.execute("SELECT MAX(id) FROM animal_center;").first()[0]
+        values = {'login': data['login'], 'address': data['address'],
+                  'password_hash': generate_password_hash(data['password'])}
+        center_id = db.engine.execute(statements.CENTER_INSERT, values).lastrowid
+        changes.feed.publish('center', 'create', {'id': center_id})
+        return center_id
 
 
 class AccessRequestDaoSql(IDaoAccessRequest):
     def create_access_request(self, user_id):
-        db.engine.execute(
-            "INSERT INTO access_request (center_id, timestamp) VALUES (:id, :timestamp);",
-            {'id': user_id, 'timestamp': datetime.now()})
+        db.engine.execute(statements.ACCESS_REQUEST_INSERT, {'id': user_id, 'timestamp': self.timestamp_factory()})
+
+    def create_access_requests(self, records):
+        with db.engine.begin() as connection:
+            connection.execute(statements.ACCESS_REQUEST_INSERT,
+                               [{'id': user_id, 'timestamp': timestamp} for user_id, timestamp in records])
 
 
 class SpeciesDaoSql(IDaoSpecies):
     def deserialize(self, record=None, long=False):
-        data = {'species_name': record[0],
-                'count_of_animals': record[1]}
         if long:
-            data = {'id': record[0],
-                    'name': record[1],
-                    'description': record[2],
-                    'price': record[3]}
-        return data
+            return {'id': record['id'],
+                    'name': record['name'],
+                    'description': record['description'],
+                    'price': record['price']}
+        return {'species_name': record['species_name'],
+                'count_of_animals': record['count_of_animals'],
+                'min_price': record['min_price'],
+                'max_price': record['max_price'],
+                'avg_price': record['avg_price']}
 
     def get_species(self):
-        records = db.engine.execute("SELECT species.name, count(animal.name) FROM species "
-                                    "LEFT OUTER JOIN animal ON species.id = animal.species_id "
-                                    "GROUP BY species.name")
+        records = db.get_read_engine().execute(statements.SPECIES_COUNTS)
         return [SpeciesDaoSql().deserialize(record) for record in records]
 
     def get_species_inform(self, id):
-        record = db.engine.execute("SELECT * FROM species WHERE id = :id;", {'id': id}).first()
-        animals = db.engine.execute("SELECT * FROM animal WHERE species_id = :id;", {'id': id})
+        record = db.get_read_engine().execute(statements.SPECIES_BY_ID, {'id': id}).first()
         if record:
+            animals = db.get_read_engine().execute(statements.ANIMALS_OF_SPECIES, {'id': id})
             return (SpeciesDaoSql().deserialize(record, long=True),
                     [AnimalsDaoSql().deserialize(animal) for animal in animals])
         else:
@@ -140,15 +231,56 @@ class SpeciesDaoSql(IDaoSpecies):
     def add_species(self, data):
         values = {'name': data['name'], 'description': data['description'],
                   'price': data['price']}
-        db.engine.execute("INSERT INTO species (name, description, price) "
-                          "VALUES (:name, :description, :price);", values)
-        species = db.engine.execute("SELECT * FROM species WHERE id = (SELECT MAX(id) FROM species);").first()
-        return SpeciesDaoSql().deserialize(species, long=True)
+        with db.engine.begin() as connection:
+            species_id = connection.execute(statements.SPECIES_INSERT, values).lastrowid
+            species_stats.species_added(connection, species_id)
+        changes.feed.publish('species', 'create', {'id': species_id})
+        return SpeciesDaoSql().deserialize(dict(values, id=species_id), long=True)
 
     def get_species_by_name(self, name):
-        species = db.engine.execute(
-            "SELECT * FROM species WHERE name = :name;", {'name': name}).first()
+        species = db.get_read_engine().execute(statements.SPECIES_BY_NAME, {'name': name}).first()
         if species:
-            return self.deserialize(species)
+            return self.deserialize(species, long=True)
         else:
             return None
+
+
+def search_parameters(query, limit, highlight, tokens):
+    """
+    Function that makes parameters of search statements.
+    :param query: Text of user, every word of it should be found.
+    :param highlight: Tuple (start, end) of markers around matched words in snippet.
+    :param tokens: Count of words in snippet.
+    """
+    return {'query': statements.match_query(query), 'limit': -1 if limit is None else limit,
+            'start': highlight[0], 'end': highlight[1], 'tokens': tokens}
+
+
+class SearchDaoSql(IDaoSearch):
+    def deserialize(self, record=None, long=False):
+        return {'kind': record['kind'],
+                'id': record['id'],
+                'name': record['name'],
+                'snippet': record['snippet']}
+
+    def search(self, query, limit=None, after=None, after_kind=None):
+        parameters = search_parameters(query, limit, current_app.config['SEARCH_HIGHLIGHT'],
+                                       current_app.config['SEARCH_SNIPPET_TOKENS'])
+        if not parameters['query']:
+            return []
+        engine = db.get_read_engine()
+        statement = statements.SEARCH_FIRST_PAGE
+        if after is not None:
+            statement = statements.SEARCH_NEXT_PAGE
+            parameters.update(after=after, after_kind=after_kind, after_rank=engine.execute(
+                statements.SEARCH_RANK[after_kind], {'query': parameters['query'], 'id': after}).scalar())
+            if parameters['after_rank'] is None:
+                # last result of previous page does not match any more, so place of next page is not known
+                return []
+        return [self.deserialize(record) for record in engine.execute(statement, parameters)]
+
+
+def create_daos():
+    """Function that builds daos of sql backend, see dao.register."""
+    return {'SpeciesDAO': SpeciesDaoSql(), 'AnimalCenterDAO': AnimalCentersDaoSql(),
+            'AccessRequestDAO': AccessRequestDaoSql(), 'AnimalDAO': AnimalsDaoSql(), 'SearchDAO': SearchDaoSql()}
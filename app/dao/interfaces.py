@@ -1,6 +1,9 @@
 """Interfaces that define behaviour for retrieving data from database"""
 
 from abc import ABCMeta, abstractmethod
+from datetime import datetime
+from app.utils import json_provider
+from app.utils.filters import DEFAULT_SORT
 
 
 class IDaoDeserializer:
@@ -15,8 +18,16 @@ class IDaoAnimalCenter(IDaoDeserializer):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def get_centers(self):
-        """Show all animal centers"""
+    def get_centers(self, limit=None, after=None):
+        """Show all animal centers or one page of them ordered by id"""
+
+    @abstractmethod
+    def iter_centers(self):
+        """Yield all animal centers one by one from database cursor"""
+
+    def iter_centers_json(self):
+        """Yield json of all animal centers one by one, dao can encode rows without dictionaries"""
+        return map(json_provider.dumps, self.iter_centers())
 
     @abstractmethod
     def get_center_inform(self, id):
@@ -30,14 +41,25 @@ class IDaoAnimalCenter(IDaoDeserializer):
     def add_center(self, data):
         """Create new animal center"""
 
+    @abstractmethod
+    def check_password(self, password, user_id):
+        """Check password of center with id user_id"""
+
 
 class IDaoAccessRequest:
     __metaclass__ = ABCMeta
 
+    # function that gives timestamp of new access request, local time unless dao stores other
+    timestamp_factory = staticmethod(datetime.now)
+
     @abstractmethod
     def create_access_request(self, user_id):
         """Create access request"""
 
+    @abstractmethod
+    def create_access_requests(self, records):
+        """Create many access requests from (user_id, timestamp) pairs with one insert"""
+
 
 class IDaoSpecies(IDaoDeserializer):
     __metaclass__ = ABCMeta
@@ -63,8 +85,17 @@ class IDaoAnimal(IDaoDeserializer):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def get_animals(self):
-        """To show all animals"""
+    def get_animals(self, limit=None, after=None, filters=None, sort=DEFAULT_SORT):
+        """To show all animals or one page of animals that match filters, ordered by sort (column, descending),
+        see filters.parse_animal_filters. After is id of last animal of previous page"""
+
+    @abstractmethod
+    def iter_animals(self, filters=None, sort=DEFAULT_SORT):
+        """Yield all animals that match filters one by one from database cursor"""
+
+    def iter_animals_json(self, filters=None, sort=DEFAULT_SORT):
+        """Yield json of all animals one by one, dao can encode rows without dictionaries"""
+        return map(json_provider.dumps, self.iter_animals(filters, sort))
 
     @abstractmethod
     def get_animal(self, animal_id):
@@ -81,3 +112,16 @@ class IDaoAnimal(IDaoDeserializer):
     @abstractmethod
     def add_animal(self, data, userid):
         """Add animal."""
+
+    @abstractmethod
+    def add_animals(self, animals, userid):
+        """Add many animals in one transaction, list with None for animals with unknown species is returned."""
+
+
+class IDaoSearch(IDaoDeserializer):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def search(self, query, limit=None, after=None, after_kind=None):
+        """Find animals and species by words of name and description, the best matches first.
+        After and after_kind are id and kind of last result of previous page"""
@@ -0,0 +1,62 @@
+"""Functions that keep species_stats table current. They are called by write methods of both daos
+inside the same transaction as the change of animals. Executor is sqlalchemy connection or session."""
+
+from app.dao import statements
+
+
+def species_added(executor, species_id):
+    executor.execute(statements.STATS_CREATE, {'species_id': species_id})
+
+
+def aggregate(animals):
+    """
+    Function that counts aggregates of animals per species.
+    :param animals: Iterable of dictionaries with species_id and price.
+    :return: List of parameters of STATS_ADD, one per species.
+    """
+    stats = {}
+    for animal in animals:
+        price = animal['price']
+        entry = stats.setdefault(animal['species_id'], {'species_id': animal['species_id'], 'count': 0,
+                                                        'count_of_priced': 0, 'sum_price': 0,
+                                                        'min_price': None, 'max_price': None})
+        entry['count'] += 1
+        if price is not None:
+            entry['count_of_priced'] += 1
+            entry['sum_price'] += price
+            entry['min_price'] = price if entry['min_price'] is None else min(entry['min_price'], price)
+            entry['max_price'] = price if entry['max_price'] is None else max(entry['max_price'], price)
+    return list(stats.values())
+
+
+def animals_added(executor, animals):
+    """
+    Function that adds new animals to aggregates of their species.
+    :param animals: Iterable of dictionaries with species_id and price of animals that were inserted.
+    """
+    stats = aggregate(animals)
+    if stats:
+        executor.execute(statements.STATS_CREATE, [{'species_id': entry['species_id']} for entry in stats])
+        executor.execute(statements.STATS_ADD, stats)
+
+
+def animal_removed(executor, animal):
+    """
+    Function that removes animal from aggregates of its species. It must be called after animal was
+    deleted or changed in animal table, min and max price are selected again by index.
+    :param animal: Dictionary with species_id and price that animal had before change.
+    """
+    executor.execute(statements.STATS_REMOVE, {'species_id': animal['species_id'], 'price': animal['price']})
+
+
+def animal_changed(executor, old, new):
+    """Function that moves changed animal from old to new aggregates, must be called after update."""
+    if old['species_id'] != new['species_id'] or old['price'] != new['price']:
+        animal_removed(executor, old)
+        animals_added(executor, [new])
+
+
+def rebuild(executor):
+    """Function that counts all aggregates from scratch, it repairs any drift of stats."""
+    executor.execute(statements.STATS_CLEAR)
+    executor.execute(statements.STATS_REBUILD)
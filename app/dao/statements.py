@@ -0,0 +1,160 @@
+"""Statements of sql dao. Every statement is built once as text() construct with bound parameters,
+columns are always listed by name, so dao does not depend on order of columns in table."""
+
+import re
+from functools import lru_cache
+from sqlalchemy import bindparam, text
+from app.utils.filters import ANIMAL_SORT_COLUMNS
+
+ANIMAL_COLUMNS = ('center_id', 'name', 'description', 'age', 'species_id', 'price')
+
+ANIMALS_OF_CENTER = text("SELECT id, name FROM animal WHERE center_id = :id;")
+ANIMALS_OF_SPECIES = text("SELECT id, name FROM animal WHERE species_id = :id;")
+ANIMAL_BY_ID = text("SELECT id, center_id, name, description, age, species_id, price FROM animal WHERE id = :id;")
+ANIMAL_DELETE = text("DELETE FROM animal WHERE id = :id;")
+ANIMAL_INSERT = text("INSERT INTO animal (name, center_id, description, price, species_id, age) "
+                     "VALUES (:name, :center_id, :description, :price, :species_id, :age);")
+ANIMAL_MAX_ID = text("SELECT MAX(id) FROM animal;")
+
+CENTERS_PAGE = text("SELECT id, login FROM animal_center WHERE id > :after ORDER BY id LIMIT :limit;")
+CENTERS_ALL = text("SELECT id, login FROM animal_center ORDER BY id;")
+CENTER_BY_ID = text("SELECT id, login, address FROM animal_center WHERE id = :id;")
+CENTER_BY_LOGIN = text("SELECT id, login, address FROM animal_center WHERE login = :login;")
+CENTER_PASSWORD = text("SELECT password_hash FROM animal_center WHERE id = :id;")
+CENTER_MAX_ID = text("SELECT MAX(id) FROM animal_center;")
+CENTER_INSERT = text("INSERT INTO animal_center (login, password_hash, address) "
+                     "VALUES (:login, :password_hash, :address);")
+
+ACCESS_REQUEST_INSERT = text("INSERT INTO access_request (center_id, timestamp) VALUES (:id, :timestamp);")
+
+SPECIES_COUNTS = text("SELECT species.name AS species_name, coalesce(count_of_animals, 0) AS count_of_animals, "
+                      "min_price, max_price, sum_price / nullif(count_of_priced, 0) AS avg_price FROM species "
+                      "LEFT OUTER JOIN species_stats ON species.id = species_stats.species_id "
+                      "ORDER BY species.name;")
+SPECIES_BY_ID = text("SELECT id, name, description, price FROM species WHERE id = :id;")
+SPECIES_BY_NAME = text("SELECT id, name, description, price FROM species WHERE name = :name;")
+SPECIES_IDS = text("SELECT id FROM species WHERE id IN :ids;").bindparams(bindparam('ids', expanding=True))
+SPECIES_MAX_ID = text("SELECT MAX(id) FROM species;")
+SPECIES_INSERT = text("INSERT INTO species (name, description, price) VALUES (:name, :description, :price);")
+
+STATS_CREATE = text("INSERT OR IGNORE INTO species_stats (species_id, count_of_animals, count_of_priced, sum_price) "
+                    "VALUES (:species_id, 0, 0, 0);")
+STATS_ADD = text("UPDATE species_stats SET count_of_animals = count_of_animals + :count, "
+                 "count_of_priced = count_of_priced + :count_of_priced, sum_price = sum_price + :sum_price, "
+                 "min_price = CASE WHEN min_price IS NULL OR :min_price < min_price "
+                 "THEN coalesce(:min_price, min_price) ELSE min_price END, "
+                 "max_price = CASE WHEN max_price IS NULL OR :max_price > max_price "
+                 "THEN coalesce(:max_price, max_price) ELSE max_price END "
+                 "WHERE species_id = :species_id;")
+STATS_REMOVE = text("UPDATE species_stats SET count_of_animals = count_of_animals - 1, "
+                    "count_of_priced = count_of_priced - (:price IS NOT NULL), "
+                    "sum_price = sum_price - coalesce(:price, 0), "
+                    "min_price = (SELECT min(price) FROM animal WHERE species_id = :species_id), "
+                    "max_price = (SELECT max(price) FROM animal WHERE species_id = :species_id) "
+                    "WHERE species_id = :species_id;")
+STATS_CLEAR = text("DELETE FROM species_stats;")
+STATS_REBUILD = text("INSERT INTO species_stats "
+                     "(species_id, count_of_animals, count_of_priced, sum_price, min_price, max_price) "
+                     "SELECT species.id, count(animal.id), count(animal.price), coalesce(sum(animal.price), 0), "
+                     "min(animal.price), max(animal.price) "
+                     "FROM species LEFT OUTER JOIN animal ON species.id = animal.species_id "
+                     "GROUP BY species.id;")
+
+
+ANIMAL_CONDITIONS = {'species_id': 'species_id = :species_id', 'center_id': 'center_id = :center_id',
+                     'min_age': 'age >= :min_age', 'max_age': 'age <= :max_age',
+                     'min_price': 'price >= :min_price', 'max_price': 'price <= :max_price'}
+
+SEARCH_KINDS = ('animal', 'species')
+# best matches of every kind with snippets of matched text, every table is cut to page before union,
+# so snippets are made only for rows that can get to the page
+_SEARCH_MATCHES = "SELECT * FROM (SELECT '{0}' AS kind, rowid AS id, name, " \
+    "snippet({0}_search, -1, :start, :end, '...', :tokens) AS snippet, bm25({0}_search) AS rank " \
+    "FROM {0}_search WHERE {0}_search MATCH :query{1} ORDER BY rank, id LIMIT :limit)"
+_SEARCH_AFTER = " AND (bm25({0}_search), '{0}', rowid) > (:after_rank, :after_kind, :after)"
+# results are ordered by bm25 rank (smaller is better), then by kind and id, so the last result
+# of page is keyset of the next one
+SEARCH_FIRST_PAGE = text("SELECT kind, id, name, snippet FROM ({}) ORDER BY rank, kind, id LIMIT :limit;".format(
+    ' UNION ALL '.join(_SEARCH_MATCHES.format(kind, '') for kind in SEARCH_KINDS)))
+SEARCH_NEXT_PAGE = text("SELECT kind, id, name, snippet FROM ({}) ORDER BY rank, kind, id LIMIT :limit;".format(
+    ' UNION ALL '.join(_SEARCH_MATCHES.format(kind, _SEARCH_AFTER.format(kind)) for kind in SEARCH_KINDS)))
+SEARCH_RANK = {kind: text("SELECT bm25({0}_search) FROM {0}_search WHERE {0}_search MATCH :query AND rowid = :id;"
+                          .format(kind)) for kind in SEARCH_KINDS}
+
+
+def match_query(words):
+    """
+    Function that builds full text query that matches all words, words are quoted,
+    so characters of fts5 query syntax in them are searched as text.
+    :param words: Text from client.
+    :return: Query for MATCH or empty string if there are no words.
+    """
+    return ' '.join('"{}"'.format(word) for word in re.findall(r'\w+', words))
+
+
+def parse_search_args(args):
+    """
+    Function that reads params of search from query params, it is shared by flask route and async app.
+    :return: Tuple (q, after_kind).
+    :raise ValueError: If q has no words to find or after is given without after_kind from SEARCH_KINDS.
+    """
+    query = args.get('q', '')
+    if not match_query(query):
+        raise ValueError("Parameter 'q' should contain words to find")
+    after_kind = args.get('after_kind')
+    if args.get('after') is not None and after_kind not in SEARCH_KINDS:
+        raise ValueError("Parameter 'after_kind' should be one of: {}".format(', '.join(SEARCH_KINDS)))
+    return query, after_kind
+
+
+@lru_cache(maxsize=None)
+def animals_select(filters=(), sort='id', descending=False, segment=None, bounded=False):
+    """
+    Function that builds select of animals (id, name) once and then returns it from cache.
+    Values of filters and of keyset (:after, :after_value) and :limit (-1 for all) are bound parameters.
+    :param filters: Sorted tuple of names from ANIMAL_CONDITIONS.
+    :param sort: Column from ANIMAL_SORT_COLUMNS, animals with the same value are ordered by id.
+    :param segment: None when sorted by id, 'null' for animals without value of sort column,
+                    'value' for animals with it, see filters.sort_segments.
+    :param bounded: True to select only animals after :after id (and :after_value in 'value' segment).
+    :raise ValueError: If any filter or sort column is unknown.
+    """
+    unknown = set(filters) - set(ANIMAL_CONDITIONS)
+    if unknown or sort not in ANIMAL_SORT_COLUMNS:
+        raise ValueError('Animals can not be selected with: {}'.format(', '.join(sorted(unknown) or [sort])))
+    direction, compare = ('DESC', '<') if descending else ('ASC', '>')
+    conditions = [ANIMAL_CONDITIONS[name] for name in filters]
+    order = ['id ' + direction]
+    if segment == 'null':
+        conditions.append('{} IS NULL'.format(sort))
+    elif segment == 'value':
+        conditions.append('{} IS NOT NULL'.format(sort))
+        order.insert(0, '{} {}'.format(sort, direction))
+    if bounded:
+        conditions.append('({}, id) {} (:after_value, :after)'.format(sort, compare) if segment == 'value'
+                          else 'id {} :after'.format(compare))
+    return text("SELECT id, name FROM animal {}ORDER BY {} LIMIT :limit;".format(
+        'WHERE {} '.format(' AND '.join(conditions)) if conditions else '', ', '.join(order)))
+
+
+@lru_cache(maxsize=None)
+def animal_sort_value(column):
+    """:return: Statement that reads value of sort column of one animal by :id."""
+    if column not in ANIMAL_SORT_COLUMNS:
+        raise ValueError('Animals can not be sorted by {}'.format(column))
+    return text("SELECT {} FROM animal WHERE id = :id;".format(column))
+
+
+@lru_cache(maxsize=None)
+def animal_update(columns):
+    """
+    Function that builds update statement for given set of columns once and then returns it from cache.
+    :param columns: Tuple of column names, sorted so that the same set of columns gives the same statement.
+    :return: text() construct with bound parameter for each column and for id.
+    :raise ValueError: If any column is not updatable column of animal.
+    """
+    unknown = set(columns) - set(ANIMAL_COLUMNS)
+    if unknown or not columns:
+        raise ValueError('Animal can not be updated with columns: {}'.format(', '.join(sorted(unknown))))
+    return text("UPDATE animal SET {} WHERE id = :id;".format(
+        ', '.join('{column} = :{column}'.format(column=column) for column in columns)))
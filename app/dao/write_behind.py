@@ -0,0 +1,129 @@
+"""Write-behind buffer for access requests, so login does not wait for database write.
+One background thread of process flushes buffers of all applications, buffer of application
+that is gone is dropped from it."""
+
+import atexit
+import logging
+from threading import Event, Lock, Thread
+from time import monotonic
+from weakref import WeakSet
+
+logger = logging.getLogger(__name__)
+
+# buffers that background thread flushes, it is woken when some buffer is full or new one is added
+_buffers = WeakSet()
+_wakeup = Event()
+_lock = Lock()
+_thread = None
+
+
+class WriteBehindAccessRequestDAO:
+    """
+    Access request dao wrapper that keeps new access requests in memory. Background thread of process writes
+    them with one multi-row insert every flush_records records or every flush_interval seconds,
+    what comes first. Records that are still in buffer are written when process exits.
+    Timestamps are taken when records come, by timestamp_factory of wrapped dao.
+    :param dao: Access request dao that makes real inserts.
+    :param flush_records: Count of records that triggers flush.
+    :param flush_interval: Max seconds between flushes.
+    :param max_buffer: Records that come when buffer is full are dropped and counted.
+    """
+
+    def __init__(self, dao, flush_records=100, flush_interval=0.5, max_buffer=10000):
+        self._dao = dao
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._buffer_lock = Lock()
+        self._app = None
+        self._flushed_at = monotonic()
+        self.flushed = 0
+        self.dropped = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._dao, name)
+
+    def init_app(self, app):
+        """
+        Function that binds buffer to application, whose database is used for flushes,
+        and passes it to background thread, which is started by the first buffer of process.
+        """
+        global _thread
+        self._app = app
+        with _lock:
+            _buffers.add(self)
+            if _thread is None:
+                _thread = Thread(target=_run, name='access-request-flush', daemon=True)
+                _thread.start()
+                atexit.register(flush_all)
+        _wakeup.set()
+
+    def create_access_request(self, user_id):
+        with self._buffer_lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append((user_id, self._dao.timestamp_factory(), monotonic()))
+            if len(self._buffer) >= self.flush_records:
+                _wakeup.set()
+
+    def create_access_requests(self, records):
+        for user_id, _ in records:
+            self.create_access_request(user_id)
+
+    def flush(self):
+        """Function that writes all buffered records with one insert."""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+            self._flushed_at = monotonic()
+        if not batch or self._app is None:
+            return
+        try:
+            with self._app.app_context():
+                self._dao.create_access_requests([(user_id, timestamp) for user_id, timestamp, _ in batch])
+        except Exception:
+            logger.exception('Failed to write %s access requests', len(batch))
+            with self._buffer_lock:
+                self.dropped += len(batch)
+            return
+        lag = monotonic() - batch[0][2]
+        with self._buffer_lock:
+            self.flushed += len(batch)
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+
+    def stats(self):
+        """
+        Function that reports state of buffer.
+        :return: Dictionary with count of buffered, flushed and dropped records and flush lag in seconds,
+                 that is how long the oldest record of flush waited in buffer.
+        """
+        with self._buffer_lock:
+            return {'buffered': len(self._buffer),
+                    'flushed': self.flushed,
+                    'dropped': self.dropped,
+                    'last_flush_lag': self.last_flush_lag,
+                    'max_flush_lag': self.max_flush_lag}
+
+    def due(self):
+        """:return: True if buffer has flush_records records or it was flushed flush_interval seconds ago."""
+        with self._buffer_lock:
+            return len(self._buffer) >= self.flush_records or monotonic() - self._flushed_at >= self.flush_interval
+
+
+def flush_all():
+    """Function that writes records of all buffers, it is called when process exits."""
+    for buffer in list(_buffers):
+        buffer.flush()
+
+
+def _run():
+    while True:
+        _wakeup.wait(min((buffer.flush_interval for buffer in list(_buffers)), default=None))
+        _wakeup.clear()
+        for buffer in list(_buffers):
+            if buffer.due():
+                buffer.flush()
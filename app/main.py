@@ -1,17 +1,53 @@
 """Factory method for building flask application"""
 
 from flask import Flask
-from app.config import Config
-from app import db, migrate, jwt
+from os import path
+from app.config import Config, basepath
+from app import db, migrate, jwt, log_queue, queue_handler
 from app.routes.routes import bp as routes_bp
+from app.dao import dao
+from app import commands
+from app.utils import metrics, hashing, json_provider, compression, jwt_cache, admission, changes
 
 
-def create_app():
+def create_app(config=None):
+    """
+    Function that builds application. Daos and database belong to application, services of app.utils
+    (hashing, compression, jwt_cache, changes, admission) are shared by all applications of process
+    and built from Config, config only switches them on or off.
+    :param config: Mapping of settings that override Config for this application, e.g. {'DAO_BACKEND': 'sql'}.
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.config.update(config or {})
+    app.json_encoder = json_provider.encoder(app.config['JSON_ENCODER'])
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, directory=path.join(basepath, 'migrations'), render_as_batch=True)
     jwt.init_app(app)
     app.register_blueprint(routes_bp)
+    app.cli.add_command(commands.rebuild_species_stats)
+    daos = dao.init_app(app)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
+        metrics.registry.add_collector('password_hashing', hashing.hasher.stats)
+        metrics.registry.add_collector('audit_log', lambda: {'queued': log_queue.qsize(),
+                                                             'dropped': queue_handler.dropped})
+        if app.config['JWT_CACHE_SIZE']:
+            metrics.registry.add_collector('jwt_cache', jwt_cache.cache.stats)
+        if app.config['COMPRESSION_ENABLED']:
+            metrics.registry.add_collector('compression', compression.compressor.stats)
+        metrics.registry.add_collector('changes', changes.feed.stats)
+        if app.config['ADMISSION_ENABLED']:
+            metrics.registry.add_collector('admission', admission.controller.stats)
+        if daos.cache is not None:
+            metrics.registry.add_collector('dao_cache', daos.cache.stats)
+        if app.config['ACCESS_REQUEST_WRITE_BEHIND']:
+            metrics.registry.add_collector('access_request_buffer', daos.AccessRequestDAO.stats)
+    if app.config['ADMISSION_ENABLED']:
+        # after metrics, so shed requests are counted in http_requests_total
+        admission.init_app(app)
+    if app.config['COMPRESSION_ENABLED']:
+        # after_request functions run in reverse order, so compression is counted in Server-Timing total
+        compression.init_app(app)
     app.db = db
     return app
@@ -2,7 +2,7 @@
 
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.hashing import generate_password_hash, check_password_hash
 
 
 class AnimalCenter(db.Model):
@@ -16,7 +16,7 @@ class AnimalCenter(db.Model):
         address (string): The address of animal center.
     """
     id = db.Column(db.Integer, primary_key=True)
-    login = db.Column(db.String(20))
+    login = db.Column(db.String(20), unique=True, index=True)
     password_hash = db.Column(db.String(256))
     address = db.Column(db.String(200))
     animals = db.relationship("Animal", backref="animals")
@@ -48,7 +48,7 @@ class AccessRequest(db.Model):
     :param timestamp: Time when was request.
     """
     id = db.Column(db.Integer, primary_key=True)
-    center_id = db.Column(db.Integer, db.ForeignKey("animal_center.id"))
+    center_id = db.Column(db.Integer, db.ForeignKey("animal_center.id"), index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
@@ -72,6 +72,14 @@ class Animal(db.Model):
     age = db.Column(db.Integer)
     species_id = db.Column(db.Integer, db.ForeignKey("species.id"))
     price = db.Column(db.Float, nullable=True)
+    # serve filters and sort orders of animal listing, rows of every index are also ordered by id,
+    # so keyset pages are ranges of index: species or center with price range or sorted by price
+    # (and min/max price of species), species with age range or sorted by age, price or age alone
+    __table_args__ = (db.Index('ix_animal_species_id_price', 'species_id', 'price'),
+                      db.Index('ix_animal_species_id_age', 'species_id', 'age'),
+                      db.Index('ix_animal_center_id_price', 'center_id', 'price'),
+                      db.Index('ix_animal_price', 'price'),
+                      db.Index('ix_animal_age', 'age'))
 
 
 class Species(db.Model):
@@ -84,6 +92,26 @@ class Species(db.Model):
     :param price (float): Species price.
     """
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(40))
+    name = db.Column(db.String(40), unique=True, index=True)
     description = db.Column(db.String(500), nullable=True)
     price = db.Column(db.Float, nullable=True)
+
+
+class SpeciesStats(db.Model):
+    """
+    Class for creating species_stats table in db.
+    Contains aggregates of animals of each species, dao write methods keep them current,
+    so list of species does not count animals on every request.
+    :param species_id (int): Species id, primary key.
+    :param count_of_animals (int): Count of animals of species.
+    :param count_of_priced (int): Count of animals of species that have price.
+    :param sum_price (float): Sum of prices of animals of species.
+    :param min_price (float): Min price of animals of species.
+    :param max_price (float): Max price of animals of species.
+    """
+    species_id = db.Column(db.Integer, db.ForeignKey("species.id"), primary_key=True)
+    count_of_animals = db.Column(db.Integer, nullable=False, default=0)
+    count_of_priced = db.Column(db.Integer, nullable=False, default=0)
+    sum_price = db.Column(db.Float, nullable=False, default=0)
+    min_price = db.Column(db.Float, nullable=True)
+    max_price = db.Column(db.Float, nullable=True)
@@ -1,15 +1,21 @@
 """Functions that are registered as enpoints in flask application"""
-from app.utils import decorators, schemas, log
-from flask import request, jsonify, Blueprint, current_app
+from functools import partial
+from app.utils import decorators, schemas, log, pagination, metrics, filters, validation, changes, bulk
+from app.utils.hashing import HashingUnavailable
+from flask import request, jsonify, Blueprint, current_app, g
 from flask_jwt_extended import create_access_token, get_jwt_identity
-from app.dao import dao
+from sqlalchemy.exc import IntegrityError
+from app.config import Config
+from app.dao import dao, statements
 
 bp = Blueprint("app", __name__)
 
+animal_validator = validation.compiled(schemas.animal_schema, Config.JSON_VALIDATOR)
+
 
 @bp.after_request
 def add_dao_header(response):
-    response.headers['DAO_TYPE'] = 'SQL' if current_app.config['DAO_SQL'] else "ORM"
+    response.headers['DAO_TYPE'] = current_app.config['DAO_BACKEND'].upper()
     return response
 
 
@@ -18,6 +24,15 @@ def index():
     return "Hello"
 
 
+@bp.route('/metrics', methods=['GET'])
+def metrics_list():
+    """
+    Function that shows metrics of requests, sql statements, cache, audit log and password hashing.
+    :return: Metrics in Prometheus text format.
+    """
+    return current_app.response_class(metrics.registry.render(), content_type='text/plain; version=0.0.4')
+
+
 @bp.route('/login', methods=['GET'])
 def login():
     """
@@ -33,7 +48,10 @@ def login():
     if not user:
         return jsonify(message="No user with such login"), 400
 
-    check = dao.AnimalCenterDAO.check_password(user_password, user['id'])
+    try:
+        check = dao.AnimalCenterDAO.check_password(user_password, user['id'])
+    except HashingUnavailable as error:
+        return jsonify(message=str(error)), 503, {'Retry-After': '1'}
     if not check:
         return jsonify(message="Incorrect password"), 400
     dao.AccessRequestDAO.create_access_request(user['id'])
@@ -42,13 +60,28 @@ def login():
 
 
 @bp.route('/animals', methods=['GET', 'POST'])
+@decorators.etag_for_get(lambda: ['animal'])
 @decorators.jwt_required_for_change
 @decorators.json_validate_for_change(schemas.animal_schema)
 def animals():
+    """
+    Function that show list of animals and add new animal.
+    :return: If method GET, function will return list of animals ordered by id. Query params limit and after
+             return one page of animals and header Link with url of the next page. Query param stream=true
+             streams the whole list without building it in memory. Query params species_id, center_id,
+             min_age, max_age, min_price, max_price filter animals, sort=age or sort=-price changes order.
+             If method POST, function will return short information about created animal.
+    """
     if request.method == 'GET':
-        return jsonify(dao.AnimalDAO.get_animals())
+        try:
+            animal_filters, sort = filters.parse_animal_filters(request.args)
+        except ValueError as error:
+            return jsonify(message=str(error)), 400
+        if pagination.stream_requested():
+            return pagination.stream_encoded_array(dao.AnimalDAO.iter_animals_json(animal_filters, sort))
+        return pagination.paginate(partial(dao.AnimalDAO.get_animals, filters=animal_filters, sort=sort))
     else:
-        data = request.get_json()
+        data = g.data
         user_id = get_jwt_identity()
         if not dao.SpeciesDAO.get_species_inform(data['species_id']):
             return jsonify(message="No such species"), 400
@@ -57,7 +90,33 @@ def animals():
         return jsonify(animal), 201
 
 
+@bp.route('/animals/bulk', methods=['POST'])
+@decorators.jwt_required_for_change
+def animals_bulk():
+    """
+    Function that adds many animals at once. Body is json array of animals or NDJSON
+    (Content-Type: application/x-ndjson) with one animal per line. Every animal is validated
+    by the same schema as in POST /animals, valid animals are inserted in one transaction.
+    :return: Dictionary with count of created and failed animals and list of results in the same order
+             as animals in request. Status is 201 if all animals were created, 207 if some of them failed,
+             400 if none was created.
+    """
+    try:
+        items = bulk.parse_items(request.get_data(as_text=True), request.mimetype,
+                                 current_app.config['BULK_MAX_ITEMS'])
+    except ValueError as error:
+        return jsonify(message=str(error)), 400
+    results, valid = bulk.validate(items, animal_validator)
+    user_id = get_jwt_identity()
+    created = dao.AnimalDAO.add_animals([items[index] for index in valid], user_id) if valid else []
+    body, status, ids = bulk.report(results, valid, created)
+    if ids:
+        log.log_request(request.method, request.url, user_id, 'animal', '{}..{}'.format(ids[0], ids[-1]))
+    return jsonify(body), status
+
+
 @bp.route('/animals/<int:animal_id>', methods=['GET', 'PUT', 'DELETE'])
+@decorators.etag_for_get(lambda animal_id: [('animal', animal_id)])
 @decorators.jwt_required_for_change
 @decorators.json_validate_for_change(schemas.animal_update_schema)
 def animal_inform(animal_id):
@@ -81,24 +140,67 @@ def animal_inform(animal_id):
         log.log_request(request.method, request.url, user_id, 'animal', animal_id)
         return jsonify({'id': animal_id})
     if request.method == 'PUT':
-        data = request.get_json()
-        animal.update(data)
+        data = g.data
+        animal = dict(animal, **data)
         dao.AnimalDAO.update_animal(animal)
         user_id = get_jwt_identity()
         log.log_request(request.method, request.url, user_id, 'animal', animal_id)
         return jsonify(animal)
 
 
+@bp.route('/search', methods=['GET'])
+@decorators.etag_for_get(lambda: ['animal', 'species'])
+def search():
+    """
+    Function that finds animals and species by words of their names and descriptions.
+    :return: List of dictionaries with kind (animal or species), id, name and snippet of matched text
+             with found words highlighted, the best matches first. Query param q is text to find, every
+             word of it should be found. Supports limit and after query params, after needs after_kind,
+             both are in Link header of the next page.
+    """
+    try:
+        query, after_kind = statements.parse_search_args(request.args)
+    except ValueError as error:
+        return jsonify(message=str(error)), 400
+    return pagination.paginate(partial(dao.SearchDAO.search, query, after_kind=after_kind),
+                               cursor=lambda record: {'after': record['id'], 'after_kind': record['kind']})
+
+
+@bp.route('/changes', methods=['GET'])
+def change_feed():
+    """
+    Function that streams changes of animals, species and centers as Server-Sent Events.
+    :return: Stream text/event-stream, data of every event is dictionary with seq, entity (animal, species
+             or center), action (create, update or delete) and id, events of animals also have center_id and
+             species_id, bulk create of animals is one event with list of them as items. Client that reconnects
+             with Last-Event-ID header gets events it missed, or event reset when they are no longer kept.
+             Stream holds thread of server, if there are max_subscribers streams function will return 503.
+    """
+    if not changes.feed.subscribe():
+        return jsonify(message="Too many subscribers"), 503, {'Retry-After': '1'}
+    sequence, chunks = changes.resume(request.headers.get('Last-Event-ID'))
+    response = current_app.response_class(
+        changes.stream(sequence, chunks, current_app.config['CHANGES_HEARTBEAT']), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(changes.feed.unsubscribe)
+    return response
+
+
 @bp.route('/centers', methods=['GET'])
+@decorators.etag_for_get(lambda: ['animal_center'])
 def centers_list():
     """
     Function that view all animal centers.
-    :return: Short information about centers (id and login).
+    :return: Short information about centers (id and login). Supports the same limit, after and stream
+             query params as list of animals.
     """
-    return jsonify(dao.AnimalCenterDAO.get_centers())
+    if pagination.stream_requested():
+        return pagination.stream_encoded_array(dao.AnimalCenterDAO.iter_centers_json())
+    return pagination.paginate(dao.AnimalCenterDAO.get_centers)
 
 
 @bp.route('/centers/<int:center_id>', methods=['GET'])
+@decorators.etag_for_get(lambda center_id: [('animal_center', center_id)])
 def center_inform(center_id):
     """
     Function that show detailed information about animal center.
@@ -112,6 +214,7 @@ def center_inform(center_id):
 
 
 @bp.route('/species', methods=['GET', 'POST'])
+@decorators.etag_for_get(lambda: ['species', 'animal'])
 @decorators.jwt_required_for_change
 @decorators.json_validate_for_change(schemas.species_schema)
 def species():
@@ -125,16 +228,21 @@ def species():
     if request.method == 'GET':
         return jsonify(dao.SpeciesDAO.get_species())
     else:
-        data = request.get_json()
+        data = g.data
         if dao.SpeciesDAO.get_species_by_name(data['name']):
             return jsonify(message="This species is already taken"), 400
-        species = dao.SpeciesDAO.add_species(data)
+        try:
+            species = dao.SpeciesDAO.add_species(data)
+        except IntegrityError:
+            # the same name was added by concurrent request after the check
+            return jsonify(message="This species is already taken"), 400
         user_id = get_jwt_identity()
         log.log_request(request.method, request.url, user_id, 'species', species['id'])
         return jsonify(species), 201
 
 
 @bp.route('/species/<int:species_id>', methods=['GET'])
+@decorators.etag_for_get(lambda species_id: [('species', species_id)])
 def specie_inform(species_id):
     """
     Function that show detailed information about species.
@@ -155,10 +263,16 @@ def registration():
     :return: If user name is already taken function will return "This user name is already taken".
              If registration was successfully function will return "Successfully registered" and access token.
     """
-    data = request.get_json()
+    data = g.data
     if dao.AnimalCenterDAO.get_center_by_login(data['login']):
         return jsonify(message="This user name is already taken"), 400
-    center_id = dao.AnimalCenterDAO.add_center(data)
+    try:
+        center_id = dao.AnimalCenterDAO.add_center(data)
+    except HashingUnavailable as error:
+        return jsonify(message=str(error)), 503, {'Retry-After': '1'}
+    except IntegrityError:
+        # the same login was registered by concurrent request after the check
+        return jsonify(message="This user name is already taken"), 400
 
     dao.AccessRequestDAO.create_access_request(center_id)
 
@@ -0,0 +1,173 @@
+"""Admission control of requests of routes blueprint. Every route class (reads, writes, login and
+registration) has its own cap of requests served at once, the next requests wait for place at most
+queue_timeout seconds and are shed with 503 and Retry-After after that, so under overload latency
+of admitted requests stays bounded instead of every request waiting for SQLite locks and hashing.
+Optional token buckets limit requests of every client (identity of JWT or address), those are refused with 429."""
+
+from collections import OrderedDict
+from math import ceil
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended.config import config
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from app.config import Config
+from app.utils import jwt_cache
+
+ROUTE_CLASSES = ('read', 'write', 'auth')
+# login and registration hash passwords, so they have their own cap whatever method they use
+AUTH_ENDPOINTS = ('app.login', 'app.registration')
+# metrics are served under overload too, they show that requests are shed;
+# streams of changes are open for long time, their count is capped by [changes] max_subscribers
+EXEMPT_ENDPOINTS = ('app.metrics_list', 'app.change_feed')
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def route_class(endpoint, method):
+    """:return: Class of route from ROUTE_CLASSES."""
+    if endpoint in AUTH_ENDPOINTS:
+        return 'auth'
+    return 'read' if method in READ_METHODS else 'write'
+
+
+class AdmissionController:
+    """
+    Service that decides whether request is served now, after short wait or is shed.
+    :param limits: Dictionary of route class and max count of its requests served at once, 0 means no limit.
+    :param queue_timeout: Max seconds request waits for place of its class.
+    :param max_queue: Max count of requests of one class that wait at once, next ones are shed
+                      without waiting, 0 means no limit.
+    :param retry_after: Seconds in Retry-After header of shed requests.
+    :param rate: Requests per second that every client can make, 0 means no limit.
+    :param burst: Count of requests client can make at once after it was idle.
+    :param max_clients: How many token buckets are kept, bucket of least recently seen client is dropped.
+    """
+
+    def __init__(self, limits=None, queue_timeout=0.5, max_queue=0, retry_after=1, rate=0.0, burst=10,
+                 max_clients=10000):
+        self.limits = {name: (limits or {}).get(name, 0) for name in ROUTE_CLASSES}
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._slots = {name: BoundedSemaphore(limit) for name, limit in self.limits.items() if limit}
+        self._counts = {name: {'in_flight': 0, 'waiting': 0, 'admitted': 0, 'shed': 0} for name in ROUTE_CLASSES}
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+        self.rate_limited = 0
+
+    def admit(self, route):
+        """
+        Function that takes place for request of route class, waits for it at most queue_timeout.
+        :return: True if request is admitted, then release must be called when it is served, False if it is shed.
+        """
+        slots = self._slots.get(route)
+        counts = self._counts[route]
+        with self._lock:
+            if slots is None or slots.acquire(blocking=False):
+                counts['in_flight'] += 1
+                counts['admitted'] += 1
+                return True
+            if self.max_queue and counts['waiting'] >= self.max_queue:
+                counts['shed'] += 1
+                return False
+            counts['waiting'] += 1
+        admitted = slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            counts['waiting'] -= 1
+            counts['in_flight' if admitted else 'shed'] += 1
+            counts['admitted'] += admitted
+        return admitted
+
+    def release(self, route):
+        """Function that gives place of served request of route class to the next one."""
+        with self._lock:
+            self._counts[route]['in_flight'] -= 1
+        if route in self._slots:
+            self._slots[route].release()
+
+    def take_token(self, client):
+        """
+        Function that takes token from bucket of client, bucket gets rate tokens every second
+        and holds at most burst tokens.
+        :return: 0 if request of client is allowed, otherwise seconds until client gets the next token.
+        """
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = monotonic()
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            self._buckets[client] = (tokens - 1 if tokens >= 1 else tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            if tokens >= 1:
+                return 0
+            self.rate_limited += 1
+            return (1 - tokens) / self.rate
+
+    def stats(self):
+        """
+        Function that reports state of admission.
+        :return: Dictionary with count of requests in flight, waiting, admitted and shed of every route class,
+                 count of requests refused by rate limit and count of clients with token bucket.
+        """
+        with self._lock:
+            result = {'{}_{}'.format(route, key): value
+                      for route, counts in self._counts.items() for key, value in counts.items()}
+            result['rate_limited'] = self.rate_limited
+            result['clients'] = len(self._buckets)
+            return result
+
+
+controller = AdmissionController({'read': Config.ADMISSION_READ_LIMIT, 'write': Config.ADMISSION_WRITE_LIMIT,
+                                  'auth': Config.ADMISSION_AUTH_LIMIT},
+                                 Config.ADMISSION_QUEUE_TIMEOUT, Config.ADMISSION_MAX_QUEUE,
+                                 Config.ADMISSION_RETRY_AFTER, Config.ADMISSION_RATE, Config.ADMISSION_BURST,
+                                 Config.ADMISSION_MAX_CLIENTS)
+
+
+def client_key():
+    """:return: Identity of valid JWT of request, or address of client when request has no valid token."""
+    if request.headers.get(config.header_name):
+        try:
+            # token is verified once, jwt_required_for_change of view takes it from cache of verified tokens
+            jwt_cache.verify_jwt_in_request_cached()
+            return 'identity:{}'.format(get_jwt_identity())
+        except (JWTExtendedException, PyJWTError):
+            pass
+    return 'address:{}'.format(request.remote_addr)
+
+
+def _refuse(message, status, retry_after):
+    return jsonify(message=message), status, {'Retry-After': str(max(1, ceil(retry_after)))}
+
+
+def _before_request():
+    if request.blueprint != 'app' or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    wait = controller.take_token(client_key()) if controller.rate else 0
+    if wait:
+        return _refuse('Too many requests', 429, wait)
+    route = route_class(request.endpoint, request.method)
+    if not controller.admit(route):
+        return _refuse('Server is overloaded, try again later', 503, controller.retry_after)
+    g.admitted_route = route
+    return None
+
+
+def _teardown_request(exception):
+    # streamed responses are finished only here, so place is held while the whole body is sent
+    route = g.pop('admitted_route', None)
+    if route is not None:
+        controller.release(route)
+
+
+def init_app(app):
+    """Function that admits requests of routes blueprint of application by controller of this module."""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,70 @@
+"""Body of POST /animals/bulk: parsing, validation of every animal and report of results.
+Flask route and async app only read body and insert valid animals, the rest is here."""
+
+import json
+
+NDJSON_TYPE = 'application/x-ndjson'
+
+
+def parse_items(body, mimetype, max_items):
+    """
+    Function that reads animals from body: json array, or NDJSON with one animal per line.
+    :param body: Text of body.
+    :param mimetype: Mime type of body without params.
+    :return: List of animals, lines of NDJSON that are not json are None.
+    :raise ValueError: With message for client if body is not array, it is empty or has more than max_items animals.
+    """
+    if mimetype == NDJSON_TYPE:
+        items = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(None)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            raise ValueError('Json array of animals is required')
+    if not items:
+        raise ValueError('No animals')
+    if len(items) > max_items:
+        raise ValueError('Too many animals, max is {}'.format(max_items))
+    return items
+
+
+def validate(items, validator):
+    """
+    Function that checks every animal by validator of animal schema.
+    :return: Tuple (results, valid). Results has error for every invalid animal and None for valid ones,
+             valid is list of indexes of valid animals.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        error = validator.first_error(item) if item is not None else 'Failed to decode JSON object'
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'message': str(getattr(error, 'message', error))}
+        else:
+            valid.append(index)
+    return results, valid
+
+
+def report(results, valid, created):
+    """
+    Function that adds animals created by dao add_animals to results of validate.
+    :param created: Result of add_animals for valid animals, None for animals with unknown species.
+    :return: Tuple (body, status, ids of created animals). Status is 201 if all animals were created,
+             207 if some of them failed, 400 if none was created.
+    """
+    for index, animal in zip(valid, created):
+        if animal:
+            results[index] = dict(animal, index=index, status='created')
+        else:
+            results[index] = {'index': index, 'status': 'error', 'message': 'No such species'}
+    ids = [animal['id'] for animal in created if animal]
+    status = 201 if len(ids) == len(results) else 207 if ids else 400
+    return {'created': len(ids), 'failed': len(results) - len(ids), 'results': results}, status, ids
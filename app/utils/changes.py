@@ -0,0 +1,235 @@
+"""Feed of changes that dao write methods publish: created, updated and deleted animals, created species
+and centers. GET /changes streams them as Server-Sent Events, so dashboards learn about changes instead of
+polling listings. Every event has sequence number, the last `backlog` events are kept in memory, so client
+that reconnects with Last-Event-ID gets events it missed. Event id contains token of process,
+events of other process or of process before restart can't be resumed and client gets
+event reset (it should reload listings) instead.
+
+Feed is in memory of process and has only changes made by this process, writes of other worker processes,
+of CLI and of fill_db.py are not published, so the feed is complete only with single worker.
+
+One feed wakes all subscribers: flask streams wait on one condition, async streams wait on one event
+of their event loop, so no queue is made for every client. Flask stream still holds thread of server
+for its whole life, so streams of flask application are capped by max_subscribers, which must be well under
+count of threads of worker, async streams hold no thread and have their own cap.
+
+Bulk create is published as one event with items, so it does not push other events out of backlog."""
+
+import asyncio
+import json
+import os
+from collections import deque
+from threading import Condition
+from time import time
+from app.config import Config
+
+ENTITIES = ('animal', 'species', 'center')
+ACTIONS = ('create', 'update', 'delete')
+# fields of entities that events carry, clients read the rest from api
+ANIMAL_FIELDS = ('id', 'center_id', 'species_id')
+# milliseconds that EventSource of browser waits before it reconnects
+RETRY_MS = 1000
+# part of event ids that is unique for process, events are kept only in memory of process
+token = '{:x}-{:x}'.format(os.getpid(), int(time() * 1000))
+
+
+class ChangeFeed:
+    """
+    Broadcaster of changes.
+    :param backlog: How many of the last events are kept for clients that resume.
+    :param max_subscribers: Max count of open streams, 0 means no limit.
+    """
+
+    def __init__(self, backlog=1000, max_subscribers=0):
+        self.max_subscribers = max_subscribers
+        self.sequence = 0
+        self.subscribers = 0
+        self.rejected = 0
+        self.resets = 0
+        self._events = deque(maxlen=backlog)
+        self._condition = Condition()
+        # event loop of async streams and asyncio.Event they wait on, it is set and dropped by publish
+        self._loop_events = {}
+
+    def publish(self, entity, action, *changes, batch=False):
+        """
+        Function that adds events for changed entities and wakes subscribers.
+        :param entity: One of ENTITIES.
+        :param action: One of ACTIONS.
+        :param changes: Dictionaries with id and other fields of changed entities, None values are skipped.
+        :param batch: True to add one event with list of changes as items instead of event for every change.
+        :return: Sequence number of the last event.
+        """
+        changes = [change for change in changes if change]
+        if batch:
+            changes = [{'items': changes}] if changes else []
+        with self._condition:
+            for change in changes:
+                self.sequence += 1
+                self._events.append(dict(change, seq=self.sequence, entity=entity, action=action))
+            self._condition.notify_all()
+            loops = list(self._loop_events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake, loop)
+            except RuntimeError:  # loop is closed
+                with self._condition:
+                    self._loop_events.pop(loop, None)
+        return self.sequence
+
+    def after(self, sequence):
+        """
+        Function that returns events published after event with sequence number.
+        :return: List of events, or None if some of them are no longer kept (or sequence is unknown).
+        """
+        with self._condition:
+            return self._after(sequence)
+
+    def wait(self, sequence, timeout):
+        """
+        Function that waits at most timeout seconds for events after sequence number.
+        :return: The same as after(), empty list when nothing was published in time.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence != sequence, timeout)
+            return self._after(sequence)
+
+    async def wait_async(self, sequence, timeout):
+        """The same as wait, but event loop is not blocked while stream waits."""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self.sequence != sequence:
+                return self._after(sequence)
+            event = self._loop_events.get(loop)
+            if event is None:
+                event = self._loop_events[loop] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.after(sequence)
+
+    def reset(self):
+        """
+        Function that counts client that can't get events it missed, it starts from the last event.
+        :return: Sequence number of the last event.
+        """
+        with self._condition:
+            self.resets += 1
+            return self.sequence
+
+    def subscribe(self, max_subscribers=None):
+        """
+        Function that takes place for new stream.
+        :param max_subscribers: Cap of this kind of streams, max_subscribers of feed when it is None.
+        :return: False if there are max_subscribers streams already, otherwise unsubscribe must be called
+                 when stream is closed.
+        """
+        if max_subscribers is None:
+            max_subscribers = self.max_subscribers
+        with self._condition:
+            if max_subscribers and self.subscribers >= max_subscribers:
+                self.rejected += 1
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+    def stats(self):
+        """
+        Function that reports state of feed.
+        :return: Dictionary with sequence number of the last event, count of kept events, open streams,
+                 streams rejected because of max_subscribers and resets sent to clients that fell behind.
+        """
+        with self._condition:
+            return {'sequence': self.sequence,
+                    'backlog': len(self._events),
+                    'subscribers': self.subscribers,
+                    'rejected': self.rejected,
+                    'resets': self.resets}
+
+    def _after(self, sequence):
+        if sequence > self.sequence or self._events and sequence < self._events[0]['seq'] - 1 \
+                or not self._events and sequence < self.sequence:
+            return None
+        return [event for event in self._events if event['seq'] > sequence]
+
+    def _wake(self, loop):
+        with self._condition:
+            event = self._loop_events.pop(loop, None)
+        if event is not None:
+            event.set()
+
+
+feed = ChangeFeed(Config.CHANGES_BACKLOG, Config.CHANGES_MAX_SUBSCRIBERS)
+
+
+def animals_changed(action, *animals, batch=False):
+    """
+    Function that publishes events of animals.
+    :param animals: Dictionaries with id, center_id and species_id of animals, None values are skipped.
+    :param batch: True to publish them as one event, see ChangeFeed.publish.
+    """
+    feed.publish('animal', action, *[{key: animal[key] for key in ANIMAL_FIELDS} for animal in animals if animal],
+                 batch=batch)
+
+
+def format_event(event):
+    """:return: Event in Server-Sent Events format, its id is token of process and sequence number."""
+    return 'id: {}:{}\ndata: {}\n\n'.format(token, event['seq'],
+                                            json.dumps(event, separators=(',', ':'), sort_keys=True))
+
+
+def format_reset(sequence):
+    """:return: Event that tells client that it missed events and should reload listings."""
+    return 'id: {}:{}\nevent: reset\ndata: {}\n\n'.format(token, sequence,
+                                                          json.dumps({'seq': sequence}, separators=(',', ':')))
+
+
+def resume(last_event_id):
+    """
+    Function that finds where stream of client starts.
+    :param last_event_id: Value of Last-Event-ID header or None for new client.
+    :return: Tuple (sequence number that stream continues after, chunks to send first): reconnection delay
+             and events that client missed, or reset if they can't be resumed.
+    """
+    chunks = ['retry: {}\n\n'.format(RETRY_MS)]
+    if not last_event_id:
+        return feed.sequence, chunks
+    process, _, number = last_event_id.rpartition(':')
+    if process == token and number.isdigit():
+        missed = feed.after(int(number))
+        if missed is not None:
+            return (missed[-1]['seq'] if missed else int(number)), chunks + [format_event(event) for event in missed]
+    sequence = feed.reset()
+    return sequence, chunks + [format_reset(sequence)]
+
+
+def next_chunk(sequence, events):
+    """
+    Function that turns result of ChangeFeed.wait into chunk of stream.
+    :return: Tuple (sequence number that stream continues after, chunk), chunk is comment when there are
+             no events, so dead connections are found.
+    """
+    if events is None:
+        sequence = feed.reset()
+        return sequence, format_reset(sequence)
+    if not events:
+        return sequence, ': ping\n\n'
+    return events[-1]['seq'], ''.join(format_event(event) for event in events)
+
+
+def stream(sequence, chunks, heartbeat):
+    """
+    Generator of Server-Sent Events for flask response.
+    :param sequence: Sequence number of the last event client has.
+    :param chunks: Chunks that are sent first, see resume().
+    :param heartbeat: Seconds between comments that are sent when nothing changes.
+    """
+    yield ''.join(chunks)
+    while True:
+        sequence, chunk = next_chunk(sequence, feed.wait(sequence, heartbeat))
+        yield chunk
@@ -0,0 +1,200 @@
+"""Compression of responses: gzip, and brotli when it is installed (optional dependency).
+Encoding is negotiated by Accept-Encoding, bodies smaller than min_size are sent as they are.
+Compressed bodies of responses with ETag are kept in memory by digest of uncompressed body, so repeated
+polls of unchanged listings are not compressed again and kept body is never sent for other content."""
+
+import gzip
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, thread_time
+from flask import request
+from app.config import Config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - only gzip is offered then
+    brotli = None
+
+# content types that are worth compressing, json listings are the main part of traffic
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def parse_accept_encoding(header):
+    """
+    Function that reads Accept-Encoding header.
+    :return: Dictionary of encoding and its quality, e.g. {'gzip': 1.0, 'br': 0.5}.
+    """
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+class Compressor:
+    """
+    Service that compresses bodies of responses.
+    :param min_size: Bodies smaller than this count of bytes are not compressed.
+    :param gzip_level: Level of gzip from 1 (fast) to 9 (small).
+    :param brotli_quality: Quality of brotli from 0 (fast) to 11 (small).
+    :param cpu_budget: Max seconds of cpu that compression takes per second, 0 means no limit.
+                       When budget is spent, bodies are sent uncompressed until it is refilled,
+                       cached bodies are still sent compressed.
+    :param cache_max_entries: How many compressed bodies are kept at once.
+    :param cache_max_bytes: Max total size of kept compressed bodies.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, cpu_budget=0.0,
+                 cache_max_entries=256, cache_max_bytes=32 * 1024 * 1024):
+        self.min_size = min_size
+        self.cpu_budget = cpu_budget
+        self.cache_max_entries = cache_max_entries
+        self.cache_max_bytes = cache_max_bytes
+        # encodings in order of preference when client accepts several of them with the same quality
+        self.encoders = OrderedDict()
+        if brotli is not None:  # pragma: no cover - brotli is optional
+            self.encoders['br'] = lambda body: brotli.compress(body, quality=brotli_quality)
+        self.encoders['gzip'] = lambda body: gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._credit = cpu_budget
+        self._refilled = monotonic()
+        self._lock = Lock()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        self.over_budget = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def choose_encoding(self, accept_encoding):
+        """
+        Function that chooses encoding that client accepts with the highest quality.
+        :param accept_encoding: Value of Accept-Encoding header.
+        :return: Name of encoding or None if body should be sent as it is.
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_quality = None, 0.0
+        for name in self.encoders:
+            quality = accepted.get(name, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compress(self, body, accept_encoding, cache=False):
+        """
+        Function that compresses body with encoding that client accepts.
+        :param body: Bytes of response.
+        :param cache: If True, compressed body is kept by digest of body and encoding and returned
+                      next time the same body is compressed, e.g. for listings that clients poll.
+        :return: Tuple (encoding, bytes), encoding is None if body was not compressed.
+        """
+        if len(body) < self.min_size:
+            return None, body
+        encoding = self.choose_encoding(accept_encoding)
+        if encoding is None:
+            return None, body
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding) if cache else None
+        if key is not None:
+            with self._lock:
+                compressed = self._cache.get(key)
+                if compressed is not None:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return encoding, compressed
+                self.cache_misses += 1
+        if not self._take_credit():
+            return None, body
+        start = thread_time()
+        compressed = self.encoders[encoding](body)
+        elapsed = thread_time() - start
+        with self._lock:
+            self._credit -= elapsed
+            self.compressed += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(compressed)
+            self.cpu_seconds += elapsed
+            if key is not None and len(compressed) <= self.cache_max_bytes:
+                self._keep(key, compressed)
+        return encoding, compressed
+
+    def stats(self):
+        """
+        Function that reports how much compression saves and costs.
+        :return: Dictionary with count of compressed bodies, bytes before and after compression, their ratio,
+                 cpu seconds spent, count of bodies sent uncompressed because of cpu budget and cache stats.
+        """
+        with self._lock:
+            return {'compressed': self.compressed,
+                    'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out,
+                    'ratio': self.bytes_out / self.bytes_in if self.bytes_in else 0.0,
+                    'cpu_seconds': self.cpu_seconds,
+                    'over_budget': self.over_budget,
+                    'cache_hits': self.cache_hits,
+                    'cache_misses': self.cache_misses,
+                    'cache_size': len(self._cache),
+                    'cache_bytes': self._cache_bytes}
+
+    def _take_credit(self):
+        """Checks cpu budget, credit grows by cpu_budget every second and can't be bigger than cpu_budget."""
+        if not self.cpu_budget:
+            return True
+        with self._lock:
+            now = monotonic()
+            self._credit = min(self.cpu_budget, self._credit + (now - self._refilled) * self.cpu_budget)
+            self._refilled = now
+            if self._credit > 0:
+                return True
+            self.over_budget += 1
+            return False
+
+    def _keep(self, key, compressed):
+        if key in self._cache:
+            self._cache_bytes -= len(self._cache.pop(key))
+        self._cache[key] = compressed
+        self._cache_bytes += len(compressed)
+        while len(self._cache) > self.cache_max_entries or self._cache_bytes > self.cache_max_bytes:
+            self._cache_bytes -= len(self._cache.popitem(last=False)[1])
+
+
+compressor = Compressor(Config.COMPRESSION_MIN_SIZE, Config.COMPRESSION_GZIP_LEVEL, Config.COMPRESSION_BROTLI_QUALITY,
+                        Config.COMPRESSION_CPU_BUDGET, Config.COMPRESSION_CACHE_MAX_ENTRIES,
+                        Config.COMPRESSION_CACHE_MAX_BYTES)
+
+
+def compressible(content_type):
+    return (content_type or '').startswith(COMPRESSIBLE_TYPES)
+
+
+def _after_request(response):
+    if not 200 <= response.status_code < 300 or response.status_code == 204 or response.direct_passthrough \
+            or response.is_streamed or 'Content-Encoding' in response.headers \
+            or not compressible(response.mimetype):
+        # streamed listings are sent chunk by chunk as they are read from database
+        return response
+    response.vary.add('Accept-Encoding')
+    # responses with ETag are listings and entities that clients poll, their bodies are kept
+    encoding, body = compressor.compress(response.get_data(), request.headers.get('Accept-Encoding'),
+                                         cache='ETag' in response.headers)
+    if encoding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Function that compresses responses of application by compressor of this module."""
+    app.after_request(_after_request)
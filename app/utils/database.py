@@ -0,0 +1,103 @@
+"""SQLite tuning: pragmas on every new connection, pooled connections and separate pool of
+read-only connections, which read-only dao methods use, so reads do not wait for writes."""
+
+import sqlite3
+from flask import _app_ctx_stack
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import create_engine, orm
+from sqlalchemy.pool import QueuePool
+
+
+def connector(database, pragmas, read_only=False):
+    """
+    Function that builds creator of sqlite connections for engine.
+    :param database: Absolute path of database file.
+    :param pragmas: Dictionary of pragmas that are set on every new connection.
+    :param read_only: If True, file is opened in read-only mode. Journal mode is not set then,
+                      because it is stored in database file by writing connection.
+    :return: Function without arguments that returns new connection.
+    """
+    def connect():
+        if read_only:
+            connection = sqlite3.connect('file:{}?mode=ro'.format(database), uri=True, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(database, check_same_thread=False)
+        for name, value in pragmas.items():
+            if not (read_only and name == 'journal_mode'):
+                connection.execute('PRAGMA {} = {}'.format(name, value))
+        return connection
+    return connect
+
+
+def begin_immediate(connection):
+    """
+    Function that takes write lock of database for transaction of sqlalchemy connection, so rows that are
+    read in it can't be changed by other writers before commit. sqlite3 module begins transaction only
+    before the first write, without it rows read first would be read outside of transaction.
+    Nothing is done when transaction has already written.
+    """
+    if not connection.connection.connection.in_transaction:
+        connection.execute('BEGIN IMMEDIATE')
+
+
+def is_file(url):
+    return url.drivername == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+class TunedSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension that applies SQLITE_PRAGMAS of application config to every new
+    connection of file database and keeps SQLITE_POOL_SIZE connections open (SQLITE_MAX_OVERFLOW
+    more are opened when they are busy, 0 pool size opens connection for every checkout).
+    It has read_session and get_read_engine() for read-only queries. With SQLITE_READ_ONLY_POOL they use
+    separate pool of read-only connections sized by SQLITE_READ_POOL_SIZE and SQLITE_READ_MAX_OVERFLOW,
+    otherwise the same engine as writes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # autocommit session returns connection to pool after every query instead of keeping transaction open
+        self.read_session = orm.scoped_session(
+            lambda: SignallingSession(self, autocommit=True, bind=self.get_read_engine(), binds={}),
+            scopefunc=_app_ctx_stack.__ident_func__)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLITE_PRAGMAS', {})
+        app.config.setdefault('SQLITE_POOL_SIZE', 0)
+        app.config.setdefault('SQLITE_MAX_OVERFLOW', 10)
+        app.config.setdefault('SQLITE_READ_ONLY_POOL', False)
+        app.config.setdefault('SQLITE_READ_POOL_SIZE', 5)
+        app.config.setdefault('SQLITE_READ_MAX_OVERFLOW', 10)
+        super().init_app(app)
+
+        @app.teardown_appcontext
+        def remove_read_session(exception):
+            self.read_session.remove()
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+        if is_file(sa_url):
+            options['creator'] = connector(sa_url.database, app.config['SQLITE_PRAGMAS'])
+            if app.config['SQLITE_POOL_SIZE']:
+                options.update(poolclass=QueuePool, pool_size=app.config['SQLITE_POOL_SIZE'],
+                               max_overflow=app.config['SQLITE_MAX_OVERFLOW'])
+
+    def get_read_engine(self, app=None):
+        """:return: Engine of read-only connections for database of application."""
+        app = self.get_app(app)
+        engine = self.get_engine(app)
+        if not app.config['SQLITE_READ_ONLY_POOL'] or not is_file(engine.url):
+            return engine
+        state = get_state(app)
+        with self._engine_lock:
+            # read engine is made again when application is switched to other database
+            write_engine, read_engine = getattr(state, 'read_engine', (None, None))
+            if write_engine is not engine:
+                if read_engine is not None:
+                    read_engine.dispose()
+                read_engine = create_engine(
+                    'sqlite://', poolclass=QueuePool, pool_size=app.config['SQLITE_READ_POOL_SIZE'],
+                    max_overflow=app.config['SQLITE_READ_MAX_OVERFLOW'],
+                    creator=connector(engine.url.database, app.config['SQLITE_PRAGMAS'], read_only=True))
+                state.read_engine = (engine, read_engine)
+            return read_engine
@@ -1,9 +1,9 @@
 """Useful decorators"""
 
-from flask import request
+from flask import request, current_app, g, abort
 from functools import wraps
-from flask_jwt_extended import verify_jwt_in_request
-from flask_expects_json import expects_json
+from app.config import Config
+from app.utils import versions, validation, jwt_cache
 
 
 def jwt_required_for_change(func):
@@ -11,12 +11,13 @@ def jwt_required_for_change(func):
     requests jwt token verification will be performed.
     If request is of type POST, PUT or DELETE, the jwt from request header
     will be extracted and verified. GET's requests jwt token is not verified
-    and not required.
+    and not required. Signature of token that was verified before is not
+    checked again until token expires, see jwt_cache.
     """
     @wraps(func)
     def wrapped(*args, **kwargs):
         if request.method in ['POST', 'PUT', 'DELETE']:
-            verify_jwt_in_request()
+            jwt_cache.verify_jwt_in_request_cached()
         return func(*args, **kwargs)
     return wrapped
 
@@ -25,13 +26,57 @@ def json_validate_for_change(schema):
     """This decorator validates json body by certain schema. Json body is
     required for PUT and POST requests. If json validation fails, the response
     will be 400 BAD REQUEST. Other than PUT and POST requests are not checked
-    for json and it's correctness
+    for json and it's correctness. Validator is compiled once, when view is
+    decorated, and body is parsed once and given to view as g.data.
     """
+    validator = validation.compiled(schema, Config.JSON_VALIDATOR)
+
     def inner_function(func):
         @wraps(func)
         def wrapped(*args, **kwargs):
             if request.method in ['POST', 'PUT']:
-                return expects_json(schema)(func)(*args, **kwargs)
+                data = request.get_json()
+                if data is None:
+                    return abort(400, 'Failed to decode JSON object')
+                error = validator.first_error(data)
+                if error is not None:
+                    return abort(400, error)
+                g.data = data
             return func(*args, **kwargs)
         return wrapped
     return inner_function
+
+
+def etag_for_get(version_keys):
+    """This decorator makes GET requests conditional. ETag and Last-Modified
+    are built from versions (kept in database) of tables and entities that response
+    depends on, so if client already has current version (If-None-Match or
+    If-Modified-Since), response will be 304 NOT MODIFIED and view will not be
+    called at all. ETag is weak, body of the same version is sent compressed or not.
+    Version is given to view as g.version, so cached dao results of older version are not used.
+    Other than GET requests are not changed.
+    :param version_keys: Function that takes view arguments and returns list of
+                         version keys, for example ['animal'] or [('species', 1)].
+    """
+    def inner_function(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET':
+                return func(*args, **kwargs)
+            etag, modified = versions.current(*version_keys(**kwargs))
+            if versions.not_modified(etag, modified, request.headers.get('If-None-Match'),
+                                     request.headers.get('If-Modified-Since')):
+                response = current_app.response_class(status=304)
+            else:
+                # cached dao results are used only if they were loaded at this version
+                g.version = etag
+                try:
+                    response = current_app.make_response(func(*args, **kwargs))
+                finally:
+                    g.pop('version', None)
+                if response.status_code != 200:
+                    return response
+            response.headers.update(versions.headers(etag, modified))
+            return response
+        return wrapped
+    return inner_function
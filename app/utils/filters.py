@@ -0,0 +1,63 @@
+"""Filtering and sorting params of GET /animals and order in which sorted listing is read by keyset"""
+
+# query params that filter animals, columns they compare and types of their values
+ANIMAL_FILTERS = {'species_id': ('species_id', int), 'center_id': ('center_id', int),
+                  'min_age': ('age', int), 'max_age': ('age', int),
+                  'min_price': ('price', float), 'max_price': ('price', float)}
+# columns that animals can be sorted by, every one of them is the first column of some index
+ANIMAL_SORT_COLUMNS = ('id', 'age', 'price')
+DEFAULT_SORT = ('id', False)
+
+
+def parse_animal_filters(args):
+    """
+    Function that reads filters and sort order of animals from query params.
+    :param args: Mapping of query params, e.g. species_id=2&min_price=10&sort=-price.
+    :return: Tuple (filters, sort). Filters is dictionary of given params from ANIMAL_FILTERS with
+             converted values, sort is tuple (column, descending), '-' before column means descending order.
+    :raise ValueError: If value of filter can not be converted or sort column is not in ANIMAL_SORT_COLUMNS.
+    """
+    filters = {}
+    for name, (_, convert) in ANIMAL_FILTERS.items():
+        value = args.get(name)
+        if value is None:
+            continue
+        try:
+            filters[name] = convert(value)
+        except ValueError:
+            raise ValueError("Parameter '{}' should be {}".format(name, 'integer' if convert is int else 'number'))
+        if filters[name] != filters[name] or filters[name] in (float('inf'), float('-inf')):
+            raise ValueError("Parameter '{}' should be finite number".format(name))
+    sort = args.get('sort')
+    if sort is None:
+        return filters, DEFAULT_SORT
+    column = sort[1:] if sort.startswith('-') else sort
+    if column not in ANIMAL_SORT_COLUMNS:
+        raise ValueError("Animals can be sorted only by: {}".format(', '.join(ANIMAL_SORT_COLUMNS)))
+    return filters, (column, sort.startswith('-'))
+
+
+def sort_segments(sort, after=None, after_value=None, filters=()):
+    """
+    Function that plans how sorted listing is read by keyset. Animals without value of sort column
+    are before the others in ascending order and after them in descending order, like sqlite sorts NULL.
+    Animals with and without value are read by separate queries (segments), so every query is
+    a range of index.
+    :param sort: Tuple (column, descending).
+    :param after: Id of last animal of previous page or None for the first page.
+    :param after_value: Value of sort column of that animal.
+    :param filters: Names of filters, animals without value are not read when sort column is filtered by range.
+    :return: List of tuples (segment, bounded) in order of reading. Segment is None for sorting by id,
+             'null' for animals without value and 'value' for animals with value. Bounded is True when
+             segment starts after the last animal of previous page.
+    """
+    column, descending = sort
+    if column == 'id':
+        return [(None, after is not None)]
+    order = ['value', 'null'] if descending else ['null', 'value']
+    if any(ANIMAL_FILTERS[name][0] == column for name in filters):
+        order.remove('null')
+    if after is None:
+        return [(segment, False) for segment in order]
+    start = order.index('null' if after_value is None and 'null' in order else 'value')
+    return [(order[start], True)] + [(segment, False) for segment in order[start + 1:]]
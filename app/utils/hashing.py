@@ -0,0 +1,114 @@
+"""Password hashing service that runs PBKDF2 in worker pool instead of request thread"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from os import cpu_count
+from threading import BoundedSemaphore, Lock
+from werkzeug import security
+from app.config import Config
+
+
+class HashingUnavailable(Exception):
+    """Raised when there are too many passwords waiting for hashing or hashing took too long"""
+
+
+class PasswordHasher:
+    """
+    Service that hashes and checks passwords.
+    :param mode: 'inline' - hash in caller thread, 'thread' - in thread pool (hashlib releases GIL while
+                 hashing, so other requests are not stalled), 'process' - in process pool.
+    :param workers: Size of pool, 0 means count of cpu.
+    :param max_pending: Max count of passwords that are hashed or wait in queue, next ones are rejected,
+                        0 means no limit.
+    :param timeout: Max seconds caller waits for result.
+    """
+
+    def __init__(self, mode='thread', workers=0, max_pending=64, timeout=5.0):
+        self.mode = mode
+        self.workers = workers or cpu_count() or 1
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._slots = BoundedSemaphore(max_pending) if max_pending else None
+        self._executor = None
+        self._lock = Lock()
+        self.rejected = 0
+        self.timeouts = 0
+
+    def generate_password_hash(self, password):
+        return self._run(security.generate_password_hash, password)
+
+    def check_password_hash(self, pwhash, password):
+        return self._run(security.check_password_hash, pwhash, password)
+
+    async def generate_password_hash_async(self, password):
+        """The same as generate_password_hash, but event loop is not blocked while password is hashed."""
+        return await self._run_async(security.generate_password_hash, password)
+
+    async def check_password_hash_async(self, pwhash, password):
+        """The same as check_password_hash, but event loop is not blocked while password is hashed."""
+        return await self._run_async(security.check_password_hash, pwhash, password)
+
+    def stats(self):
+        """
+        Function that reports state of service.
+        :return: Dictionary with count of rejected and timed out hashings.
+        """
+        return {'rejected': self.rejected, 'timeouts': self.timeouts}
+
+    def _get_executor(self):
+        # pool is created on first use, so it is not inherited by forked worker processes
+        with self._lock:
+            if self._executor is None:
+                executor_class = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+                self._executor = executor_class(max_workers=self.workers)
+            return self._executor
+
+    def _submit(self, func, *args):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingUnavailable('Too many passwords are being hashed')
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def _timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        return HashingUnavailable('Password hashing took too long')
+
+    def _run(self, func, *args):
+        if self.mode == 'inline':
+            return func(*args)
+        try:
+            return self._submit(func, *args).result(self.timeout)
+        except TimeoutError:
+            raise self._timed_out()
+
+    async def _run_async(self, func, *args):
+        if self.mode == 'inline':
+            return func(*args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self._submit(func, *args)), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+
+
+hasher = PasswordHasher(Config.HASHING_MODE, Config.HASHING_WORKERS, Config.HASHING_MAX_PENDING,
+                        Config.HASHING_TIMEOUT)
+
+
+def generate_password_hash(password):
+    return hasher.generate_password_hash(password)
+
+
+def check_password_hash(pwhash, password):
+    return hasher.check_password_hash(pwhash, password)
@@ -0,0 +1,105 @@
+"""JSON encoders of application. Encoder is chosen by name from ENCODERS ([json] encoder in config.ini):
+'fast' encodes with orjson when it is installed and gives the same bytes as 'stdlib' flask encoder.
+RowEncoder encodes database rows straight to json objects, without building dictionaries."""
+
+from json.encoder import encode_basestring_ascii, INFINITY
+from math import isfinite
+from flask import json
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib encoder is used then
+    orjson = None
+
+# orjson writes floats like 1e16, 1e-07 and 0.00001 and characters out of ascii differently from stdlib json,
+# output with any of them is encoded again by stdlib to keep responses the same in both modes.
+# Substring checks are much faster than regular expression on big listings, they can also find such
+# text inside strings, which only means that stdlib encodes them
+_STDLIB_ONLY = tuple(b'e' + char for char in (b'-', b'1', b'2', b'3', b'4', b'5', b'6', b'7', b'8', b'9')) + \
+    (b'0.0000', b'\x7f')
+_ORJSON_OPTIONS = 0 if orjson is None else \
+    orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class FastJSONEncoder(JSONEncoder):
+    """
+    Flask json encoder that uses orjson for compact sorted ascii output, which is what jsonify asks for.
+    Other options, objects that orjson can not encode (big ints, non-string keys) and output that
+    orjson writes differently are encoded by stdlib json.
+    """
+
+    def encode(self, o):
+        if orjson is not None and self.sort_keys and self.ensure_ascii and self.indent is None \
+                and self.item_separator == ',' and self.key_separator == ':':
+            try:
+                encoded = orjson.dumps(o, default=self.default, option=_ORJSON_OPTIONS)
+            except TypeError:
+                pass
+            else:
+                # orjson writes NaN and Infinity as null, stdlib as NaN and Infinity
+                if encoded.isascii() and not any(text in encoded for text in _STDLIB_ONLY) \
+                        and (b'null' not in encoded or not _has_non_finite(o)):
+                    return encoded.decode('ascii')
+        return super().encode(o)
+
+
+def _has_non_finite(value):
+    """:return: True if value, its items or values hold float NaN, Infinity or -Infinity."""
+    if isinstance(value, float):
+        return not isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+ENCODERS = {'stdlib': JSONEncoder, 'fast': FastJSONEncoder}
+
+
+def encoder(name):
+    """
+    Function that finds json encoder class by name.
+    :raise ValueError: If there is no encoder with such name.
+    """
+    if name not in ENCODERS:
+        raise ValueError('Unknown json encoder {!r}, choose one of: {}'.format(name, ', '.join(sorted(ENCODERS))))
+    return ENCODERS[name]
+
+
+def dumps(record):
+    """Function that encodes one record like jsonify does, but without trailing new line."""
+    return json.dumps(record, separators=(',', ':'), sort_keys=True)
+
+
+def _float(value):
+    # the same as floatstr of stdlib json encoder
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+_VALUES = {str: encode_basestring_ascii, int: int.__repr__, float: _float,
+           bool: lambda value: 'true' if value else 'false', type(None): lambda value: 'null'}
+
+
+class RowEncoder:
+    """
+    Encoder of flat rows to json objects with keys sorted, so result is the same as dumps of
+    dictionary of the same values.
+    :param keys: Keys of object in order of columns of row.
+    """
+
+    def __init__(self, keys):
+        self._order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._template = '{' + ','.join(encode_basestring_ascii(keys[index]).replace('%', '%%') + ':%s'
+                                        for index in self._order) + '}'
+
+    def encode(self, row):
+        """:param row: Sequence of values in order of keys, e.g. tuple from database cursor."""
+        return self._template % tuple(_VALUES.get(type(row[index]), dumps)(row[index]) for index in self._order)
@@ -0,0 +1,121 @@
+"""Cache of verified JWT access tokens. Clients that change many entities send the same token with
+every request, so its signature is checked once and the decoded token is kept until it expires.
+Tokens are kept by sha256 digest of Authorization header, and the whole cache is dropped when
+JWT secret or algorithm changes."""
+
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import time
+from flask import current_app, request
+from flask_jwt_extended import verify_jwt_in_request, get_raw_jwt
+from flask_jwt_extended.config import config
+from flask_jwt_extended.utils import verify_token_claims, verify_token_type, verify_token_not_blacklisted, \
+    has_user_loader
+from app.config import Config
+
+try:
+    from flask import _app_ctx_stack as ctx_stack
+except ImportError:  # pragma: no cover - the same stack that flask_jwt_extended uses
+    from flask import _request_ctx_stack as ctx_stack
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of decoded tokens whose signature is already verified.
+    :param max_entries: How many tokens are kept at once, 0 switches cache off.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._signer = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, header, signer):
+        """
+        Function that returns decoded token if it was verified and has not expired.
+        :param header: Value of Authorization header.
+        :param signer: Tuple (secret, algorithm) tokens are verified with now, cache is cleared when it changes.
+        :return: Tuple (jwt data, jwt header) or None.
+        """
+        key = sha256(header.encode()).digest()
+        with self._lock:
+            if signer != self._signer:
+                if self._data:
+                    self.invalidations += 1
+                self._data.clear()
+                self._signer = signer
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, decoded = entry
+                if expires is None or expires > time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return decoded
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, header, signer, jwt_data, jwt_header=None):
+        """Function that keeps token verified with signer until its exp claim."""
+        if not self.max_entries:
+            return
+        key = sha256(header.encode()).digest()
+        with self._lock:
+            if signer != self._signer:
+                return
+            self._data[key] = (jwt_data.get('exp'), (jwt_data, jwt_header))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Function that reports how well cache works.
+        :return: Dictionary with count of hits, misses, invalidations by secret change, current size and hit rate.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'invalidations': self.invalidations,
+                    'size': len(self._data),
+                    'hit_rate': self.hits / requests if requests else 0.0}
+
+
+cache = VerifiedTokenCache(Config.JWT_CACHE_SIZE)
+
+
+def signer():
+    """:return: Tuple (secret, algorithm) of JWT of current application."""
+    return current_app.config['JWT_SECRET_KEY'], current_app.config['JWT_ALGORITHM']
+
+
+def verify_jwt_in_request_cached():
+    """
+    The same as verify_jwt_in_request of flask_jwt_extended, but signature of token that was verified
+    before is not checked again. Only tokens from headers are cached, type of token (only access tokens
+    are accepted), blacklist (when it is enabled) and user claims are still checked on every request.
+    Application with user loader is not cached, user is loaded by verify_jwt_in_request.
+    """
+    header = request.headers.get(config.header_name)
+    if not cache.max_entries or not header or list(config.token_location) != ['headers'] or has_user_loader():
+        verify_jwt_in_request()
+        return
+    decoded = cache.get(header, signer())
+    if decoded is None:
+        verify_jwt_in_request()
+        cache.set(header, signer(), get_raw_jwt(), ctx_stack.top.jwt_header)
+        return
+    verify_token_type(decoded[0], expected_type='access')
+    verify_token_not_blacklisted(decoded[0], 'access')
+    ctx_stack.top.jwt, ctx_stack.top.jwt_header = decoded
+    verify_token_claims(decoded[0])
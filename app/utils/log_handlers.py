@@ -0,0 +1,77 @@
+"""Logging handlers that move writes of audit log from request thread to background thread"""
+
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Handler that puts records to bounded queue instead of writing them.
+    :param queue: queue.Queue with maxsize, which is shared with listener.
+    :param block: If True, request thread waits for free place when queue is full,
+                  otherwise record is dropped and counted in attribute dropped.
+    :param timeout: Max seconds that request thread waits when block is True, record is dropped
+                    and counted after that, so requests don't hang when listener thread is gone.
+    """
+
+    def __init__(self, queue, block=False, timeout=1.0):
+        super().__init__(queue)
+        self.block = block
+        self.timeout = timeout
+        self.dropped = 0
+        self._dropped_lock = Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put(record, block=self.block, timeout=self.timeout)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class BatchFileHandler(logging.FileHandler):
+    """File handler that does not flush after every record, listener flushes it once per batch."""
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchQueueListener(QueueListener):
+    """
+    Listener that takes all records waiting in queue (but not more than batch_size),
+    passes them to handlers and then flushes handlers once.
+    On stop all records that are already in queue are written and flushed.
+    """
+
+    def __init__(self, queue, *handlers, batch_size=100):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        stop = False
+        while not stop:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            for _ in batch:
+                self.queue.task_done()
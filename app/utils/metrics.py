@@ -0,0 +1,190 @@
+"""Per-request metrics: latency histograms, status counts, count and time of sql statements.
+SQL is measured by SQLAlchemy engine events, so both dao modes are covered.
+Metrics are rendered in Prometheus text format by GET /metrics."""
+
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from types import SimpleNamespace
+from flask import current_app, g, has_app_context, request
+from flask.json import JSONEncoder
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds of buckets, like Prometheus histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """:return: List of tuples (le, cumulative count), the last le is +Inf."""
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+class Registry:
+    """
+    Thread-safe storage of request metrics and of stats of other services.
+    Labels of request metrics are endpoint and method, status counts also have status.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = Lock()
+        self._latency = {}
+        self._sql_time = {}
+        self._sql_statements = {}
+        self._statuses = {}
+        self._collectors = {}
+
+    def observe_request(self, endpoint, method, status, latency, sql_statements, sql_time):
+        labels = (endpoint, method)
+        with self._lock:
+            for histograms, value in ((self._latency, latency), (self._sql_time, sql_time)):
+                if labels not in histograms:
+                    histograms[labels] = Histogram(self.buckets)
+                histograms[labels].observe(value)
+            self._sql_statements[labels] = self._sql_statements.get(labels, 0) + sql_statements
+            self._statuses[labels + (status,)] = self._statuses.get(labels + (status,), 0) + 1
+
+    def add_collector(self, prefix, stats):
+        """
+        Function that adds stats of some service as gauges, collector with the same prefix is replaced.
+        :param prefix: Prefix of metric names, e.g. 'dao_cache'.
+        :param stats: Function without arguments that returns dictionary of numbers.
+        """
+        with self._lock:
+            self._collectors[prefix] = stats
+
+    def render(self):
+        """:return: All metrics in Prometheus text exposition format."""
+        with self._lock:
+            latency = {labels: (histogram.samples(), histogram.sum) for labels, histogram in self._latency.items()}
+            sql_time = {labels: (histogram.samples(), histogram.sum) for labels, histogram in self._sql_time.items()}
+            sql_statements = dict(self._sql_statements)
+            statuses = dict(self._statuses)
+            collectors = sorted(self._collectors.items())
+        lines = []
+        for name, help_text, histograms in (
+                ('http_request_duration_seconds', 'Latency of requests', latency),
+                ('http_request_sql_duration_seconds', 'Time of sql statements of one request', sql_time)):
+            lines += ['# HELP {} {}'.format(name, help_text), '# TYPE {} histogram'.format(name)]
+            for (endpoint, method), (samples, total) in sorted(histograms.items()):
+                labels = 'endpoint="{}",method="{}"'.format(endpoint, method)
+                for le, count in samples:
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, count))
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, total))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, samples[-1][1]))
+        lines += ['# HELP http_requests_total Count of responses by status',
+                  '# TYPE http_requests_total counter']
+        for (endpoint, method, status), count in sorted(statuses.items()):
+            lines.append('http_requests_total{{endpoint="{}",method="{}",status="{}"}} {}'.format(
+                endpoint, method, status, count))
+        lines += ['# HELP http_request_sql_statements_total Count of sql statements executed by requests',
+                  '# TYPE http_request_sql_statements_total counter']
+        for (endpoint, method), count in sorted(sql_statements.items()):
+            lines.append('http_request_sql_statements_total{{endpoint="{}",method="{}"}} {}'.format(
+                endpoint, method, count))
+        for prefix, stats in collectors:
+            for key, value in sorted(stats().items()):
+                name = '{}_{}'.format(prefix, key)
+                lines += ['# TYPE {} gauge'.format(name), '{} {}'.format(name, float(value))]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class TimedJSONEncoder(JSONEncoder):
+    """JSON encoder that adds time of encoding to metrics of current request.
+    init_app puts it before json encoder of application, so any encoder is timed."""
+
+    def encode(self, o):
+        start = perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            request_metrics = _current()
+            if request_metrics is not None:
+                request_metrics['serialize_time'] += perf_counter() - start
+
+
+def _current():
+    return g.get('request_metrics') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # start is kept with statement (or replaced by the next one), so statement that fails leaves nothing behind
+    _timed(conn, context).metrics_start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - _timed(conn, context).metrics_start
+    request_metrics = _current()
+    if request_metrics is not None:
+        request_metrics['sql_statements'] += 1
+        request_metrics['sql_time'] += elapsed
+
+
+def _timed(conn, context):
+    """:return: Execution context of statement, or namespace in info of connection for statements without it."""
+    if context is not None:
+        return context
+    return conn.info.setdefault('metrics', SimpleNamespace())
+
+
+def _before_request():
+    g.request_metrics = {'start': perf_counter(), 'sql_statements': 0, 'sql_time': 0.0,
+                         'serialize_time': 0.0, 'status': 500}
+
+
+def _after_request(response):
+    request_metrics = _current()
+    if request_metrics is not None:
+        request_metrics['status'] = response.status_code
+        if current_app.config.get('METRICS_SERVER_TIMING'):
+            response.headers['Server-Timing'] = ', '.join([
+                'db;dur={:.2f};desc="{} statements"'.format(
+                    request_metrics['sql_time'] * 1000, request_metrics['sql_statements']),
+                'serialize;dur={:.2f}'.format(request_metrics['serialize_time'] * 1000),
+                'total;dur={:.2f}'.format((perf_counter() - request_metrics['start']) * 1000)])
+    return response
+
+
+def _teardown_request(exception):
+    # streamed responses are finished only here, so latency and sql of the whole body are counted
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is None:
+        return
+    registry.observe_request(request.endpoint or 'none', request.method, request_metrics['status'],
+                             perf_counter() - request_metrics['start'], request_metrics['sql_statements'],
+                             request_metrics['sql_time'])
+
+
+def init_app(app):
+    """
+    Function that instruments every request of application. If METRICS_SERVER_TIMING is set in config,
+    every response has Server-Timing header with time of sql statements, of json serialization
+    and total time before body is sent.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if not issubclass(app.json_encoder, TimedJSONEncoder):
+        app.json_encoder = type('Timed' + app.json_encoder.__name__, (TimedJSONEncoder, app.json_encoder), {})
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
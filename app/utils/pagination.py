@@ -0,0 +1,111 @@
+"""Keyset pagination and streaming helpers for list endpoints"""
+
+from itertools import islice
+from flask import request, jsonify, current_app, url_for, Response, stream_with_context
+from app.utils import json_provider
+
+
+def get_page_args():
+    """
+    Function that reads pagination params from query string of current request.
+    :return: Tuple (limit, after), see parse_page_args.
+    :raise ValueError: If limit is not a positive integer or after is not a non-negative integer.
+    """
+    return parse_page_args(request.args, current_app.config['MAX_PAGE_LIMIT'])
+
+
+def parse_page_args(args, max_limit):
+    """
+    Function that reads pagination params from query params.
+    :param args: Mapping of query params.
+    :param max_limit: Biggest page that can be requested.
+    :return: Tuple (limit, after). Limit is None if client did not ask for a page,
+             it is cut to max_limit otherwise. After is id of last
+             record from previous page or None for the first page.
+    :raise ValueError: If limit is not a positive integer or after is not a non-negative integer.
+    """
+    limit = _int_param(args, 'limit', 1)
+    # ids start with 1, so after=0 is the same as the first page
+    after = _int_param(args, 'after', 0)
+    if limit is not None:
+        limit = min(limit, max_limit)
+    if after is not None and limit is None:
+        limit = max_limit
+    return limit, after
+
+
+def _int_param(args, name, minimum):
+    value = args.get(name)
+    if value is None:
+        return None
+    if not value.isdigit() or int(value) < minimum:
+        raise ValueError("Parameter '{}' should be {} integer".format(
+            name, 'positive' if minimum > 0 else 'non-negative'))
+    return int(value)
+
+
+def stream_requested():
+    """
+    Function that checks whether client asked to stream the whole listing.
+    :return: True if query string contains stream=true (or 1).
+    """
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+
+def paginate(fetch, cursor=None):
+    """
+    Function that builds response with one page of records.
+    :param fetch: Callable that takes limit and after and returns list of dictionaries ordered by id.
+    :param cursor: Callable that takes the last record of page and returns query params of the next page,
+                   by default it is after=<id of record>.
+    :return: Json response with list of records. If page is full, response has header
+             Link with url of the next page (rel="next").
+    """
+    try:
+        limit, after = get_page_args()
+    except ValueError as error:
+        return jsonify(message=str(error)), 400
+    records = fetch(limit=limit, after=after)
+    response = jsonify(records)
+    args = next_page_args(dict(request.args.to_dict(), **(request.view_args or {})), records, limit, cursor)
+    if args is not None:
+        response.headers['Link'] = '<{}>; rel="next"'.format(url_for(request.endpoint, **args))
+    return response
+
+
+def next_page_args(args, records, limit, cursor=None):
+    """
+    Function that builds query params of the next page, flask routes and async app share it.
+    :param args: Query params of current page.
+    :param cursor: See paginate.
+    :return: Dictionary of args with limit and cursor of the last record, or None if page is not full.
+    """
+    if limit is None or len(records) != limit:
+        return None
+    return dict(args, **(cursor(records[-1]) if cursor else {'after': records[-1]['id']}), limit=limit)
+
+
+def stream_json_array(records):
+    """
+    Function that streams records as json array without building it in memory.
+    :param records: Iterable of dictionaries, for example generator that reads database cursor.
+    :return: Chunked response, see stream_encoded_array.
+    """
+    return stream_encoded_array(map(json_provider.dumps, records))
+
+
+def stream_encoded_array(encoded):
+    """
+    Function that streams already encoded records as json array.
+    :param encoded: Iterable of json strings, for example iter_animals_json of dao.
+    :return: Chunked response, every chunk has STREAM_BATCH records.
+    """
+    def generate():
+        records = iter(encoded)
+        size = current_app.config['STREAM_BATCH']
+        separator = '['
+        for batch in iter(lambda: list(islice(records, size)), []):
+            yield separator + ','.join(batch)
+            separator = ','
+        yield '[]\n' if separator == '[' else ']\n'
+    return Response(stream_with_context(generate()), mimetype=current_app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,57 @@
+"""Json schema validators that are compiled once per schema and shared by flask routes and async app.
+Validator is chosen by name from VALIDATORS ([json] validator in config.ini): 'fast' checks bodies
+with code generated by fastjsonschema when it is installed and asks jsonschema only for message of
+invalid body, so errors are the same in both modes."""
+
+from json import dumps
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+try:
+    import fastjsonschema
+except ImportError:  # pragma: no cover - jsonschema validator is used then
+    fastjsonschema = None
+
+VALIDATORS = ('jsonschema', 'fast')
+
+
+class SchemaValidator:
+    """
+    Validator of one schema. Schema is checked and validator class is chosen once, jsonschema.validate
+    does both on every call.
+    :param name: 'jsonschema' or 'fast', see VALIDATORS.
+    """
+
+    def __init__(self, schema, name='jsonschema'):
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self._validator = cls(schema)
+        self._fast = fastjsonschema.compile(schema) if name == 'fast' and fastjsonschema is not None else None
+
+    def first_error(self, data):
+        """:return: The most relevant jsonschema ValidationError of data (the same that jsonschema.validate raises)
+                 or None if data is valid."""
+        if self._fast is not None:
+            try:
+                self._fast(data)
+                return None
+            except fastjsonschema.JsonSchemaException:
+                pass
+        return best_match(self._validator.iter_errors(data))
+
+
+_compiled = {}
+
+
+def compiled(schema, name='jsonschema'):
+    """
+    Function that returns validator of schema, it is built on first call for every schema.
+    :raise ValueError: If there is no validator with such name.
+    :raise jsonschema.SchemaError: If schema itself is not valid.
+    """
+    if name not in VALIDATORS:
+        raise ValueError('Unknown json validator {!r}, choose one of: {}'.format(name, ', '.join(VALIDATORS)))
+    key = (dumps(schema, sort_keys=True), name)
+    if key not in _compiled:
+        _compiled[key] = SchemaValidator(schema, name)
+    return _compiled[key]
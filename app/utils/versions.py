@@ -0,0 +1,95 @@
+"""Versions of tables and entities that views build ETag and Last-Modified from.
+They are kept in table table_version and bumped by triggers of migration 0006 in the same transaction
+as the change, so versions are the same in every worker process and writes made outside of application
+(CLI, fill_db.py) are seen too. Key is table name ('animal') or tuple of table name and id
+(('species', 1)). Centers and species have versions of their own, ('animal', id) is version of table animal."""
+
+import json
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from time import time
+from sqlalchemy import text
+from app import db
+
+# row with random number chosen when database was made, it is part of every ETag
+DATABASE = 'database'
+# tables whose rows have versions of their own
+ENTITY_TABLES = ('animal_center', 'species')
+
+CURRENT = text("SELECT name, version, modified FROM table_version "
+               "WHERE name IN (SELECT value FROM json_each(:names))")
+BUMP = text("INSERT INTO table_version (name, version, modified) VALUES (:name, 1, :now) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified")
+
+
+def name(key):
+    """:return: Name of row of table_version for key."""
+    if isinstance(key, tuple):
+        table, entity_id = key
+        return '{}:{}'.format(table, entity_id) if table in ENTITY_TABLES else table
+    return key
+
+
+def names(keys):
+    """:return: Parameter names of CURRENT for keys."""
+    return json.dumps([DATABASE] + [name(key) for key in keys])
+
+
+def from_rows(keys, rows):
+    """
+    Function that builds ETag and Last-Modified from rows of CURRENT.
+    :return: Tuple (etag, last_modified). Etag is string that changes with every change of any key,
+             last_modified is unix time of the latest change or time when database was made.
+    """
+    found = {row[0]: (row[1], row[2]) for row in rows}
+    token, created = found.get(DATABASE, (0, 0.0))
+    entries = [found.get(name(key), (0, created)) for key in keys]
+    etag = '{:x}-{}'.format(token, '.'.join(str(version) for version, _ in entries))
+    return etag, max([created] + [modified for _, modified in entries])
+
+
+def current(*keys):
+    """
+    Function that reads versions of tables or entities from database of current application.
+    :return: The same as from_rows().
+    """
+    return from_rows(keys, db.get_read_engine().execute(CURRENT, {'names': names(keys)}).fetchall())
+
+
+def bump(*keys):
+    """
+    Function that marks tables or entities as changed. Dao writes don't need it, triggers bump versions.
+    :param keys: Table names or tuples (table name, id).
+    """
+    now = time()
+    with db.engine.begin() as connection:
+        for key in keys:
+            connection.execute(BUMP, {'name': name(key), 'now': now})
+
+
+def headers(etag, modified):
+    """
+    :return: Dictionary with ETag and Last-Modified headers of response. ETag is weak, because body
+             of the same version is sent compressed or not.
+    """
+    return {'ETag': 'W/"{}"'.format(etag), 'Last-Modified': formatdate(int(modified), usegmt=True)}
+
+
+def not_modified(etag, modified, if_none_match, if_modified_since):
+    """
+    Function that checks conditional headers of GET request, flask routes and async app share it.
+    If-None-Match is compared weakly, If-Modified-Since is used only without it.
+    :return: True if client already has current version and response is 304.
+    """
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or '"{}"'.format(etag) in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return int(modified) <= since.timestamp()
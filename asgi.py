@@ -0,0 +1,5 @@
+"""Async app startup entry point, run it with ASGI server, e.g. uvicorn asgi:app"""
+
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
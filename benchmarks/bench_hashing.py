@@ -0,0 +1,48 @@
+"""Benchmark of password checks per second for every hashing mode and pool size.
+
+Run from project root: python -m benchmarks.bench_hashing [--clients 16] [--checks 64]
+Each client thread checks password like login does. With thread or process pool
+throughput should grow with count of workers up to count of cpu."""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count
+from werkzeug.security import generate_password_hash
+from app.utils.hashing import PasswordHasher
+
+
+def measure(hasher, pwhash, clients, checks):
+    """
+    Function that checks password `checks` times from `clients` threads.
+    :return: Count of checks per second.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: hasher.check_password_hash(pwhash, 'password'), range(checks)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return checks / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='count of concurrent logins')
+    parser.add_argument('--checks', type=int, default=64, help='count of password checks per measurement')
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash('password')
+    cpus = cpu_count() or 1
+    workers_counts = sorted({1, 2, cpus // 2 or 1, cpus})
+    print('{:<8} {:>8} {:>12}'.format('mode', 'workers', 'checks/s'))
+    inline = measure(PasswordHasher('inline'), pwhash, args.clients, args.checks)
+    print('{:<8} {:>8} {:>12.1f}'.format('inline', '-', inline))
+    for mode in ('thread', 'process'):
+        for workers in workers_counts:
+            hasher = PasswordHasher(mode, workers, max_pending=args.checks, timeout=60)
+            hasher.check_password_hash(pwhash, 'password')  # start pool before measurement
+            print('{:<8} {:>8} {:>12.1f}'.format(mode, workers, measure(hasher, pwhash, args.clients, args.checks)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of json encoding of listings: stdlib flask encoder against fast (orjson) encoder for pages,
+dictionaries from deserialize against RowEncoder on cursor rows for streamed listings.
+
+Run from project root: python -m benchmarks.bench_json [--records 100000] [--repeat 5]
+Every variant must give the same bytes as the current output, otherwise exit status is 1."""
+
+import argparse
+import random
+import sys
+import time
+from flask import json
+from flask.json import JSONEncoder
+from app.dao.dao_sql import AnimalsDaoSql, ANIMAL_JSON
+from app.utils import json_provider
+
+
+def make_rows(count, non_ascii=False, seed=0):
+    """:return: List of (id, name) tuples like rows of animal listing, with non_ascii some names are not ascii."""
+    rnd = random.Random(seed)
+    names = ['toto', 'momo', 'kitty "the cat"', 'rex'] + (['Барсик', 'café'] if non_ascii else [])
+    return [(number, '{}{}'.format(rnd.choice(names), number)) for number in range(1, count + 1)]
+
+
+def make_non_finite_rows(count):
+    """:return: List of (id, price) tuples, every tenth price is NaN or Infinity, which orjson writes as null."""
+    prices = [float('nan'), float('inf'), -float('inf')]
+    return [(number, prices[number % 3] if number % 10 == 0 else number / 4) for number in range(1, count + 1)]
+
+
+def rows_as_dicts(rows):
+    return ({'id': row[0], 'name': row[1]} for row in rows)
+
+
+def best_time(func, repeat):
+    """:return: Tuple (result of func, the smallest time of repeat calls in seconds)."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def measure(rows, repeat):
+    """
+    Function that times every way to encode listing. Pages encode ready dictionaries,
+    streams start from rows, like iter_animals and iter_animals_json of sql dao.
+    :return: List of tuples (name, seconds, same bytes as current output).
+    """
+    dao = AnimalsDaoSql()
+    records = [dao.deserialize(record) for record in rows_as_dicts(rows)]
+    options = {'separators': (',', ':'), 'sort_keys': True}
+    page, page_time = best_time(lambda: json.dumps(records, cls=JSONEncoder, **options), repeat)
+    fast, fast_time = best_time(lambda: json.dumps(records, cls=json_provider.FastJSONEncoder, **options), repeat)
+    stream, stream_time = best_time(
+        lambda: ','.join(json.dumps(dao.deserialize(record), separators=(',', ':'))
+                         for record in rows_as_dicts(rows)), repeat)
+    encoded, encoded_time = best_time(lambda: ','.join(map(ANIMAL_JSON.encode, rows)), repeat)
+    priced = [{'id': number, 'price': price} for number, price in make_non_finite_rows(len(rows))]
+    non_finite, non_finite_time = best_time(
+        lambda: json.dumps(priced, cls=json_provider.FastJSONEncoder, **options), repeat)
+    return [('page stdlib', page_time, True),
+            ('page fast', fast_time, fast == page),
+            ('page fast nan', non_finite_time, non_finite == json.dumps(priced, cls=JSONEncoder, **options)),
+            ('stream dicts', stream_time, True),
+            ('stream rows', encoded_time, encoded == stream and '[' + encoded + ']' == page)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100000, help='count of records in listing')
+    parser.add_argument('--repeat', type=int, default=5, help='count of runs, the best one is shown')
+    parser.add_argument('--non-ascii', action='store_true',
+                        help='add names out of ascii, fast encoder gives such pages to stdlib')
+    args = parser.parse_args()
+
+    print('orjson is {}'.format('installed' if json_provider.orjson else 'not installed, fast is stdlib'))
+    print('{:<14} {:>10} {:>10} {:>6}'.format('variant', 'ms', 'records/s', 'same'))
+    results = measure(make_rows(args.records, args.non_ascii), args.repeat)
+    for name, seconds, same in results:
+        print('{:<14} {:>10.1f} {:>10.0f} {:>6}'.format(name, seconds * 1000, args.records / seconds, str(same)))
+    if not all(same for _, _, same in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
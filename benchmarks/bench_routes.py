@@ -0,0 +1,286 @@
+"""Benchmark of latency and throughput of every route with SQL and ORM dao.
+
+Run from project root:
+    python -m benchmarks.bench_routes run [--sizes 1000 100000 1000000] [--modes sql orm] [--output results.json]
+    python -m benchmarks.bench_routes compare old.json new.json [--threshold 0.2]
+
+For every dataset size database is made by migrations and filled once with the same random seed,
+then every dao mode gets its own copy of it and runs in its own process, so modes do not share
+version counters and connections. Requests are sent by flask test client of create_app(), like in tests,
+so numbers show time of application and database without network. Cache is switched off,
+so every request reaches dao. Compare mode prints change of every route between two runs
+and exits with status 1 if any of them became slower than threshold."""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import count
+
+SIZES = (1000, 100000, 1000000)
+MODES = ('sql', 'orm')
+PASSWORD = 'bench'
+CENTER_ANIMALS = 100
+SPECIES_COUNT = 50
+BULK_SIZE = 100
+
+
+def write_config(directory, db_file, mode):
+    """
+    Function that writes ini file, which overrides config.ini in child process through APP_CONFIG.
+    :return: Path of ini file.
+    """
+    config_path = os.path.join(directory, '{}.ini'.format(mode))
+    with open(config_path, 'w') as config_file:
+        config_file.write('[database]\ndb_file = {}\ndao = {}\n\n'
+                          '[cache]\nenabled = False\n\n'
+                          '[access_request]\nwrite_behind = False\n'.format(db_file, mode))
+    return config_path
+
+
+def seed(app, size, seed_value=0):
+    """
+    Function that fills database with about `size` animals by fill_db generator, one center
+    per CENTER_ANIMALS animals and SPECIES_COUNT species. All centers have password PASSWORD.
+    """
+    from fill_db import generate
+
+    centers = max(1, size // CENTER_ANIMALS)
+    generate(app, seed_value, centers, SPECIES_COUNT, size // centers, password=PASSWORD)
+
+
+def build_cases(size, rnd):
+    """
+    Function that lists requests of benchmark. Every case has name, method, function that returns
+    url and json body of next request, flag whether it needs token, expected status and flag whether
+    it is slow (password hashing or the whole table), so it gets less requests.
+    """
+    centers = max(1, size // CENTER_ANIMALS)
+    new_ids = count(1)
+    deleted_ids = count(size, -1)
+
+    def animal():
+        return {'name': 'new', 'center_id': 1, 'description': 'description', 'age': rnd.randint(0, 30),
+                'species_id': rnd.randint(1, SPECIES_COUNT), 'price': rnd.randint(1, 1000)}
+
+    def fixed(url, body=None):
+        return lambda: (url, body)
+
+    return [
+        ('GET /', 'GET', fixed('/'), False, 200, False),
+        ('GET /login', 'GET', lambda: ('/login?login=center{}&password={}'.format(
+            rnd.randint(1, centers), PASSWORD), None), False, 200, True),
+        ('POST /register', 'POST', lambda: ('/register', {
+            'login': 'new{}'.format(next(new_ids)), 'password': PASSWORD, 'address': 'address'}), False, 201, True),
+        ('GET /animals?limit=100', 'GET', fixed('/animals?limit=100'), False, 200, False),
+        ('GET /animals?limit=100&after', 'GET', lambda: ('/animals?limit=100&after={}'.format(
+            rnd.randint(1, size)), None), False, 200, False),
+        ('GET /animals', 'GET', fixed('/animals'), False, 200, True),
+        ('GET /animals?stream=true', 'GET', fixed('/animals?stream=true'), False, 200, True),
+        ('GET /animals/<id>', 'GET', lambda: ('/animals/{}'.format(rnd.randint(1, size // 2)), None),
+         False, 200, False),
+        ('POST /animals', 'POST', lambda: ('/animals', animal()), True, 201, False),
+        ('POST /animals/bulk', 'POST', lambda: ('/animals/bulk', [animal() for _ in range(BULK_SIZE)]),
+         True, 201, False),
+        ('PUT /animals/<id>', 'PUT', lambda: ('/animals/{}'.format(rnd.randint(1, size // 2)),
+                                              {'age': rnd.randint(0, 30)}), True, 200, False),
+        ('DELETE /animals/<id>', 'DELETE', lambda: ('/animals/{}'.format(next(deleted_ids)), None),
+         True, 200, False),
+        ('GET /centers?limit=100', 'GET', fixed('/centers?limit=100'), False, 200, False),
+        ('GET /centers', 'GET', fixed('/centers'), False, 200, True),
+        ('GET /centers/<id>', 'GET', lambda: ('/centers/{}'.format(rnd.randint(1, centers)), None),
+         False, 200, False),
+        ('GET /species', 'GET', fixed('/species'), False, 200, False),
+        ('POST /species', 'POST', lambda: ('/species', {
+            'name': 'new{}'.format(next(new_ids)), 'description': 'description', 'price': 10}), True, 201, False),
+        ('GET /species/<id>', 'GET', lambda: ('/species/{}'.format(rnd.randint(1, SPECIES_COUNT)), None),
+         False, 200, False),
+    ]
+
+
+def percentile(ordered, part):
+    """Function that returns nearest-rank percentile of sorted list."""
+    index = max(0, min(len(ordered) - 1, int(round(part * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, statuses):
+    ordered = sorted(latencies)
+    return {'count': len(ordered),
+            'mean_ms': sum(ordered) / len(ordered) * 1000,
+            'p50_ms': percentile(ordered, 0.5) * 1000,
+            'p90_ms': percentile(ordered, 0.9) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000,
+            'max_ms': ordered[-1] * 1000,
+            'throughput_rps': len(ordered) / elapsed if elapsed else 0.0,
+            'statuses': statuses}
+
+
+def measure_routes(app, size, requests=200, slow_requests=10, warmup=1, seed_value=0):
+    """
+    Function that sends requests of every case one by one and measures time of each of them
+    including reading of body.
+    :return: List of dictionaries with name of case and its latency percentiles, throughput and statuses.
+    """
+    from flask_jwt_extended import create_access_token
+
+    rnd = random.Random(seed_value)
+    client = app.test_client()
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+    results = []
+    for name, method, next_request, auth, expected, slow in build_cases(size, rnd):
+        total = slow_requests if slow else requests
+        latencies = []
+        statuses = {}
+        elapsed = 0.0
+        for index in range(warmup + total):
+            url, body = next_request()
+            start = time.perf_counter()
+            response = client.open(url, method=method, json=body, headers=headers if auth else None)
+            response.get_data()
+            latency = time.perf_counter() - start
+            if index < warmup:
+                continue
+            latencies.append(latency)
+            elapsed += latency
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        result = summarize(latencies, elapsed, statuses)
+        result['case'] = name
+        result['errors'] = total - statuses.get(str(expected), 0)
+        results.append(result)
+    return results
+
+
+def run_child(command, config_path, arguments):
+    environment = dict(os.environ, APP_CONFIG=config_path)
+    subprocess.run([sys.executable, '-m', 'benchmarks.bench_routes', command] + arguments,
+                   env=environment, check=True)
+
+
+def run(args):
+    results = []
+    directory = tempfile.mkdtemp(prefix='bench_routes_')
+    try:
+        for size in args.sizes:
+            base = os.path.join(directory, 'base.db')
+            run_child('seed', write_config(directory, base, 'seed'), ['--size', str(size), '--seed', str(args.seed)])
+            for mode in args.modes:
+                db_file = os.path.join(directory, '{}.db'.format(mode))
+                shutil.copyfile(base, db_file)
+                output = os.path.join(directory, '{}.json'.format(mode))
+                run_child('measure', write_config(directory, db_file, mode), [
+                    '--size', str(size), '--seed', str(args.seed), '--requests', str(args.requests),
+                    '--slow-requests', str(args.slow_requests), '--output', output])
+                with open(output) as result_file:
+                    for result in json.load(result_file):
+                        results.append(dict(result, size=size, mode=mode))
+                        print_result(results[-1])
+            os.remove(base)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    report = {'meta': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                       'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'seed': args.seed, 'requests': args.requests, 'slow_requests': args.slow_requests},
+              'results': results}
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print('Results are saved to', args.output)
+
+
+def print_result(result):
+    print('{size:>8} {mode:<4} {case:<30} p50 {p50_ms:9.2f} ms  p99 {p99_ms:9.2f} ms  '
+          '{throughput_rps:9.1f} req/s  errors {errors}'.format(**result))
+
+
+def compare(old, new, metric='p50_ms', threshold=0.2):
+    """
+    Function that matches results of two runs by size, dao mode and case.
+    :return: List of tuples (key, old value, new value, ratio, regression flag). Regression is
+             new value bigger than old one by more than threshold part (throughput - smaller).
+    """
+    old_results = {(result['size'], result['mode'], result['case']): result for result in old['results']}
+    rows = []
+    for result in new['results']:
+        key = (result['size'], result['mode'], result['case'])
+        if key not in old_results:
+            continue
+        old_value, new_value = old_results[key][metric], result[metric]
+        ratio = new_value / old_value if old_value else float('inf')
+        if metric == 'throughput_rps':
+            regression = new_value < old_value * (1 - threshold)
+        else:
+            regression = new_value > old_value * (1 + threshold)
+        rows.append((key, old_value, new_value, ratio, regression))
+    return rows
+
+
+def run_compare(args):
+    with open(args.old) as old_file, open(args.new) as new_file:
+        rows = compare(json.load(old_file), json.load(new_file), args.metric, args.threshold)
+    for (size, mode, case), old_value, new_value, ratio, regression in rows:
+        print('{:>8} {:<4} {:<30} {:10.2f} {:10.2f} {:7.2f}x {}'.format(
+            size, mode, case, old_value, new_value, ratio, 'REGRESSION' if regression else ''))
+    regressions = sum(row[4] for row in rows)
+    print('{} of {} cases regressed by more than {:.0%} in {}'.format(
+        regressions, len(rows), args.threshold, args.metric))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='measure every route and save results as json')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='counts of animals')
+    run_parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='dao modes')
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    run_parser.add_argument('--slow-requests', type=int, default=10,
+                            help='requests per route that hashes password or reads the whole table')
+    run_parser.add_argument('--seed', type=int, default=0, help='seed of random data and requests')
+    run_parser.add_argument('--output', default='bench_routes.json', help='json file with results')
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two saved runs')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--metric', default='p50_ms',
+                                choices=('mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'throughput_rps'))
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 is 20%%')
+
+    # commands of child processes, application is imported there with config from APP_CONFIG
+    seed_parser = commands.add_parser('seed')
+    seed_parser.add_argument('--size', type=int, required=True)
+    seed_parser.add_argument('--seed', type=int, default=0)
+    measure_parser = commands.add_parser('measure')
+    measure_parser.add_argument('--size', type=int, required=True)
+    measure_parser.add_argument('--seed', type=int, default=0)
+    measure_parser.add_argument('--requests', type=int, default=200)
+    measure_parser.add_argument('--slow-requests', type=int, default=10)
+    measure_parser.add_argument('--output', required=True)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        sys.exit(run_compare(args))
+    else:
+        from app.main import create_app
+        app = create_app()
+        if args.command == 'seed':
+            seed(app, args.size, args.seed)
+        else:
+            results = measure_routes(app, args.size, args.requests, args.slow_requests, seed_value=args.seed)
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark of json body validation per request: expects_json decorator built on every request
+(how json_validate_for_change worked before) against decorator with validator compiled once,
+for every schema of routes and every validator from app/utils/validation.py.
+
+Run from project root: python -m benchmarks.bench_validation [--requests 2000] [--repeat 5]"""
+
+import argparse
+from flask import Flask
+from flask_expects_json import expects_json
+from app.utils import schemas, validation
+from app.utils.decorators import json_validate_for_change
+from benchmarks.bench_json import best_time
+
+BODIES = {
+    'animal': (schemas.animal_schema, {'name': 'toto', 'description': 'fluffy cat', 'age': 2, 'species_id': 1,
+                                       'price': 100.5}),
+    'animal_update': (schemas.animal_update_schema, {'age': 3, 'price': 90}),
+    'species': (schemas.species_schema, {'name': 'cat', 'description': 'good cat', 'price': 160}),
+    'register': (schemas.register_schema, {'login': 'ann', 'password': 'secret', 'address': 'lp'}),
+}
+
+
+def view():
+    return 'ok'
+
+
+def measure(requests, repeat):
+    """
+    Function that validates body of POST request `requests` times inside request context,
+    so time includes what decorator adds to every request.
+    Variants jsonschema and fast are compiled validators alone.
+    :return: List of tuples (schema name, variant, microseconds per request).
+    """
+    app = Flask(__name__)
+    results = []
+    for name, (schema, body) in BODIES.items():
+        variants = [('expects_json', lambda: expects_json(schema)(view)())]
+        for validator in validation.VALIDATORS:
+            compiled = validation.compiled(schema, validator)
+            variants.append((validator, lambda compiled=compiled: compiled.first_error(body) or view()))
+        # decorator of routes with validator from config, it also reads body from request
+        variants.append(('decorator', json_validate_for_change(schema)(view)))
+        with app.test_request_context(method='POST', json=body):
+            for variant, func in variants:
+                _, seconds = best_time(lambda: [func() for _ in range(requests)], repeat)
+                results.append((name, variant, seconds / requests * 1e6))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='count of validated requests')
+    parser.add_argument('--repeat', type=int, default=5, help='count of runs, the best one is shown')
+    args = parser.parse_args()
+
+    print('fastjsonschema is {}'.format(
+        'installed' if validation.fastjsonschema else 'not installed, fast is jsonschema'))
+    print('{:<14} {:<14} {:>10}'.format('schema', 'variant', 'us/request'))
+    for name, variant, microseconds in measure(args.requests, args.repeat):
+        print('{:<14} {:<14} {:>10.1f}'.format(name, variant, microseconds))
+
+
+if __name__ == '__main__':
+    main()
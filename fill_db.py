@@ -1,25 +1,128 @@
-"""Fill database with predefined values"""
+"""Fill database with generated values.
 
+Run from project root: python fill_db.py [--seed 0] [--centers 2] [--species 3] [--animals-per-center 2]
+                                         [--access-requests-per-center 0] [--skew 1.0] [--password a]
+Schema is upgraded by migrations first, then rows are added to what is already in database.
+The same seed and sizes give the same data. Every center gets login center<id> and the same password,
+which is hashed only once. Species of animals follow zipf distribution: species with id n gets
+animals in proportion to 1 / n ** skew, skew 0 gives uniform distribution. Rows are written
+with executemany in batches inside one transaction, with sqlite pragmas for bulk load, which are
+restored after the load, so millions of rows take seconds."""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+from flask_migrate import upgrade
+from werkzeug.security import generate_password_hash
+from app.dao import species_stats, statements
 from app.main import create_app
-from app.models.models import AnimalCenter
-
-app = create_app()
-
-with app.app_context():
-
-    user = AnimalCenter(login='ann', address='lp')
-    user.set_password('a')
-    app.db.session.add(user)
-    user = AnimalCenter(login='a', address='lp')
-    user.set_password('a')
-    app.db.session.add(user)
-    app.db.session.commit()
-    app.db.engine.execute('insert into species(name, description, price)'
-                          'values("cat", "good cat", 160),'
-                          '("dog", "good dog", 300),'
-                          '("fox", "perfect fox", 200)')
-    app.db.engine.execute('insert into animal(center_id, name, description, age, species_id, price)'
-                          ' values(1, "toto", "t", 3, 1, 100),'
-                          '(2, "momo", "m", 2, 1, 170),'
-                          '(1, "lolo", "l", 10, 3, 100),'
-                          '(1, "jojo", "j", 2, 1, 289)')
+
+# journal in memory and no fsync are safe enough for load that is repeated from scratch if it fails
+BULK_PRAGMAS = {'synchronous': 'OFF', 'journal_mode': 'MEMORY', 'temp_store': 'MEMORY', 'cache_size': '-262144'}
+NAMES = ('toto', 'momo', 'lolo', 'jojo', 'bobo', 'koko', 'nono', 'zozo')
+# words of animal descriptions, so full-text search has something to find and rank
+WORDS = ('big', 'small', 'young', 'old', 'calm', 'playful', 'shy', 'friendly', 'fluffy', 'striped', 'spotted',
+         'grey', 'black', 'white', 'ginger', 'cat', 'dog', 'parrot', 'rabbit', 'loves', 'children', 'walks',
+         'sleeps', 'plays', 'with', 'long', 'short', 'tail', 'ears', 'hair', 'garden', 'house', 'trained', 'quiet')
+
+
+def insert(cursor, statement, rows, batch_size):
+    """
+    Function that inserts rows of generator with one executemany per batch.
+    :return: Count of inserted rows.
+    """
+    sql, total = str(statement), 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return total
+        cursor.executemany(sql, batch)
+        total += len(batch)
+
+
+def generate(app, seed=0, centers=2, species=3, animals_per_center=2, access_requests_per_center=0, skew=1.0,
+             password='a', batch_size=10000, days=365):
+    """
+    Function that adds generated centers, species, animals and access requests to database of application.
+    :return: Dictionary with count of added rows of each table.
+    """
+    rnd = random.Random(seed)
+    pwhash = generate_password_hash(password)
+    with app.app_context():
+        upgrade()
+        # journal mode can be changed from WAL only when no other connection is open
+        app.db.engine.dispose()
+        connection = app.db.engine.connect()
+        previous = {name: connection.execute('PRAGMA {}'.format(name)).scalar() for name in BULK_PRAGMAS}
+        try:
+            for name, value in BULK_PRAGMAS.items():
+                connection.execute('PRAGMA {} = {}'.format(name, value))
+            with connection.begin():
+                center_offset = connection.execute(statements.CENTER_MAX_ID).scalar() or 0
+                species_offset = connection.execute(statements.SPECIES_MAX_ID).scalar() or 0
+                center_ids = range(center_offset + 1, center_offset + centers + 1)
+                species_ids = list(range(species_offset + 1, species_offset + species + 1))
+                cum_weights = list(accumulate(1 / rank ** skew for rank in range(1, species + 1)))
+                prices = {species_id: rnd.randint(10, 1000) for species_id in species_ids}
+                cursor = connection.connection.cursor()
+
+                counts = {'centers': insert(cursor, statements.CENTER_INSERT, (
+                    {'login': 'center{}'.format(center_id), 'password_hash': pwhash,
+                     'address': 'address {}'.format(center_id)}
+                    for center_id in center_ids), batch_size)}
+                counts['species'] = insert(cursor, statements.SPECIES_INSERT, (
+                    {'name': 'species{}'.format(species_id), 'description': 'species {}'.format(species_id),
+                     'price': prices[species_id]}
+                    for species_id in species_ids), batch_size)
+
+                def animals():
+                    for center_id in center_ids:
+                        chosen = rnd.choices(species_ids, cum_weights=cum_weights, k=animals_per_center)
+                        for species_id in chosen:
+                            yield {'name': rnd.choice(NAMES), 'center_id': center_id,
+                                   'description': ' '.join(rnd.sample(WORDS, rnd.randint(3, 8))),
+                                   'age': rnd.randint(0, 20), 'species_id': species_id,
+                                   'price': round(prices[species_id] * rnd.uniform(0.5, 1.5), 2)
+                                   if rnd.random() < 0.9 else None}
+                counts['animals'] = insert(cursor, statements.ANIMAL_INSERT, animals() if species else iter(()),
+                                           batch_size)
+
+                now = datetime.utcnow()
+                counts['access_requests'] = insert(cursor, statements.ACCESS_REQUEST_INSERT, (
+                    {'id': center_id,
+                     'timestamp': str(now - timedelta(seconds=rnd.randint(0, days * 24 * 3600)))}
+                    for center_id in center_ids for _ in range(access_requests_per_center)), batch_size)
+                cursor.close()
+                species_stats.rebuild(connection)
+        finally:
+            for name, value in previous.items():
+                connection.execute('PRAGMA {} = {}'.format(name, value))
+            connection.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='seed of random values')
+    parser.add_argument('--centers', type=int, default=2, help='count of centers')
+    parser.add_argument('--species', type=int, default=3, help='count of species')
+    parser.add_argument('--animals-per-center', type=int, default=2, help='count of animals of every center')
+    parser.add_argument('--access-requests-per-center', type=int, default=0,
+                        help='count of access requests of every center')
+    parser.add_argument('--skew', type=float, default=1.0, help='exponent of zipf distribution of species')
+    parser.add_argument('--password', default='a', help='password of every center')
+    parser.add_argument('--batch-size', type=int, default=10000, help='count of rows in one executemany')
+    parser.add_argument('--days', type=int, default=365, help='access requests are spread over this many days')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(create_app(), args.seed, args.centers, args.species, args.animals_per_center,
+                      args.access_requests_per_center, args.skew, args.password, args.batch_size, args.days)
+    print('Added {centers} centers, {species} species, {animals} animals, {access_requests} access requests'
+          .format(**counts), 'in {:.1f} s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""full text search
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 08:02:31.514208
+
+Search tables are FTS5 external content tables: they index name and description of
+animal and species and read the text itself from these tables. Triggers keep index in sync
+with every insert, update and delete. Batch migrations that recreate animal or species
+table drop their triggers, such migration has to create them again.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+TABLES = ('animal', 'species')
+
+
+def upgrade():
+    for table in TABLES:
+        op.execute("CREATE VIRTUAL TABLE {0}_search USING fts5(name, description, content='{0}', content_rowid='id', "
+                   "tokenize='porter unicode61')".format(table))
+        op.execute("CREATE TRIGGER {0}_search_insert AFTER INSERT ON {0} BEGIN "
+                   "INSERT INTO {0}_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+                   "END".format(table))
+        op.execute("CREATE TRIGGER {0}_search_delete AFTER DELETE ON {0} BEGIN "
+                   "INSERT INTO {0}_search ({0}_search, rowid, name, description) "
+                   "VALUES ('delete', old.id, old.name, old.description); "
+                   "END".format(table))
+        op.execute("CREATE TRIGGER {0}_search_update AFTER UPDATE OF name, description ON {0} BEGIN "
+                   "INSERT INTO {0}_search ({0}_search, rowid, name, description) "
+                   "VALUES ('delete', old.id, old.name, old.description); "
+                   "INSERT INTO {0}_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+                   "END".format(table))
+        op.execute("INSERT INTO {0}_search ({0}_search) VALUES ('rebuild')".format(table))
+
+
+def downgrade():
+    for table in TABLES:
+        for trigger in ('insert', 'delete', 'update'):
+            op.execute("DROP TRIGGER {}_search_{}".format(table, trigger))
+        op.execute("DROP TABLE {}_search".format(table))
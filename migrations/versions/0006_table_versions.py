@@ -0,0 +1,49 @@
+"""table versions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:40:05.318211
+
+Versions of tables, centers and species that ETag and Last-Modified of GET responses are built from.
+Triggers bump them in the same transaction as the change, so writes of every worker process, of CLI
+and of fill_db.py are seen by all processes. Row 'database' holds random number chosen when this
+migration runs, so different databases never give the same ETag.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+NOW = "(julianday('now') - 2440587.5) * 86400.0"
+# table: names of versions that every changed row of table bumps, {row} is new or old
+BUMPED = {'animal': ("'animal'", "'animal_center:' || {row}.center_id", "'species:' || {row}.species_id"),
+          'animal_center': ("'animal_center'", "'animal_center:' || {row}.id"),
+          'species': ("'species'", "'species:' || {row}.id")}
+EVENTS = {'insert': ('new',), 'update': ('old', 'new'), 'delete': ('old',)}
+
+
+def bump(name):
+    return ("INSERT INTO table_version (name, version, modified) VALUES ({}, 1, {}) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified; ").format(name, NOW)
+
+
+def upgrade():
+    op.execute("CREATE TABLE table_version (name VARCHAR NOT NULL PRIMARY KEY, version INTEGER NOT NULL, "
+               "modified FLOAT NOT NULL)")
+    op.execute("INSERT INTO table_version (name, version, modified) VALUES ('database', abs(random()), {})"
+               .format(NOW))
+    for table, names in BUMPED.items():
+        for event, rows in EVENTS.items():
+            op.execute("CREATE TRIGGER {0}_version_{1} AFTER {2} ON {0} BEGIN {3}END".format(
+                table, event, event.upper(), ''.join(bump(name.format(row=row)) for row in rows for name in names)))
+
+
+def downgrade():
+    for table in BUMPED:
+        for event in EVENTS:
+            op.execute("DROP TRIGGER {}_version_{}".format(table, event))
+    op.execute("DROP TABLE table_version")
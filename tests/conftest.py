@@ -1,13 +1,17 @@
 """pytests fixtures"""
 
 import pytest
+from flask_migrate import upgrade
 from app.main import create_app
 
 
 @pytest.fixture(scope='session')
-def test_app():
-    """This fixture creates test flask application"""
-    app = create_app()
+def test_app(tmp_path_factory):
+    """This fixture creates test flask application with empty temporary database made by migrations,
+    views read versions of tables from it"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path_factory.mktemp('app') / 'test.db')})
+    with app.app_context():
+        upgrade()
     return app
 
 
@@ -17,3 +21,15 @@ def client(test_app):
     requests like get, post etc"""
     client = test_app.test_client()
     return client
+
+
+@pytest.fixture(scope='function')
+def db_app(tmp_path):
+    """This fixture creates application with empty temporary database made by
+    migrations and pushes its context, so dao classes can be used directly"""
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    with app.app_context():
+        upgrade()
+        yield app
+        app.db.session.remove()
@@ -0,0 +1,82 @@
+"""Tests of admission control and load shedding"""
+
+import pytest
+import threading
+import time
+from flask_jwt_extended import create_access_token
+from app.main import create_app
+from app.utils import admission
+
+
+@pytest.fixture(scope='module')
+def test_app(tmp_path_factory):
+    """This fixture creates application with admission control and metrics on, client fixture uses it"""
+    return create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path_factory.mktemp('app') / 'test.db'),
+                       'METRICS_ENABLED': True, 'ADMISSION_ENABLED': True})
+
+
+@pytest.fixture
+def controller(mocker):
+    controller = admission.AdmissionController({'read': 1, 'write': 1}, queue_timeout=0.05, max_queue=1)
+    mocker.patch.object(admission, 'controller', controller)
+    return controller
+
+
+def test_route_class():
+    """This test checks that login and registration have their own class whatever method they use"""
+    assert admission.route_class('app.animals', 'GET') == 'read'
+    assert admission.route_class('app.animals', 'POST') == 'write'
+    assert admission.route_class('app.login', 'GET') == 'auth'
+    assert admission.route_class('app.registration', 'POST') == 'auth'
+
+
+def test_requests_over_cap_are_shed(client, controller):
+    """This test checks that request is shed with 503 and Retry-After when its class is full,
+    other classes and metrics are still served, and place is given back after request"""
+    assert controller.admit('read')
+    response = client.get('/')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/metrics').status_code == 200
+    assert client.delete('/animals/1').status_code == 401
+    controller.release('read')
+    assert client.get('/').status_code == 200
+    assert client.get('/').status_code == 200
+    stats = controller.stats()
+    assert (stats['read_admitted'], stats['read_shed'], stats['read_in_flight']) == (3, 1, 0)
+    assert (stats['write_admitted'], stats['write_in_flight']) == (1, 0)
+    assert 'admission_read_shed' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_request_waits_for_place(controller):
+    """This test checks that request waits for place until deadline and only max_queue requests wait"""
+    assert controller.admit('read')
+    threading.Timer(0.01, controller.release, ('read',)).start()
+    assert controller.admit('read')
+
+    controller.queue_timeout = 1
+    waiting = threading.Thread(target=controller.admit, args=('read',))
+    waiting.start()
+    while not controller.stats()['read_waiting']:
+        time.sleep(0.001)
+    start = time.monotonic()
+    assert not controller.admit('read')
+    assert time.monotonic() - start < 0.5
+    controller.release('read')
+    waiting.join()
+    stats = controller.stats()
+    assert (stats['read_admitted'], stats['read_shed'], stats['read_waiting']) == (3, 1, 0)
+
+
+def test_rate_limit_per_client(test_app, client, controller):
+    """This test checks that every client (address or identity of token) has its own token bucket"""
+    controller.rate, controller.burst = 0.5, 2
+    assert [client.get('/').status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get('/').headers['Retry-After'] == '2'
+    assert client.get('/', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+    with test_app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+    assert client.get('/', headers=headers).status_code == 200
+    assert client.get('/', headers={'Authorization': 'Bearer invalid'}).status_code == 429
+    stats = controller.stats()
+    assert (stats['rate_limited'], stats['clients']) == (3, 3)
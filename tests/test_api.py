@@ -1,6 +1,9 @@
 """API tests"""
 
+import json
 from urllib.parse import urlencode
+from flask_jwt_extended import create_access_token
+from app.utils import versions
 
 
 def test_login(client, mocker):
@@ -91,3 +94,146 @@ def test_get_species_info(client, mocker):
     response = client.get('/species/1')
     assert response.status_code == 200
     assert response.json == expected
+
+
+def test_get_animals_page(client, mocker):
+    """This test checks that page of animals is requested by limit and after
+    and that response contains link to the next page"""
+    expected = [{"id": 5, "name": "lokf"}, {"id": 6, "name": "l"}]
+    mock = mocker.patch("app.dao.dao.AnimalDAO.get_animals")
+    mock.return_value = expected
+    response = client.get('/animals?limit=2&after=4')
+    assert response.status_code == 200
+    assert response.json == expected
+    mock.assert_called_once_with(limit=2, after=4, filters={}, sort=('id', False))
+    assert response.headers['Link'] == '</animals?limit=2&after=6>; rel="next"'
+
+
+def test_get_animals_filtered_page(client, mocker):
+    """This test checks that filters and sort order are passed to dao and kept in link to the next page"""
+    mock = mocker.patch("app.dao.dao.AnimalDAO.get_animals")
+    mock.return_value = [{"id": 9, "name": "lokf"}, {"id": 3, "name": "l"}]
+    response = client.get('/animals?species_id=2&min_price=10.5&sort=-price&limit=2')
+    assert response.status_code == 200
+    mock.assert_called_once_with(limit=2, after=None, filters={'species_id': 2, 'min_price': 10.5},
+                                 sort=('price', True))
+    assert response.headers['Link'] == \
+        '</animals?species_id=2&min_price=10.5&sort=-price&limit=2&after=3>; rel="next"'
+
+
+def test_get_animals_wrong_filters(client):
+    """This test checks that filters with wrong values and unknown sort columns are rejected"""
+    for query in ('species_id=cat', 'max_price=nan', 'sort=name', 'sort=-description'):
+        response = client.get('/animals?' + query)
+        assert response.status_code == 400, query
+        assert response.json['message']
+
+
+def test_get_animals_wrong_limit(client, mocker):
+    """This test checks that not positive limit and negative after are rejected and that after=0 is the first page"""
+    for query, message in (('limit=-1', "Parameter 'limit' should be positive integer"),
+                           ('limit=0', "Parameter 'limit' should be positive integer"),
+                           ('after=-1', "Parameter 'after' should be non-negative integer")):
+        response = client.get('/animals?' + query)
+        assert (response.status_code, response.json['message']) == (400, message), query
+    mock = mocker.patch("app.dao.dao.AnimalDAO.get_animals", return_value=[])
+    assert client.get('/animals?limit=2&after=0').status_code == 200
+    mock.assert_called_once_with(limit=2, after=0, filters={}, sort=('id', False))
+
+
+def test_search_page(client, mocker):
+    """This test checks that search is requested by words and link to the next page keeps kind of last result"""
+    expected = [{"kind": "animal", "id": 4, "name": "tom", "snippet": "grey <mark>cat</mark>"},
+                {"kind": "species", "id": 1, "name": "cat", "snippet": "good <mark>cat</mark>"}]
+    mock = mocker.patch("app.dao.dao.SearchDAO.search")
+    mock.return_value = expected
+    response = client.get('/search?q=cat&limit=2&after=3&after_kind=animal')
+    assert response.status_code == 200
+    assert response.json == expected
+    mock.assert_called_once_with('cat', limit=2, after=3, after_kind='animal')
+    assert response.headers['Link'] == '</search?q=cat&limit=2&after=1&after_kind=species>; rel="next"'
+
+
+def test_search_wrong_params(client):
+    """This test checks that search without words and next page without kind of last result are rejected"""
+    for query in ('', 'q=', 'q=%2A%22', 'q=cat&after=2', 'q=cat&after=2&after_kind=center'):
+        response = client.get('/search?' + query)
+        assert response.status_code == 400, query
+        assert response.json['message']
+
+
+def test_get_centers_stream(client, mocker):
+    """This test checks that streamed list of centers is valid json array"""
+    expected = [{"id": 1, "login": "ann"}, {"id": 2, "login": "a"}]
+    mock = mocker.patch("app.dao.dao.AnimalCenterDAO.iter_centers_json")
+    mock.return_value = (json.dumps(center) for center in expected)
+    response = client.get('/centers?stream=true')
+    assert response.status_code == 200
+    assert response.json == expected
+    assert 'Link' not in response.headers
+
+
+def test_get_animals_not_modified(test_app, client, mocker):
+    """This test checks that animals are not listed again while client has
+    current ETag and that any change of animals gives new ETag"""
+    mock = mocker.patch("app.dao.dao.AnimalDAO.get_animals")
+    mock.return_value = [{"id": 1, "name": "toto"}]
+    response = client.get('/animals')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/"') and response.headers['Last-Modified']
+
+    response = client.get('/animals', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert client.get('/animals', headers={'If-None-Match': '"x", ' + etag[2:]}).status_code == 304
+    assert mock.call_count == 1
+
+    with test_app.app_context():
+        versions.bump('animal')
+    response = client.get('/animals', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert mock.call_count == 2
+
+
+def test_conditional_headers():
+    """This test checks that If-None-Match is compared weakly and wins over If-Modified-Since"""
+    headers = versions.headers('a-1', 1600000000.5)
+    assert headers == {'ETag': 'W/"a-1"', 'Last-Modified': 'Sun, 13 Sep 2020 12:26:40 GMT'}
+    assert versions.not_modified('a-1', 1600000000.5, 'W/"a-1"', None)
+    assert versions.not_modified('a-1', 1600000000.5, '"b", "a-1"', None)
+    assert versions.not_modified('a-1', 1600000000.5, '*', None)
+    assert not versions.not_modified('a-1', 1600000000.5, '"a-2"', headers['Last-Modified'])
+    assert versions.not_modified('a-1', 1600000000.5, None, headers['Last-Modified'])
+    assert not versions.not_modified('a-1', 1600000001, None, headers['Last-Modified'])
+    assert not versions.not_modified('a-1', 1600000000, None, 'yesterday')
+
+
+def test_get_species_info_not_modified_by_other_species(test_app, client, mocker):
+    """This test checks that ETag of species depends only on this species"""
+    mock = mocker.patch("app.dao.dao.SpeciesDAO.get_species_inform")
+    mock.return_value = [{"id": 1, "name": "cat", "description": "good cat", "price": 160.0}, []]
+    etag = client.get('/species/1').headers['ETag']
+    with test_app.app_context():
+        versions.bump(('species', 2))
+    response = client.get('/species/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_add_animals_bulk(client, test_app, mocker):
+    """This test checks that valid animals are sent to dao at once and that
+    every animal gets its own result"""
+    with test_app.app_context():
+        token = create_access_token(identity=1)
+    mock = mocker.patch("app.dao.dao.AnimalDAO.add_animals")
+    mock.return_value = [{'id': 7, 'name': 'toto'}, None]
+    mocker.patch("app.utils.log.log_request")
+    animal = {'name': 'toto', 'description': 't', 'price': 100, 'species_id': 1, 'age': 3}
+    body = '\n'.join([json.dumps(animal), '{"name": "momo"}', json.dumps(dict(animal, species_id=9))])
+    response = client.post('/animals/bulk', data=body, content_type='application/x-ndjson',
+                           headers={'Authorization': 'Bearer ' + token})
+    assert response.status_code == 207
+    assert response.json['created'] == 1
+    assert [result['status'] for result in response.json['results']] == ['created', 'error', 'error']
+    assert response.json['results'][0]['id'] == 7
+    assert response.json['results'][2]['message'] == 'No such species'
+    mock.assert_called_once_with([animal, dict(animal, species_id=9)], 1)
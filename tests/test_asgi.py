@@ -0,0 +1,155 @@
+"""Tests of async serving mode"""
+
+import asyncio
+import json
+import pytest
+from app.asgi import create_asgi_app
+from app.dao import dao_async, species_stats
+from app.utils import changes
+from tests.test_dao import add_centers_and_animals
+
+pytest.importorskip('aiosqlite')
+
+
+async def call(app, method, path, body=None, headers=None):
+    """Function that sends one request to ASGI application and collects response"""
+    path, _, query = path.partition('?')
+    headers = dict(headers or {})
+    if body is not None:
+        body = json.dumps(body).encode()
+        headers.setdefault('Content-Type', 'application/json')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(key.lower().encode(), value.encode()) for key, value in headers.items()]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body or b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    response_headers = {key.decode(): value.decode() for key, value in messages[0]['headers']}
+    data = b''.join(message.get('body', b'') for message in messages[1:])
+    return messages[0]['status'], response_headers, data
+
+
+def test_async_app_answers_like_flask_app(db_app):
+    """This test checks that async app returns the same listings as flask app and that writes work"""
+    add_centers_and_animals(db_app, animals_count=3)
+    species_stats.rebuild(db_app.db.engine)
+    client = db_app.test_client()
+    app = create_asgi_app(db_app)
+
+    async def scenario():
+        try:
+            await check(app, client)
+        finally:
+            await app.close()
+
+    async def check(app, client):
+        for path in ('/animals', '/animals?limit=2', '/animals/1', '/centers', '/centers/1', '/species',
+                     '/species/1', '/search?q=good&limit=1', '/search?q=animal1', '/search?q=%2A',
+                     '/search?q=good&limit=1&after=1&after_kind=species', '/animals?stream=true',
+                     '/animals?sort=-id&limit=2&after=3&center_id=1', '/animals?sort=price&max_age=5&stream=true'):
+            status, headers, data = await call(app, 'GET', path)
+            expected = client.get(path)
+            assert status == expected.status_code, path
+            assert json.loads(data) == expected.json, path
+            assert headers.get('link') == expected.headers.get('Link'), path
+            assert headers.get('etag') == expected.headers.get('ETag'), path
+        status, headers, _ = await call(app, 'GET', '/animals', headers={'If-None-Match': headers['etag']})
+        assert status == 304
+
+        status, _, data = await call(app, 'POST', '/register',
+                                     {'login': 'bob', 'password': 'secret', 'address': 'lp'})
+        assert status == 201
+        token = {'Authorization': 'Bearer ' + json.loads(data)['access_token']}
+        status, _, data = await call(app, 'GET', '/login?login=bob&password=secret')
+        assert status == 200 and 'access_token' in json.loads(data)
+        animal = {'name': 'momo', 'description': 'm', 'age': 2, 'species_id': 1, 'price': 10}
+        assert (await call(app, 'POST', '/animals', animal))[0] == 401
+        status, _, data = await call(app, 'POST', '/animals', animal, token)
+        assert status == 201 and json.loads(data) == {'id': 4, 'name': 'momo'}
+        status, _, data = await call(app, 'POST', '/animals/bulk', [animal, dict(animal, species_id=9)], token)
+        assert status == 207 and json.loads(data)['created'] == 1
+        status, _, data = await call(app, 'PUT', '/animals/4', {'age': 5}, token)
+        assert status == 200 and json.loads(data)['age'] == 5
+        assert (await call(app, 'PUT', '/animals/4', {'wrong': 5}, token))[0] == 400
+        assert (await call(app, 'DELETE', '/animals/4', None, token))[0] == 200
+        assert (await call(app, 'GET', '/animals/4'))[0] == 404
+        status, _, data = await call(app, 'GET', '/species')
+        assert json.loads(data) == [{'species_name': 'cat', 'count_of_animals': 4, 'min_price': 10,
+                                     'max_price': 100, 'avg_price': 77.5}]
+
+    asyncio.run(scenario())
+
+
+def test_async_apps_have_own_daos(db_app):
+    """This test checks that every async app builds its daos from its own config"""
+    db_app.config.update(BULK_BATCH_SIZE=7, SEARCH_HIGHLIGHT=('[', ']'))
+    app, other = create_asgi_app(db_app), create_asgi_app(db_app)
+    assert app.dao.AnimalDAO.batch_size == 7 and app.dao.SearchDAO.highlight == ('[', ']')
+    assert app.dao.AnimalDAO.database is app.database is not other.database
+
+
+def test_async_writes_of_missing_animal_change_nothing(db_app, mocker):
+    """This test checks that async delete and update of animal that is not there publish no events
+    and don't change stats, while update of existing animal keeps stats right"""
+    add_centers_and_animals(db_app, animals_count=1)
+    species_stats.rebuild(db_app.db.engine)
+    feed = mocker.patch.object(changes, 'feed', changes.ChangeFeed())
+    stats = "SELECT * FROM species_stats ORDER BY species_id;"
+    kept = db_app.db.engine.execute(stats).fetchall()
+
+    async def scenario():
+        database = dao_async.AsyncDatabase()
+        await database.open(db_app.db.engine.url.database, {}, read_pool_size=1)
+        try:
+            animal_dao = dao_async.AnimalsDaoAsync(database)
+            await animal_dao.delete_animal(99)
+            await animal_dao.update_animal({'id': 99, 'species_id': 2, 'price': 1})
+            await animal_dao.update_animal({'id': 1, 'price': 1})
+        finally:
+            await database.close()
+
+    asyncio.run(scenario())
+    assert [(event['action'], event['id']) for event in feed.after(0)] == [('update', 1)]
+    updated = db_app.db.engine.execute(stats).fetchall()
+    species_stats.rebuild(db_app.db.engine)
+    assert db_app.db.engine.execute(stats).fetchall() == updated != kept
+
+
+def test_async_change_stream(db_app, mocker):
+    """This test checks that async app streams changes made by its writes and stops when client disconnects"""
+    add_centers_and_animals(db_app, animals_count=1)
+    feed = mocker.patch.object(changes, 'feed', changes.ChangeFeed())
+    app = create_asgi_app(db_app)
+
+    async def scenario():
+        disconnect = asyncio.get_running_loop().create_future()
+        chunks = []
+
+        async def receive():
+            return await disconnect
+
+        async def send(message):
+            chunks.append(message.get('body', b''))
+            if len(chunks) == 3:
+                disconnect.set_result({'type': 'http.disconnect'})
+
+        try:
+            stream = asyncio.ensure_future(app({'type': 'http', 'method': 'GET', 'path': '/changes',
+                                                'query_string': b'', 'headers': []}, receive, send))
+            while not feed.subscribers:
+                await asyncio.sleep(0.001)
+            await app.dao.SpeciesDAO.add_species({'name': 'owl', 'description': 'o', 'price': 5})
+            await asyncio.wait_for(stream, 1)
+        finally:
+            await app.close()
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    assert chunks[1].startswith(b'retry: ')
+    assert b'"action":"create","entity":"species","id":2' in chunks[2]
+    assert feed.stats()['subscribers'] == 0
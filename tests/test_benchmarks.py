@@ -0,0 +1,41 @@
+"""Tests of benchmarks"""
+
+from app.main import create_app
+from benchmarks import bench_routes, bench_json, bench_validation
+
+
+def test_measure_routes(tmp_path):
+    """This test checks that benchmark seeds database and every route answers with expected status"""
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'bench.db')
+    bench_routes.seed(app, 200)
+    results = bench_routes.measure_routes(app, 200, requests=2, slow_requests=1, warmup=0)
+    assert [result['case'] for result in results] == [case[0] for case in bench_routes.build_cases(200, None)]
+    assert all(result['errors'] == 0 for result in results), results
+    app.db.session.remove()
+
+
+def test_compare_flags_regressions():
+    """This test checks that compare flags only routes that became slower than threshold"""
+    old = {'results': [{'size': 1, 'mode': 'sql', 'case': 'GET /', 'p50_ms': 1.0},
+                       {'size': 1, 'mode': 'sql', 'case': 'GET /species', 'p50_ms': 1.0}]}
+    new = {'results': [{'size': 1, 'mode': 'sql', 'case': 'GET /', 'p50_ms': 1.1},
+                       {'size': 1, 'mode': 'sql', 'case': 'GET /species', 'p50_ms': 1.5}]}
+    rows = bench_routes.compare(old, new, threshold=0.2)
+    assert [(key[2], regression) for key, _, _, _, regression in rows] == [('GET /', False), ('GET /species', True)]
+
+
+def test_json_variants_give_the_same_bytes():
+    """This test checks that every json encoding of benchmark gives the same output"""
+    results = bench_json.measure(bench_json.make_rows(300, non_ascii=True), repeat=1)
+    assert [name for name, _, _ in results] == \
+        ['page stdlib', 'page fast', 'page fast nan', 'stream dicts', 'stream rows']
+    assert all(same for _, _, same in results)
+
+
+def test_validation_variants():
+    """This test checks that validation benchmark measures every variant of every schema"""
+    results = bench_validation.measure(requests=2, repeat=1)
+    assert [(name, variant) for name, variant, _ in results] == \
+        [(name, variant) for name in bench_validation.BODIES
+         for variant in ('expects_json', 'jsonschema', 'fast', 'decorator')]
@@ -0,0 +1,127 @@
+"""Tests of dao result cache"""
+
+import sqlite3
+from flask_migrate import upgrade
+from app.dao import cache as dao_cache, dao, dao_sql
+from app.main import create_app
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """This test checks that cache keeps only max_entries results"""
+    cache = dao_cache.LRUCache(max_entries=2)
+    cache.set(('animal', 1), 'a')
+    cache.set(('animal', 2), 'b')
+    cache.get(('animal', 1))
+    cache.set(('animal', 3), 'c')
+    assert cache.get(('animal', 2)) is dao_cache._MISSING
+    assert cache.get(('animal', 1)) == 'a'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_cache_ttl_and_max_items(mocker):
+    """This test checks that old results and too long lists are not returned"""
+    cache = dao_cache.LRUCache(ttl=10, max_items=2)
+    monotonic = mocker.patch('app.dao.cache.monotonic')
+    monotonic.return_value = 100
+    cache.set(('animals', None, None), [1, 2, 3])
+    cache.set(('center', 1), ({'id': 1}, [1]))
+    assert cache.get(('animals', None, None)) is dao_cache._MISSING
+    assert cache.get(('center', 1)) == ({'id': 1}, [1])
+    monotonic.return_value = 111
+    assert cache.get(('center', 1)) is dao_cache._MISSING
+
+
+def test_cached_dao_invalidated_by_writes(db_app):
+    """This test checks that reads are served from cache and writes drop
+    animal, its center, its species and species counts"""
+    cache = dao_cache.LRUCache()
+    animal_dao = dao_cache.CachedAnimalDAO(dao_sql.AnimalsDaoSql(), cache)
+    center_dao = dao_cache.CachedAnimalCenterDAO(dao_sql.AnimalCentersDaoSql(), cache)
+    species_dao = dao_cache.CachedSpeciesDAO(dao_sql.SpeciesDaoSql(), cache)
+    db_app.db.engine.execute("INSERT INTO animal_center (login, password_hash, address) VALUES ('ann', 'x', 'lp');")
+    db_app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('cat', 'good cat', 160);")
+    db_app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('dog', 'good dog', 300);")
+
+    assert animal_dao.get_animals() == []
+    assert animal_dao.get_animals() == []
+    assert center_dao.get_center_inform(1)[1] == []
+    assert species_dao.get_species_inform(1)[1] == []
+    assert cache.stats()['hits'] == 1
+
+    animal = animal_dao.add_animal({'name': 'toto', 'description': 't', 'price': 100, 'species_id': 1, 'age': 3}, 1)
+    assert animal_dao.get_animals() == [animal]
+    assert center_dao.get_center_inform(1)[1] == [animal]
+    assert species_dao.get_species_inform(1)[1] == [animal]
+    assert ('cat', 1) in [(row['species_name'], row['count_of_animals']) for row in species_dao.get_species()]
+
+    animal_dao.update_animal(dict(animal_dao.get_animal(animal['id']), species_id=2))
+    assert species_dao.get_species_inform(1)[1] == []
+    assert species_dao.get_species_inform(2)[1] == [animal]
+    assert animal_dao.get_animal(animal['id'])['species_id'] == 2
+
+    animal_dao.delete_animal(animal['id'])
+    assert animal_dao.get_animal(animal['id']) is None
+    assert center_dao.get_center_inform(1)[1] == []
+    assert ('dog', 0) in [(row['species_name'], row['count_of_animals']) for row in species_dao.get_species()]
+
+
+def test_cache_keeps_no_stale_or_negative_lookups(db_app):
+    """This test checks that result loaded before concurrent invalidation is not stored
+    and that free login and species name are not cached"""
+    cache = dao_cache.LRUCache()
+    center_dao = dao_cache.CachedAnimalCenterDAO(dao_sql.AnimalCentersDaoSql(), cache)
+    species_dao = dao_cache.CachedSpeciesDAO(dao_sql.SpeciesDaoSql(), cache)
+
+    def load_during_write():
+        result = species_dao._dao.get_species()
+        cache.invalidate_namespace('species_list')
+        return result
+    species_dao._cached(('species_list',), load_during_write)
+    assert cache.get(('species_list',)) is dao_cache._MISSING
+
+    assert center_dao.get_center_by_login('ann') is None
+    assert species_dao.get_species_by_name('cat') is None
+    db_app.db.engine.execute("INSERT INTO animal_center (login, password_hash, address) VALUES ('ann', 'x', 'lp');")
+    db_app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('cat', 'good cat', 160);")
+    assert center_dao.get_center_by_login('ann')['id'] == 1
+    assert species_dao.get_species_by_name('cat') is not None
+
+
+def test_duplicate_written_after_check_is_refused(db_app, mocker):
+    """This test checks that login and species name taken after check of route answer 400 instead of 500"""
+    client = db_app.test_client()
+    assert client.post('/register', json={'login': 'ann', 'password': 'secret', 'address': 'lp'}).status_code == 201
+    token = client.get('/login?login=ann&password=secret').json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+    assert client.post('/species', json={'name': 'cat', 'description': 'c', 'price': 1}, headers=headers).status_code \
+        == 201
+    mocker.patch.object(dao.AnimalCenterDAO, 'get_center_by_login', return_value=None)
+    mocker.patch.object(dao.SpeciesDAO, 'get_species_by_name', return_value=None)
+    response = client.post('/register', json={'login': 'ann', 'password': 'secret', 'address': 'lp'})
+    assert (response.status_code, response.json['message']) == (400, 'This user name is already taken')
+    response = client.post('/species', json={'name': 'cat', 'description': 'c', 'price': 1}, headers=headers)
+    assert (response.status_code, response.json['message']) == (400, 'This species is already taken')
+
+
+def test_cached_body_matches_etag(tmp_path):
+    """This test checks that write of other process (which doesn't invalidate cache) changes
+    both ETag and body, and that cached body is still used while version stays the same"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'CACHE_ENABLED': True})
+    with app.app_context():
+        upgrade()
+        app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('cat', 'good cat', 160);")
+        client = app.test_client()
+        first = client.get('/species')
+        assert client.get('/species').json == first.json
+        assert app.extensions['dao'].cache.stats()['hits'] == 1
+
+        connection = sqlite3.connect(str(tmp_path / 'test.db'))
+        connection.execute("INSERT INTO species (name, description, price) VALUES ('dog', 'good dog', 300);")
+        connection.commit()
+        connection.close()
+        response = client.get('/species', headers={'If-None-Match': first.headers['ETag']})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != first.headers['ETag']
+        assert sorted(row['species_name'] for row in response.json) == ['cat', 'dog']
+        assert client.get('/species', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        app.db.session.remove()
@@ -0,0 +1,127 @@
+"""Tests of feed of changes and GET /changes stream"""
+
+import asyncio
+import json
+import threading
+import pytest
+from app.utils import changes
+from tests.test_dao import add_centers_and_animals
+
+
+@pytest.fixture
+def feed(mocker):
+    feed = changes.ChangeFeed(backlog=3, max_subscribers=1)
+    mocker.patch.object(changes, 'feed', feed)
+    return feed
+
+
+def events(chunk):
+    """:return: List of tuples (id, event name, data) of Server-Sent Events in chunk."""
+    result = []
+    for block in chunk.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'data' in fields:
+            result.append((fields['id'], fields.get('event', 'message'), json.loads(fields['data'])))
+    return result
+
+
+def test_backlog_and_resume(feed):
+    """This test checks that client gets events after its Last-Event-ID while they are kept, otherwise reset"""
+    feed.publish('species', 'create', {'id': 1}, None, {'id': 2})
+    assert feed.publish('animal', 'delete', {'id': 1, 'center_id': 1, 'species_id': 1}, {'id': 3}) == 4
+    assert feed.after(0) is None
+    assert [event['seq'] for event in feed.after(1)] == [2, 3, 4]
+    assert feed.after(4) == [] and feed.after(5) is None
+
+    sequence, chunks = changes.resume('{}:2'.format(changes.token))
+    assert sequence == 4
+    assert chunks[0] == 'retry: {}\n\n'.format(changes.RETRY_MS)
+    assert events(''.join(chunks)) == [
+        ('{}:3'.format(changes.token), 'message',
+         {'seq': 3, 'entity': 'animal', 'action': 'delete', 'id': 1, 'center_id': 1, 'species_id': 1}),
+        ('{}:4'.format(changes.token), 'message', {'seq': 4, 'entity': 'animal', 'action': 'delete', 'id': 3})]
+    assert changes.resume(None) == (4, chunks[:1])
+    for last_event_id in ('{}:0'.format(changes.token), 'other-process:3', 'garbage'):
+        sequence, chunks = changes.resume(last_event_id)
+        assert sequence == 4
+        assert events(chunks[1]) == [('{}:4'.format(changes.token), 'reset', {'seq': 4})]
+    assert feed.stats() == {'sequence': 4, 'backlog': 3, 'subscribers': 0, 'rejected': 0, 'resets': 3}
+
+
+@pytest.mark.parametrize('dao_type', ['sql', 'orm'])
+def test_dao_writes_publish_events(db_app, mocker, dao_type):
+    """This test checks that every write method of dao publishes its changes and that writes
+    of animal that is already deleted publish nothing"""
+    add_centers_and_animals(db_app, animals_count=1)
+    daos = db_app.extensions['dao']
+    feed = mocker.patch.object(changes, 'feed', changes.ChangeFeed())
+    animal = {'name': 'momo', 'description': 'm', 'age': 2, 'species_id': 1, 'price': 10}
+    animal_id = daos.AnimalDAO.add_animal(animal, 1)['id']
+    daos.AnimalDAO.add_animals([animal, dict(animal, species_id=99)], 1)
+    daos.AnimalDAO.update_animal({'id': animal_id, 'species_id': 2})
+    daos.AnimalDAO.delete_animal(animal_id)
+    daos.AnimalDAO.delete_animal(animal_id)
+    daos.AnimalDAO.update_animal({'id': animal_id, 'species_id': 1})
+    species = daos.SpeciesDAO.add_species({'name': 'owl', 'description': 'o', 'price': 5})
+    center_id = daos.AnimalCenterDAO.add_center({'login': 'bob', 'password': 'secret', 'address': 'lp'})
+    events = feed.after(0)
+    assert events[1]['items'] == [{'id': animal_id + 1, 'center_id': 1, 'species_id': 1}]
+    assert [(event['entity'], event['action'], event.get('id'), event.get('species_id')) for event in events] == [
+        ('animal', 'create', animal_id, 1), ('animal', 'create', None, None),
+        ('animal', 'update', animal_id, 2), ('animal', 'delete', animal_id, 2),
+        ('species', 'create', species['id'], None), ('center', 'create', center_id, None)]
+
+
+def test_bulk_is_one_event(feed):
+    """This test checks that batch of changes takes one place of backlog and empty batch publishes nothing"""
+    feed.publish('species', 'create', {'id': 1})
+    animals = [{'id': number, 'center_id': 1, 'species_id': 1, 'name': 'a'} for number in range(10)]
+    changes.animals_changed('create', *animals, None, batch=True)
+    assert feed.publish('animal', 'create', None, batch=True) == 2
+    assert feed.after(0)[0]['id'] == 1
+    event = feed.after(1)[0]
+    assert (event['seq'], event['entity'], event['action']) == (2, 'animal', 'create')
+    assert event['items'] == [{'id': number, 'center_id': 1, 'species_id': 1} for number in range(10)]
+
+
+def test_async_streams_have_own_cap(feed):
+    """This test checks that caller can give its own cap of streams"""
+    assert feed.subscribe()
+    assert not feed.subscribe()
+    assert feed.subscribe(2)
+    assert not feed.subscribe(2)
+    assert feed.subscribe(0)
+
+
+def test_stream(db_app, feed):
+    """This test checks that stream sends missed events, new events and heartbeats,
+    and that count of streams is capped"""
+    db_app.config['CHANGES_HEARTBEAT'] = 0.01
+    client = db_app.test_client()
+    feed.publish('species', 'create', {'id': 1}, {'id': 2})
+    response = client.get('/changes', headers={'Last-Event-ID': '{}:1'.format(changes.token)}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/changes').status_code == 503
+    stream = iter(response.response)
+    assert [data['id'] for _, _, data in events(next(stream).decode())] == [2]
+    feed.publish('center', 'create', {'id': 7})
+    assert events(next(stream).decode())[0][2] == {'seq': 3, 'entity': 'center', 'action': 'create', 'id': 7}
+    assert next(stream) == b': ping\n\n'
+    feed.publish('species', 'create', *[{'id': number} for number in range(5)])
+    assert events(next(stream).decode())[0][1] == 'reset'
+    response.close()
+    assert feed.stats()['subscribers'] == 0 and feed.stats()['rejected'] == 1
+
+
+def test_async_wait_is_woken_by_other_thread(feed):
+    """This test checks that one publish from request thread wakes every waiting coroutine"""
+    async def scenario():
+        waiters = [asyncio.ensure_future(feed.wait_async(0, 5)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        threading.Thread(target=feed.publish, args=('species', 'create', {'id': 1})).start()
+        return await asyncio.wait_for(asyncio.gather(*waiters), 1)
+
+    assert [[event['id'] for event in result] for result in asyncio.run(scenario())] == [[1]] * 3
+    assert asyncio.run(feed.wait_async(1, 0.01)) == []
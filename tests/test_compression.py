@@ -0,0 +1,88 @@
+"""Tests of response compression"""
+
+import gzip
+import pytest
+from app.utils import compression
+from tests.test_dao import add_centers_and_animals
+
+
+@pytest.fixture
+def compressor(mocker):
+    compressor = compression.Compressor(min_size=100)
+    mocker.patch.object(compression, 'compressor', compressor)
+    return compressor
+
+
+def test_choose_encoding(compressor):
+    """This test checks that encoding is chosen by quality from Accept-Encoding"""
+    assert compressor.choose_encoding('gzip, deflate') == 'gzip'
+    assert compressor.choose_encoding('deflate;q=1, GZIP;q=0.5') == 'gzip'
+    assert compressor.choose_encoding('*') == 'gzip'
+    assert compressor.choose_encoding('*, gzip;q=0') is None
+    assert compressor.choose_encoding('identity') is None
+    assert compressor.choose_encoding(None) is None
+
+
+def test_compressed_listing_is_cached_by_body(db_app, compressor):
+    """This test checks that big listings are compressed, small responses and streams are not,
+    and that unchanged listing is compressed only once"""
+    # compression is off by default
+    compression.init_app(db_app)
+    add_centers_and_animals(db_app, animals_count=20)
+    client = db_app.test_client()
+    plain = client.get('/animals')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    for _ in range(3):
+        response = client.get('/animals', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == plain.data
+        assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data)
+    assert compressor.stats()['compressed'] == 1
+    assert compressor.stats()['cache_hits'] == 2
+
+    db_app.db.engine.execute("INSERT INTO animal (center_id, name, description, age, species_id, price) "
+                             "VALUES (1, 'momo', 'm', 1, 1, 10);")
+    response = client.get('/animals', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(response.data) == client.get('/animals').data != plain.data
+    assert compressor.stats()['compressed'] == 2
+    for path in ('/animals/1', '/animals?stream=true', '/animals?limit=1'):
+        assert 'Content-Encoding' not in client.get(path, headers={'Accept-Encoding': 'gzip'}).headers, path
+    stats = compressor.stats()
+    assert 0 < stats['ratio'] < 1 and stats['bytes_in'] > stats['bytes_out']
+
+
+def test_cpu_budget(compressor):
+    """This test checks that bodies are sent uncompressed while cpu budget is spent"""
+    compressor.cpu_budget = 0.001
+    compressor._credit = -1.0
+    body = b'{"id":1,"name":"toto"},' * 100
+    assert compressor.compress(body, 'gzip') == (None, body)
+    assert compressor.stats()['over_budget'] == 1
+    compressor.cpu_budget = 0
+    encoding, compressed = compressor.compress(body, 'gzip')
+    assert encoding == 'gzip' and gzip.decompress(compressed) == body
+
+
+def test_cache_is_bounded(compressor):
+    """This test checks that the least recently used bodies are dropped when cache is full"""
+    compressor.cache_max_entries = 2
+    bodies = [bytes([number]) * 1000 for number in range(3)]
+    for number, body in enumerate(bodies):
+        compressor.compress(body, 'gzip', cache=True)
+    compressor.compress(bodies[2], 'gzip', cache=True)
+    compressor.compress(bodies[0], 'gzip', cache=True)
+    stats = compressor.stats()
+    assert (stats['cache_size'], stats['cache_hits'], stats['compressed']) == (2, 1, 4)
+    assert stats['cache_bytes'] == sum(len(body) for body in compressor._cache.values())
+
+
+def test_cache_never_sends_other_body(compressor):
+    """This test checks that kept body is returned only for the same uncompressed body and encoding,
+    whatever url or ETag it was sent with"""
+    first, second = b'{"id":1}' * 100, b'{"id":2}' * 100
+    assert gzip.decompress(compressor.compress(first, 'gzip', cache=True)[1]) == first
+    assert gzip.decompress(compressor.compress(second, 'gzip', cache=True)[1]) == second
+    assert gzip.decompress(compressor.compress(first, 'gzip', cache=True)[1]) == first
+    assert (compressor.stats()['compressed'], compressor.stats()['cache_hits']) == (2, 1)
@@ -0,0 +1,375 @@
+"""DAO tests that run against temporary database"""
+
+import gc
+import pytest
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from flask_migrate import upgrade
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from app.dao import dao, dao_sql, dao_orm_models, write_behind, species_stats
+from app.main import create_app
+from app.models.models import AccessRequest
+from app.utils import changes, versions
+
+
+def add_centers_and_animals(app, animals_count=5):
+    app.db.engine.execute("INSERT INTO animal_center (login, password_hash, address) VALUES ('ann', 'x', 'lp');")
+    app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('cat', 'good cat', 160);")
+    for number in range(animals_count):
+        app.db.engine.execute(
+            "INSERT INTO animal (center_id, name, description, age, species_id, price) "
+            "VALUES (1, :name, 'd', 2, 1, 100);", {'name': 'animal{}'.format(number)})
+
+
+@pytest.fixture(params=['sql', 'orm'])
+def animal_dao(request):
+    return dao_sql.AnimalsDaoSql() if request.param == 'sql' else dao_orm_models.AnimalORM()
+
+
+@pytest.fixture(params=['sql', 'orm'])
+def center_dao(request):
+    return dao_sql.AnimalCentersDaoSql() if request.param == 'sql' else dao_orm_models.AnimalCenterORM()
+
+
+def test_get_animals_keyset_pages(db_app, animal_dao):
+    """This test checks that pages follow each other by id without gaps and duplicates"""
+    add_centers_and_animals(db_app)
+    first = animal_dao.get_animals(limit=2)
+    second = animal_dao.get_animals(limit=2, after=first[-1]['id'])
+    last = animal_dao.get_animals(limit=2, after=second[-1]['id'])
+    assert [animal['id'] for animal in first + second + last] == [1, 2, 3, 4, 5]
+    assert animal_dao.get_animals() == first + second + last
+
+
+def test_iter_animals(db_app, animal_dao):
+    """This test checks that streamed animals are the same as the full list"""
+    add_centers_and_animals(db_app)
+    assert list(animal_dao.iter_animals()) == animal_dao.get_animals()
+
+
+ANIMALS = [  # (center_id, species_id, age, price)
+    (1, 1, 3, 50.0), (1, 2, 1, None), (2, 1, 3, 20.0), (1, 1, 5, 50.0), (2, 2, None, 10.0),
+    (1, 1, 2, None), (2, 1, 3, 70.0), (1, 2, 4, 20.0), (2, 1, 1, 50.0), (1, 1, None, 5.0),
+]
+
+
+def add_filtered_animals(app):
+    add_centers_and_animals(app, animals_count=0)
+    app.db.engine.execute("INSERT INTO animal_center (login, password_hash, address) VALUES ('bob', 'x', 'lp');")
+    app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('dog', 'good dog', 300);")
+    for center_id, species_id, age, price in ANIMALS:
+        app.db.engine.execute("INSERT INTO animal (center_id, name, description, age, species_id, price) "
+                              "VALUES (?, 'a', 'd', ?, ?, ?);", (center_id, age, species_id, price))
+
+
+def expected_ids(animal_filters, sort):
+    """Filter and sort animals in python, NULL is smaller than any value like in sqlite"""
+    conditions = {'species_id': lambda animal, value: animal[1] == value,
+                  'center_id': lambda animal, value: animal[0] == value,
+                  'min_age': lambda animal, value: animal[2] is not None and animal[2] >= value,
+                  'max_age': lambda animal, value: animal[2] is not None and animal[2] <= value,
+                  'min_price': lambda animal, value: animal[3] is not None and animal[3] >= value,
+                  'max_price': lambda animal, value: animal[3] is not None and animal[3] <= value}
+    column, descending = sort
+    index = {'id': None, 'age': 2, 'price': 3}[column]
+    matched = [(animal_id, animal) for animal_id, animal in enumerate(ANIMALS, 1)
+               if all(conditions[name](animal, value) for name, value in animal_filters.items())]
+    matched.sort(key=lambda item: (item[1][index] is not None, item[1][index] or 0, item[0]) if index else item[0],
+                 reverse=descending)
+    return [animal_id for animal_id, _ in matched]
+
+
+@pytest.mark.parametrize('animal_filters, sort', [
+    ({}, ('id', True)),
+    ({}, ('price', False)),
+    ({}, ('price', True)),
+    ({}, ('age', False)),
+    ({'species_id': 1}, ('price', True)),
+    ({'species_id': 1, 'min_age': 2, 'max_age': 4}, ('age', False)),
+    ({'center_id': 1, 'max_price': 50}, ('id', False)),
+    ({'min_price': 10, 'max_price': 50}, ('price', False)),
+])
+def test_filtered_sorted_pages(db_app, animal_dao, animal_filters, sort):
+    """This test checks that keyset pages of filtered and sorted listing follow each other without
+    gaps and duplicates, also across animals without value of sort column"""
+    add_filtered_animals(db_app)
+    expected = expected_ids(animal_filters, sort)
+    pages, after = [], None
+    while True:
+        page = animal_dao.get_animals(limit=3, after=after, filters=animal_filters, sort=sort)
+        pages.extend(animal['id'] for animal in page)
+        if len(page) < 3:
+            break
+        after = page[-1]['id']
+    assert pages == expected
+    assert [animal['id'] for animal in animal_dao.get_animals(filters=animal_filters, sort=sort)] == expected
+    assert [animal['id'] for animal in animal_dao.iter_animals(animal_filters, sort)] == expected
+
+
+def test_get_centers_keyset_pages(db_app, center_dao):
+    """This test checks pagination and streaming of centers"""
+    add_centers_and_animals(db_app, animals_count=0)
+    assert center_dao.get_centers(limit=1) == [{'id': 1, 'login': 'ann'}]
+    assert center_dao.get_centers(limit=1, after=1) == []
+    assert list(center_dao.iter_centers()) == [{'id': 1, 'login': 'ann'}]
+
+
+def test_animal_writes_bump_versions(db_app, animal_dao):
+    """This test checks that every animal write changes version of animal list,
+    animal itself, its center and old and new species"""
+    add_centers_and_animals(db_app, animals_count=0)
+    db_app.db.engine.execute("INSERT INTO species (name, description, price) VALUES ('dog', 'good dog', 300);")
+    keys = ['animal', ('animal', 1), ('animal_center', 1), ('species', 1)]
+    before = versions.current(*keys)[0]
+    dog_before = versions.current(('species', 2))[0]
+    animal_dao.add_animal({'name': 'toto', 'description': 't', 'price': 100, 'species_id': 1, 'age': 3}, 1)
+    after_add = versions.current(*keys)[0]
+    assert versions.current(('species', 2))[0] == dog_before
+    animal_dao.update_animal(dict(animal_dao.get_animal(1), species_id=2))
+    after_update = versions.current(*keys)[0]
+    assert versions.current(('species', 2))[0] != dog_before
+    animal_dao.delete_animal(1)
+    assert len({before, after_add, after_update, versions.current(*keys)[0]}) == 4
+
+
+def test_versions_follow_other_processes_and_databases(db_app, tmp_path):
+    """This test checks that ETag changes after write of other connection (other worker, fill_db.py)
+    and that application with other database doesn't accept ETag of this one"""
+    client = db_app.test_client()
+    etag = client.get('/species').headers['ETag']
+    assert client.get('/species', headers={'If-None-Match': etag}).status_code == 304
+    connection = sqlite3.connect(make_url(db_app.config['SQLALCHEMY_DATABASE_URI']).database)
+    with connection:
+        connection.execute("INSERT INTO species (name, description, price) VALUES ('cat', 'good cat', 160)")
+    connection.close()
+    response = client.get('/species', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.json[0]['species_name'] == 'cat'
+
+    other = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'other.db')})
+    with other.app_context():
+        upgrade()
+        other_etag = other.test_client().get('/species').headers['ETag']
+        assert other.test_client().get('/species', headers={'If-None-Match': etag}).status_code == 200
+    assert other_etag.split('-')[0] != etag.split('-')[0]
+
+
+def test_add_animals(db_app, animal_dao):
+    """This test checks that animals are inserted in batches with their own ids
+    and that animals of unknown species are skipped"""
+    add_centers_and_animals(db_app, animals_count=1)
+    db_app.config['BULK_BATCH_SIZE'] = 2
+    animals = [{'name': 'animal{}'.format(number), 'description': 'd', 'price': 10, 'species_id': 1, 'age': 1}
+               for number in range(5)]
+    animals[2]['species_id'] = 9
+    created = animal_dao.add_animals(animals, 1)
+    assert created[2] is None
+    assert [animal['id'] for animal in created if animal] == [2, 3, 4, 5]
+    for data, animal in zip(animals, created):
+        if animal:
+            assert animal_dao.get_animal(animal['id'])['name'] == data['name']
+
+
+def test_write_behind_access_requests(db_app):
+    """This test checks that buffered access requests are written with one insert
+    once there are enough of them and that requests over limit are dropped"""
+    add_centers_and_animals(db_app, animals_count=0)
+    inner = dao_sql.AccessRequestDaoSql()
+    buffered = write_behind.WriteBehindAccessRequestDAO(inner, flush_records=2, flush_interval=60, max_buffer=3)
+    buffered._app = db_app
+    for _ in range(4):
+        buffered.create_access_request(1)
+    assert buffered.stats()['dropped'] == 1
+    assert db_app.db.engine.execute("SELECT count(*) FROM access_request;").scalar() == 0
+    buffered.flush()
+    assert db_app.db.engine.execute("SELECT count(*) FROM access_request;").scalar() == 3
+    assert buffered.stats()['flushed'] == 3
+
+
+def test_write_behind_background_flush(db_app):
+    """This test checks that background thread flushes buffer without explicit call"""
+    add_centers_and_animals(db_app, animals_count=0)
+    buffered = write_behind.WriteBehindAccessRequestDAO(dao_orm_models.AccessRequestORM(), flush_interval=0.01)
+    buffered.init_app(db_app)
+    buffered.create_access_request(1)
+    for _ in range(200):
+        if buffered.stats()['flushed']:
+            break
+        time.sleep(0.01)
+    assert db_app.db.engine.execute("SELECT count(*) FROM access_request;").scalar() == 1
+
+
+def test_write_behind_keeps_timestamps_of_orm(db_app, monkeypatch):
+    """This test checks that write-behind records get the same kind of timestamp
+    (utc of AccessRequest model) as records written directly by ORM dao, local time differs from utc"""
+    add_centers_and_animals(db_app, animals_count=0)
+    inner = dao_orm_models.AccessRequestORM()
+    buffered = write_behind.WriteBehindAccessRequestDAO(inner, flush_interval=60)
+    buffered._app = db_app
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    try:
+        inner.create_access_request(1)
+        buffered.create_access_request(1)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    buffered.flush()
+    direct, behind = [row.timestamp for row in AccessRequest.query.order_by(AccessRequest.id)]
+    assert abs(behind - direct) < timedelta(minutes=1)
+    assert abs(direct - datetime.utcnow()) < timedelta(minutes=1)
+
+
+def test_write_behind_shares_one_thread(db_app):
+    """This test checks that buffers of all applications are flushed by one thread
+    and that buffer of application that is gone is no longer flushed"""
+    buffers = [write_behind.WriteBehindAccessRequestDAO(dao_orm_models.AccessRequestORM()) for _ in range(3)]
+    for buffer in buffers:
+        buffer.init_app(db_app)
+    assert [thread.name for thread in threading.enumerate()].count('access-request-flush') == 1
+    assert all(buffer in write_behind._buffers for buffer in buffers)
+    count = len(write_behind._buffers)
+    del buffers, buffer
+    gc.collect()
+    assert len(write_behind._buffers) == count - 3
+
+
+def test_sql_update_animal_rejects_unknown_columns(db_app):
+    """This test checks that column names from request never get into sql"""
+    add_centers_and_animals(db_app, animals_count=1)
+    with pytest.raises(ValueError):
+        dao_sql.AnimalsDaoSql().update_animal({'id': 1, 'name = name; --': 'x'})
+    assert dao_sql.AnimalsDaoSql().get_animal(1)['name'] == 'animal0'
+
+
+def test_sql_inserts_return_own_ids(db_app):
+    """This test checks that inserted rows are returned by their own ids"""
+    add_centers_and_animals(db_app, animals_count=1)
+    species = dao_sql.SpeciesDaoSql().add_species({'name': 'dog', 'description': 'good dog', 'price': 300})
+    assert species == {'id': 2, 'name': 'dog', 'description': 'good dog', 'price': 300}
+    animal = dao_sql.AnimalsDaoSql().add_animal(
+        {'name': 'toto', 'description': 't', 'price': 100, 'species_id': 2, 'age': 3}, 1)
+    assert animal == {'id': 2, 'name': 'toto'}
+    assert dao_sql.SpeciesDaoSql().get_species_by_name('dog') == species
+
+
+def test_orm_reads_use_projections(db_app):
+    """This test checks that ORM listings return plain rows instead of tracked objects
+    and that animals of center are loaded with one query"""
+    add_centers_and_animals(db_app, animals_count=3)
+    db_app.db.session.expunge_all()
+    statements = []
+    event.listen(db_app.db.get_read_engine(), 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    dao_orm_models.AnimalORM().get_animals()
+    dao_orm_models.AnimalCenterORM().get_centers()
+    assert len(db_app.db.read_session.identity_map) == 0
+    assert 'description' not in statements[0]
+
+    statements.clear()
+    center, animals = dao_orm_models.AnimalCenterORM().get_center_inform(1)
+    assert len(animals) == 3
+    assert len(statements) == 2
+
+
+@pytest.mark.parametrize('dao_type', ['sql', 'orm'])
+def test_species_stats_follow_animal_writes(db_app, dao_type):
+    """This test checks that species stats kept by write methods are the same as
+    stats counted from scratch"""
+    if dao_type == 'sql':
+        animal_dao, species_dao = dao_sql.AnimalsDaoSql(), dao_sql.SpeciesDaoSql()
+    else:
+        animal_dao, species_dao = dao_orm_models.AnimalORM(), dao_orm_models.SpeciesORM()
+    add_centers_and_animals(db_app, animals_count=0)
+    species_stats.rebuild(db_app.db.engine)
+    species_dao.add_species({'name': 'dog', 'description': 'good dog', 'price': 300})
+    animal = {'description': 'd', 'age': 1, 'species_id': 1}
+    animal_dao.add_animal(dict(animal, name='a', price=10), 1)
+    animal_dao.add_animal(dict(animal, name='b', price=30), 1)
+    animal_dao.add_animals([dict(animal, name='c', price=20), dict(animal, name='d', price=50, species_id=2)], 1)
+    animal_dao.update_animal(dict(animal_dao.get_animal(1), species_id=2))
+    animal_dao.update_animal(dict(animal_dao.get_animal(3), price=5))
+    animal_dao.delete_animal(2)
+
+    kept = species_dao.get_species()
+    assert {row['species_name']: (row['count_of_animals'], row['min_price'], row['max_price'], row['avg_price'])
+            for row in kept} == {'cat': (1, 5, 5, 5), 'dog': (2, 10, 50, 30)}
+    species_stats.rebuild(db_app.db.engine)
+    assert species_dao.get_species() == kept
+
+
+def test_writes_of_missing_animal_change_nothing(db_app, animal_dao, mocker):
+    """This test checks that delete and update of animal that is not there (e.g. deleted by other
+    request after view read it) publish no events and don't change stats or versions"""
+    add_centers_and_animals(db_app, animals_count=1)
+    species_stats.rebuild(db_app.db.engine)
+    feed = mocker.patch.object(changes, 'feed', changes.ChangeFeed())
+    stats = "SELECT * FROM species_stats ORDER BY species_id;"
+    kept, version = db_app.db.engine.execute(stats).fetchall(), versions.current('animal')
+    animal_dao.delete_animal(99)
+    animal_dao.update_animal({'id': 99, 'species_id': 2, 'price': 1})
+    assert feed.after(0) == []
+    assert db_app.db.engine.execute(stats).fetchall() == kept
+    assert versions.current('animal') == version
+
+
+@pytest.fixture(params=['sql', 'orm'])
+def search_dao(request):
+    return dao_sql.SearchDaoSql() if request.param == 'sql' else dao_orm_models.SearchORM()
+
+
+def test_search_pages(db_app, search_dao):
+    """This test checks that search finds words of animals and species, ranks better matches first,
+    highlights found words and gives pages without gaps and duplicates"""
+    add_centers_and_animals(db_app, animals_count=0)
+    for name, description in [('tiger', 'big striped cat'), ('tom', 'grey cat, cat with long tail'),
+                              ('rex', 'dog that hunts cats'), ('kit', 'small cat')]:
+        db_app.db.engine.execute("INSERT INTO animal (center_id, name, description, age, species_id, price) "
+                                 "VALUES (1, :name, :description, 2, 1, 100);", name=name, description=description)
+    found = search_dao.search('cats')
+    # ranks of animals and species come from different tables, so only order inside kind is known
+    assert [entity['id'] for entity in found if entity['kind'] == 'animal'] == [2, 4, 1, 3]
+    assert [entity['id'] for entity in found if entity['kind'] == 'species'] == [1]
+    assert {'kind': 'animal', 'id': 2, 'name': 'tom',
+            'snippet': 'grey <mark>cat</mark>, <mark>cat</mark> with long tail'} in found
+    assert [entity['name'] for entity in search_dao.search('long CAT!')] == ['tom']
+    assert search_dao.search('horse') == []
+
+    pages = [search_dao.search('cat', limit=2)]
+    while len(pages[-1]) == 2:
+        pages.append(search_dao.search('cat', limit=2, after=pages[-1][-1]['id'], after_kind=pages[-1][-1]['kind']))
+    assert sum(pages, []) == found
+
+
+def test_search_follows_writes(db_app, search_dao):
+    """This test checks that triggers keep search tables in sync with animals"""
+    add_centers_and_animals(db_app, animals_count=2)
+    animal_dao = dao_sql.AnimalsDaoSql()
+    animal_dao.update_animal({'id': 1, 'description': 'fluffy parrot'})
+    animal_dao.delete_animal(2)
+    animal_dao.add_animal({'name': 'polly', 'description': 'talking parrot', 'price': 1, 'species_id': 1,
+                           'age': 1}, 1)
+    assert [entity['name'] for entity in search_dao.search('parrot')] == ['animal0', 'polly']
+    assert search_dao.search('animal1') == []
+
+
+def test_dao_registry(test_app):
+    """This test checks that application uses daos of backend from its config and unknown backend is refused"""
+    sql_app = create_app({'DAO_BACKEND': 'sql'})
+    assert isinstance(sql_app.extensions['dao'].SearchDAO, dao_sql.SearchDaoSql)
+    assert isinstance(test_app.extensions['dao'].SearchDAO, dao_orm_models.SearchORM)
+    with sql_app.app_context():
+        assert dao.SearchDAO.search == sql_app.extensions['dao'].SearchDAO.search
+
+    daos = {name: getattr(sql_app.extensions['dao'], name) for name in dao.DAO_NAMES}
+    daos['SpeciesDAO'] = 'species'
+    dao.register('test', lambda: daos)
+    try:
+        with create_app({'DAO_BACKEND': 'test', 'CACHE_ENABLED': False}).app_context():
+            assert dao.SpeciesDAO.upper() == 'SPECIES'
+    finally:
+        del dao._backends['test']
+    with pytest.raises(ValueError):
+        create_app({'DAO_BACKEND': 'nosql'})
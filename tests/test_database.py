@@ -0,0 +1,48 @@
+"""Tests of sqlite tuning and read-only pool"""
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app.dao import dao_sql, dao_orm_models
+from tests.test_dao import add_centers_and_animals
+
+
+def test_pragmas_are_applied(db_app):
+    """This test checks that every new connection has pragmas from config"""
+    pragmas = db_app.config['SQLITE_PRAGMAS']
+    for engine in (db_app.db.engine, db_app.db.get_read_engine()):
+        assert engine.execute('PRAGMA journal_mode').scalar() == pragmas['journal_mode'].lower()
+        assert engine.execute('PRAGMA busy_timeout').scalar() == int(pragmas['busy_timeout'])
+        assert engine.execute('PRAGMA cache_size').scalar() == int(pragmas['cache_size'])
+
+
+def test_read_engine_is_read_only(db_app):
+    """This test checks that connections of read pool can't change database"""
+    db_app.config['SQLITE_READ_ONLY_POOL'] = True
+    add_centers_and_animals(db_app, animals_count=1)
+    read_engine = db_app.db.get_read_engine()
+    assert read_engine is not db_app.db.engine
+    assert read_engine.execute('SELECT count(*) FROM animal').scalar() == 1
+    with pytest.raises(OperationalError, match='readonly'):
+        read_engine.execute("DELETE FROM animal")
+
+
+@pytest.mark.parametrize('dao_type', ['sql', 'orm'])
+def test_reads_use_read_engine(db_app, dao_type):
+    """This test checks that read-only dao methods run on read pool and writes do not"""
+    db_app.config['SQLITE_READ_ONLY_POOL'] = True
+    add_centers_and_animals(db_app, animals_count=2)
+    animal_dao = dao_sql.AnimalsDaoSql() if dao_type == 'sql' else dao_orm_models.AnimalORM()
+    reads, writes = [], []
+    event.listen(db_app.db.get_read_engine(), 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: reads.append(statement))
+    event.listen(db_app.db.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: writes.append(statement))
+    assert len(animal_dao.get_animals()) == 2
+    assert animal_dao.get_animal(1)['id'] == 1
+    assert reads and not writes
+    reads.clear()
+    animal_dao.update_animal({'id': 1, 'age': 5})
+    assert any(statement.startswith('UPDATE animal') for statement in writes)
+    assert not any(statement.startswith('UPDATE') for statement in reads)
+    assert animal_dao.get_animal(1)['age'] == 5
@@ -0,0 +1,36 @@
+"""Tests of database generator"""
+
+from app.main import create_app
+from fill_db import generate
+
+
+def generated_rows(path, **sizes):
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(path)
+    counts = generate(app, **sizes)
+    with app.app_context():
+        animals = app.db.engine.execute('SELECT center_id, species_id, age, price FROM animal ORDER BY id').fetchall()
+        stats = app.db.engine.execute('SELECT species_id, count_of_animals FROM species_stats '
+                                      'ORDER BY species_id').fetchall()
+        requests = app.db.engine.execute('SELECT count(*) FROM access_request').scalar()
+        journal_mode = app.db.engine.execute('PRAGMA journal_mode').scalar()
+        app.db.session.remove()
+    return counts, animals, stats, requests, journal_mode
+
+
+def configured_journal_mode():
+    return create_app().config['SQLITE_PRAGMAS'].get('journal_mode', 'delete').lower()
+
+
+def test_generate_is_reproducible(tmp_path):
+    """This test checks that the same seed gives the same rows, species are skewed and stats are rebuilt"""
+    sizes = dict(seed=3, centers=5, species=4, animals_per_center=50, access_requests_per_center=2, skew=1.5)
+    first = generated_rows(tmp_path / 'first.db', **sizes)
+    second = generated_rows(tmp_path / 'second.db', **sizes)
+    assert first[:4] == second[:4]
+    counts, animals, stats, requests, journal_mode = first
+    assert counts == {'centers': 5, 'species': 4, 'animals': 250, 'access_requests': 10}
+    assert len(animals) == 250 and requests == 10
+    assert stats[0][1] > stats[-1][1]
+    assert sum(count for _, count in stats) == 250
+    assert journal_mode == configured_journal_mode()
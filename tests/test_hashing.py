@@ -0,0 +1,43 @@
+"""Tests of password hashing service"""
+
+import pytest
+from threading import Event
+from app.utils.hashing import PasswordHasher, HashingUnavailable
+
+
+def test_thread_pool_hashing():
+    """This test checks that hash made in pool can be checked"""
+    hasher = PasswordHasher('thread', workers=2)
+    pwhash = hasher.generate_password_hash('secret')
+    assert hasher.check_password_hash(pwhash, 'secret')
+    assert not hasher.check_password_hash(pwhash, 'wrong')
+
+
+def test_full_queue_rejects_hashing():
+    """This test checks that hashing is rejected instead of waiting when queue is full"""
+    hasher = PasswordHasher('thread', workers=1, max_pending=1)
+    release = Event()
+    busy = hasher._submit(release.wait)
+    with pytest.raises(HashingUnavailable):
+        hasher.generate_password_hash('secret')
+    release.set()
+    busy.result()
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.check_password_hash(hasher.generate_password_hash('secret'), 'secret')
+
+
+def test_no_limit_of_pending_hashing():
+    """This test checks that max_pending 0 means that hashing is never rejected"""
+    hasher = PasswordHasher('thread', workers=2, max_pending=0)
+    hashes = [hasher.generate_password_hash('secret{}'.format(number)) for number in range(3)]
+    assert all(hasher.check_password_hash(pwhash, 'secret{}'.format(number)) for number, pwhash in enumerate(hashes))
+    assert hasher.stats()['rejected'] == 0
+
+
+def test_login_busy_hashing(client, mocker):
+    """This test checks that login returns 503 with Retry-After when password can't be checked now"""
+    mocker.patch("app.dao.dao.AnimalCenterDAO.get_center_by_login").return_value = {'id': 2}
+    mocker.patch("app.dao.dao.AnimalCenterDAO.check_password").side_effect = HashingUnavailable('busy')
+    response = client.get('/login?login=anna&password=abc')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
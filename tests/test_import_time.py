@@ -0,0 +1,39 @@
+"""Tests of import time of application, which every worker process pays on start"""
+
+import subprocess
+import sys
+import pytest
+from app.config import basepath
+
+# microseconds of importing app.main with everything it imports, generous limit that catches heavy
+# dependencies added to start of worker
+IMPORT_BUDGET_US = 3000000
+
+
+def import_times(backend):
+    """
+    Function that builds application with dao backend in new interpreter with -X importtime.
+    :return: Dictionary of imported module and its cumulative import time in microseconds and set of
+             all modules imported by then (importlib.import_module is not reported by -X importtime).
+    """
+    code = ('import sys; from app.main import create_app; create_app({{"DAO_BACKEND": "{}"}}); '
+            'print("\\n".join(sys.modules))').format(backend)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=basepath,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            _, cumulative, module = line[len('import time:'):].split('|')
+            times[module.strip()] = int(cumulative)
+    return times, set(result.stdout.split())
+
+
+@pytest.mark.parametrize('backend, used, unused', [
+    ('sql', 'app.dao.dao_sql', ['app.dao.dao_orm_models', 'app.models.models']),
+    ('orm', 'app.dao.dao_orm_models', ['app.dao.dao_sql'])])
+def test_only_chosen_backend_is_imported(backend, used, unused):
+    """This test checks that application imports only modules of its dao backend and starts in time budget"""
+    times, modules = import_times(backend)
+    assert used in modules
+    assert not set(unused) & modules
+    assert times['app.main'] < IMPORT_BUDGET_US
@@ -0,0 +1,113 @@
+"""Tests that dao lookups are served by indexes"""
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+from app.dao import dao_sql, dao_orm_models
+from app.main import create_app
+from tests.test_dao import add_centers_and_animals
+
+DAO_CLASSES = {
+    'sql': (dao_sql.AnimalCentersDaoSql, dao_sql.SpeciesDaoSql, dao_sql.AnimalsDaoSql),
+    'orm': (dao_orm_models.AnimalCenterORM, dao_orm_models.SpeciesORM, dao_orm_models.AnimalORM),
+}
+
+LOOKUPS = [
+    ('center', 'get_center_by_login', ('ann',)),
+    ('center', 'check_password', ('a', 1)),
+    ('center', 'get_center_inform', (1,)),
+    ('species', 'get_species', ()),
+    ('species', 'get_species_inform', (1,)),
+    ('species', 'get_species_by_name', ('cat',)),
+    ('animal', 'get_animal', (1,)),
+]
+
+
+@pytest.fixture
+def selects(db_app):
+    """This fixture collects select statements with their parameters"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    engines = {db_app.db.engine, db_app.db.get_read_engine()}
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def query_plan(db_app, statement, parameters):
+    connection = db_app.db.engine.raw_connection()
+    try:
+        return [row[3] for row in connection.cursor().execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('dao_type', ['sql', 'orm'])
+@pytest.mark.parametrize('kind, method, args', LOOKUPS)
+def test_lookup_uses_index(db_app, selects, mocker, dao_type, kind, method, args):
+    """This test checks that no table is scanned without index by dao lookup"""
+    add_centers_and_animals(db_app, animals_count=1)
+    mocker.patch('app.dao.dao_sql.check_password_hash')
+    mocker.patch('app.dao.dao_orm_models.check_password_hash')
+    db_app.db.session.expire_all()
+    center_dao, species_dao, animal_dao = (dao_class() for dao_class in DAO_CLASSES[dao_type])
+    dao = {'center': center_dao, 'species': species_dao, 'animal': animal_dao}[kind]
+    selects.clear()
+    getattr(dao, method)(*args)
+    assert selects
+    for statement, parameters in selects:
+        for detail in query_plan(db_app, statement, parameters):
+            if method == 'get_species' and detail.startswith('SCAN species'):
+                continue  # list of all species reads whole species table
+            assert not detail.startswith('SCAN') or 'INDEX' in detail, (statement, detail)
+
+
+LISTINGS = [
+    ({}, ('price', True)),
+    ({}, ('age', False)),
+    ({'species_id': 1}, ('price', False)),
+    ({'species_id': 1, 'min_price': 10, 'max_price': 60}, ('price', True)),
+    ({'species_id': 1, 'min_age': 2}, ('age', False)),
+    ({'center_id': 1}, ('price', True)),
+    ({'min_price': 10}, ('id', False)),
+]
+
+
+@pytest.mark.parametrize('dao_type', ['sql', 'orm'])
+@pytest.mark.parametrize('animal_filters, sort', LISTINGS)
+def test_filtered_listing_uses_index(db_app, selects, dao_type, animal_filters, sort):
+    """This test checks that common filters and sort orders of animals are ranges of index,
+    so neither table is scanned nor rows are sorted for a page"""
+    add_centers_and_animals(db_app, animals_count=5)
+    animal_dao = DAO_CLASSES[dao_type][2]()
+    selects.clear()
+    animal_dao.get_animals(limit=2, after=2, filters=animal_filters, sort=sort)
+    assert selects
+    for statement, parameters in selects:
+        for detail in query_plan(db_app, statement, parameters):
+            assert not detail.startswith('SCAN') or 'INDEX' in detail, (statement, detail)
+            assert 'TEMP B-TREE' not in detail, (statement, detail)
+
+
+def test_unique_indexes_wait_for_duplicates(tmp_path, capfd):
+    """This test checks that upgrade of database with duplicate logins or species names stops with list
+    of them and changes nothing, and that it passes once they are renamed"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db')})
+    with app.app_context():
+        upgrade(revision='0001')
+        for _ in range(2):
+            add_centers_and_animals(app, animals_count=0)
+        with pytest.raises(SystemExit):
+            upgrade()
+        assert "animal_center.login: 'ann'; species.name: 'cat'" in capfd.readouterr().err
+        assert app.db.engine.execute('SELECT version_num FROM alembic_version').scalar() == '0001'
+
+        app.db.engine.execute("UPDATE animal_center SET login = 'bob' WHERE id = 2")
+        app.db.engine.execute("UPDATE species SET name = 'dog' WHERE id = 2")
+        upgrade()
+        assert 'ix_species_name' in [row[1] for row in app.db.engine.execute("PRAGMA index_list('species')")]
@@ -0,0 +1,56 @@
+"""Tests of json encoders"""
+
+import pytest
+from datetime import datetime
+from flask import json
+from flask.json import JSONEncoder
+from app.dao import dao_sql, dao_orm_models
+from app.utils import json_provider
+from tests.test_dao import add_centers_and_animals
+
+VALUES = [
+    {'id': 1, 'name': 'toto', 'price': 100.0, 'description': None, 'valid': True},
+    {'b': 1e16, 'a': 1.5e-05, 'c': -0.0001, 'd': 2 ** 70, 'e': 'café "quoted" \\ \n☃\x7f\x01😺'},
+    [{'species_name': 'cat', 'avg_price': 77.5, 'min_price': None}, datetime(2020, 3, 1, 12)],
+    {2: 'non string keys', 1: {'z': [1, 2.25, 'x'], 'a': {}}},
+    'plain 3e5 string',
+    {'p': float('nan'), 'q': [float('inf'), -float('inf'), None], 'r': None},
+]
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_fast_encoder_gives_the_same_bytes(value):
+    """This test checks that fast encoder gives the same json as stdlib for values that orjson writes
+    differently or can not encode"""
+    options = {'separators': (',', ':'), 'sort_keys': True}
+    assert json.dumps(value, cls=json_provider.FastJSONEncoder, **options) == \
+        json.dumps(value, cls=JSONEncoder, **options)
+
+
+def test_encoder_by_name():
+    """This test checks that encoders are chosen by name from config"""
+    assert json_provider.encoder('stdlib') is JSONEncoder
+    assert json_provider.encoder('fast') is json_provider.FastJSONEncoder
+    with pytest.raises(ValueError):
+        json_provider.encoder('simplejson')
+
+
+def test_row_encoder_is_the_same_as_dumps():
+    """This test checks that row encoder sorts keys and escapes values like dumps of dictionary"""
+    keys = ('name', 'id', 'price', 'sold', 'note', '100%')
+    encoder = json_provider.RowEncoder(keys)
+    for row in [('toto', 1, 10.5, False, None, 'a'), ('søren "x"', 2 ** 40, float('inf'), True, 1e-7, '%s')]:
+        assert encoder.encode(row) == json_provider.dumps(dict(zip(keys, row)))
+
+
+def test_streamed_listings_are_the_same_for_both_daos(db_app):
+    """This test checks that rows encoded by sql dao give the same stream as records of orm dao"""
+    add_centers_and_animals(db_app, animals_count=7)
+    db_app.config['STREAM_BATCH'] = 3
+    assert list(dao_sql.AnimalsDaoSql().iter_animals_json()) == \
+        list(dao_orm_models.AnimalORM().iter_animals_json())
+    assert list(dao_sql.AnimalCentersDaoSql().iter_centers_json()) == \
+        list(dao_orm_models.AnimalCenterORM().iter_centers_json())
+    response = db_app.test_client().get('/animals?stream=true')
+    assert response.get_data(as_text=True) == json.dumps(response.json, separators=(',', ':')) + '\n'
+    assert [animal['name'] for animal in response.json] == ['animal{}'.format(number) for number in range(7)]
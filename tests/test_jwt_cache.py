@@ -0,0 +1,88 @@
+"""Tests of cache of verified JWT tokens"""
+
+import pytest
+from datetime import timedelta
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from app.utils import jwt_cache
+
+
+@pytest.fixture
+def cache(mocker):
+    cache = jwt_cache.VerifiedTokenCache(max_entries=2)
+    mocker.patch.object(jwt_cache, 'cache', cache)
+    return cache
+
+
+def put_with_token(client, token):
+    # body is not valid, so request stops right after token is verified
+    return client.put('/animals/1', json={'unknown': 1}, headers={'Authorization': 'Bearer ' + token})
+
+
+def test_signature_is_verified_once(test_app, client, cache, mocker):
+    """This test checks that the same token is decoded only on the first request"""
+    decode = mocker.spy(jwt_cache, 'verify_jwt_in_request')
+    with test_app.app_context():
+        token = create_access_token(identity=1)
+    for _ in range(3):
+        assert put_with_token(client, token).status_code == 400
+    assert decode.call_count == 1
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'invalidations': 0, 'size': 1, 'hit_rate': 2 / 3}
+    assert put_with_token(client, token + 'x').status_code == 422
+    assert cache.stats()['size'] == 1
+
+
+def test_expired_and_old_secret_tokens_are_verified_again(test_app, client, cache, mocker):
+    """This test checks that token is not taken from cache after it expired or after secret changed"""
+    with test_app.app_context():
+        token = create_access_token(identity=1)
+        expiring = create_access_token(identity=1, expires_delta=timedelta(seconds=10))
+    assert put_with_token(client, token).status_code == 400
+    assert put_with_token(client, expiring).status_code == 400
+    decode = mocker.spy(jwt_cache, 'verify_jwt_in_request')
+    # token expires for cache, pyjwt still accepts it, so only count of verifications shows that
+    mocker.patch.object(jwt_cache, 'time', return_value=jwt_cache.time() + 20)
+    assert put_with_token(client, expiring).status_code == 400
+    assert put_with_token(client, token).status_code == 400
+    assert decode.call_count == 1
+
+    test_app.config['JWT_SECRET_KEY'] = 'new secret'
+    assert put_with_token(client, token).status_code == 422
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_refresh_and_revoked_tokens_are_refused(test_app, client, cache, mocker):
+    """This test checks that refresh token is refused by write route and that revoked token
+    is refused although they are in cache"""
+    with test_app.app_context():
+        refresh = create_refresh_token(identity=1)
+        token = create_access_token(identity=1)
+        # get binds cache to signer of application, so set keeps token
+        cache.get('Bearer ' + refresh, jwt_cache.signer())
+        cache.set('Bearer ' + refresh, jwt_cache.signer(), decode_token(refresh))
+        jti = decode_token(token)['jti']
+    for _ in range(2):
+        response = put_with_token(client, refresh)
+        assert (response.status_code, response.json['msg']) == (422, 'Only access tokens are allowed')
+    assert put_with_token(client, token).status_code == 400
+
+    revoked = set()
+    mocker.patch.dict(test_app.config, {'JWT_BLACKLIST_ENABLED': True, 'JWT_BLACKLIST_TOKEN_CHECKS': ['access']})
+    mocker.patch.object(test_app.extensions['flask-jwt-extended'], '_token_in_blacklist_callback',
+                        lambda decoded: decoded['jti'] in revoked)
+    assert put_with_token(client, token).status_code == 400
+    revoked.add(jti)
+    response = put_with_token(client, token)
+    assert (response.status_code, response.json['msg']) == (401, 'Token has been revoked')
+    assert cache.stats()['hits'] == 4
+
+
+def test_cache_is_bounded(cache):
+    """This test checks that the least recently used token is dropped when cache is full"""
+    signer = ('secret', 'HS256')
+    for number in range(3):
+        assert cache.get(str(number), signer) is None
+        cache.set(str(number), signer, {'identity': number})
+    assert cache.get('0', signer) is None
+    assert cache.get('2', signer) == ({'identity': 2}, None)
+    cache.set('1', ('other', 'HS256'), {'identity': 1})
+    assert cache.stats()['size'] == 2
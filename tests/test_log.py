@@ -0,0 +1,53 @@
+"""Tests of queue based audit logging"""
+
+import logging
+import queue
+from time import time
+from app.utils import log_handlers
+
+
+def test_records_written_in_same_format(tmp_path):
+    """This test checks that records go through queue to file in usual format
+    and that everything is flushed on stop"""
+    log_file = tmp_path / 'app.log'
+    file_handler = log_handlers.BatchFileHandler(str(log_file))
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    log_queue = queue.Queue(100)
+    listener = log_handlers.BatchQueueListener(log_queue, file_handler, batch_size=10)
+    logger = logging.getLogger('test_queue_log')
+    logger.addHandler(log_handlers.BoundedQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    listener.start()
+    for number in range(25):
+        logger.info('method %s - entity_id %s', 'POST', number)
+    listener.stop()
+    lines = log_file.read_text().splitlines()
+    assert len(lines) == 25
+    assert lines[-1].endswith(' method POST - entity_id 24')
+
+
+def test_full_queue_drops_records():
+    """This test checks that records are dropped and counted when queue is full
+    and overflow policy is drop"""
+    handler = log_handlers.BoundedQueueHandler(queue.Queue(1), block=False)
+    logger = logging.getLogger('test_queue_drop')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.info('first')
+    logger.info('second')
+    logger.info('third')
+    assert handler.dropped == 2
+
+
+def test_full_queue_blocks_at_most_timeout():
+    """This test checks that with overflow policy block request waits at most timeout
+    when nobody takes records from queue, then record is dropped and counted"""
+    handler = log_handlers.BoundedQueueHandler(queue.Queue(1), block=True, timeout=0.05)
+    logger = logging.getLogger('test_queue_block')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.info('first')
+    started = time()
+    logger.info('second')
+    assert 0.05 <= time() - started < 1
+    assert handler.dropped == 1
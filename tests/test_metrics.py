@@ -0,0 +1,61 @@
+"""Tests of request metrics"""
+
+import pytest
+import re
+from flask_migrate import upgrade
+from sqlalchemy.exc import OperationalError
+from app.main import create_app
+from app.utils import metrics
+
+
+@pytest.fixture
+def metrics_app(tmp_path):
+    """This fixture creates application with metrics on (they are off by default)"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'METRICS_ENABLED': True})
+    with app.app_context():
+        upgrade()
+        yield app
+        app.db.session.remove()
+
+
+def test_histogram_is_cumulative():
+    """This test checks that every bucket counts values not bigger than its bound"""
+    histogram = metrics.Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert histogram.samples() == [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.sum == 3.65
+
+
+def test_metrics_count_requests_and_sql(metrics_app):
+    """This test checks that /metrics shows status and sql statements of previous requests"""
+    client = metrics_app.test_client()
+    assert client.get('/animals?limit=10').status_code == 200
+    assert client.get('/animals/100').status_code == 404
+    text = client.get('/metrics').get_data(as_text=True)
+    assert re.search(r'^http_requests_total\{endpoint="app.animals",method="GET",status="200"\} \d+$', text, re.M)
+    assert re.search(r'^http_requests_total\{endpoint="app.animal_inform",method="GET",status="404"\} \d+$',
+                     text, re.M)
+    statements = re.search(r'^http_request_sql_statements_total\{endpoint="app.animals",method="GET"\} (\d+)$',
+                           text, re.M)
+    assert int(statements.group(1)) >= 1
+    assert 'http_request_duration_seconds_bucket{endpoint="app.animals",method="GET",le="+Inf"}' in text
+    assert re.search(r'^password_hashing_rejected \S+$', text, re.M)
+
+
+def test_server_timing_header(metrics_app):
+    """This test checks that Server-Timing shows db and serialization time when it is switched on"""
+    client = metrics_app.test_client()
+    assert 'Server-Timing' not in client.get('/species').headers
+    metrics_app.config['METRICS_SERVER_TIMING'] = True
+    header = client.get('/animals?limit=7').headers['Server-Timing']
+    assert re.match(r'db;dur=[\d.]+;desc="[1-9]\d* statements", serialize;dur=[\d.]+, total;dur=[\d.]+$', header)
+
+
+def test_failed_statement_leaves_no_start(metrics_app):
+    """This test checks that statement that fails keeps nothing in connection and next statements are timed"""
+    with metrics_app.db.engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute('SELECT * FROM missing_table')
+        assert connection.execute('SELECT 1').scalar() == 1
+        assert not connection.info.get('metrics_start') and 'metrics' not in connection.info
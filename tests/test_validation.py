@@ -0,0 +1,53 @@
+"""Tests of json schema validators"""
+
+import pytest
+from jsonschema import ValidationError, validate
+from app.utils import schemas, validation
+
+BODIES = [
+    {'name': 'toto', 'description': 'cat', 'age': 2, 'species_id': 1, 'price': 10.5},
+    {'name': 'toto', 'description': 'cat', 'age': 2.0, 'species_id': 1, 'price': 10},
+    {'name': 'toto', 'description': 'cat', 'age': True, 'species_id': 1, 'price': 10},
+    {'name': 'toto', 'description': 'cat', 'age': 2, 'species_id': '1', 'price': 10},
+    {'name': 'toto', 'age': 2, 'species_id': 1, 'price': 10},
+    {'description': 'cat', 'age': 'x', 'species_id': 1, 'price': 10},
+    ['toto'],
+]
+
+
+@pytest.mark.parametrize('name', validation.VALIDATORS)
+def test_validators_give_the_same_errors(name):
+    """This test checks that compiled validators find the same errors as jsonschema.validate"""
+    validator = validation.compiled(schemas.animal_schema, name)
+    for body in BODIES:
+        try:
+            validate(body, schemas.animal_schema)
+        except ValidationError as error:
+            assert validator.first_error(body).message == error.message
+        else:
+            assert validator.first_error(body) is None
+
+
+@pytest.mark.parametrize('name', validation.VALIDATORS)
+def test_most_relevant_error_is_reported(name):
+    """This test checks that missing property is reported before wrong type of nested one"""
+    error = validation.compiled(schemas.animal_schema, name).first_error({'age': 'x'})
+    assert error.message == "'name' is a required property"
+
+
+def test_validators_are_compiled_once():
+    """This test checks that every schema and validator get one compiled validator"""
+    validator = validation.compiled(schemas.species_schema)
+    assert validation.compiled(dict(schemas.species_schema)) is validator
+    assert validation.compiled(schemas.species_schema, 'fast') is not validator
+    with pytest.raises(ValueError):
+        validation.compiled(schemas.species_schema, 'ajv')
+
+
+def test_invalid_body_is_rejected(client):
+    """This test checks that decorator rejects body that is not json or does not match schema"""
+    response = client.post('/register', data='login', content_type='application/json')
+    assert response.status_code == 400
+    response = client.post('/register', json={'login': 'ann', 'password': 'a'})
+    assert response.status_code == 400
+    assert "'address' is a required property" in response.get_data(as_text=True)
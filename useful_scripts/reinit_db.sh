@@ -1,10 +1,8 @@
 #!/bin/bash
 
-# This script performs db clean and then initializes it and fills with predifined values
-rm -r migrations
+# This script performs db clean and then initializes it with migrations and fills with generated values,
+# arguments are passed to fill_db.py, e.g. ./useful_scripts/reinit_db.sh --centers 10000 --animals-per-center 100
 rm app.db
 export FLASK_APP=wsgi.py
-flask db init
-flask db migrate
 flask db upgrade
-python fill_db.py
\ No newline at end of file
+python fill_db.py "$@"
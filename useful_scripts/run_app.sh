@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# This script runs application in mode that is set in section [server] of config.ini:
+# wsgi - flask development server, asgi - uvicorn with async dao
+mode=$(python -c "from app.config import Config; print(Config.SERVER_MODE)")
+if [ "$mode" = "asgi" ]; then
+    uvicorn asgi:app
+else
+    export FLASK_APP=wsgi.py
+    flask run
+fi